@@ -4,53 +4,157 @@ FastAPI backend that wraps the existing RAG functionality
 Optimized for Vercel serverless deployment
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+import asyncio
+import functools
 import os
 import sys
 import json
 
+from rag_history import HistoryStore, DEFAULT_CONVERSATION
+
 # Import existing RAG functions
 try:
     from chroma_test import (
         retrieve_and_filter,
+        retrieve_batch_from_embeddings,
+        embed_for_retrieval,
+        normalize_filters,
         call_gemini_chat,
+        call_gemini_chat_async,
+        stream_gemini_chat_async,
         build_strict_rag_prompt,
-        load_history,
-        save_history,
-        add_to_history,
         generate_pdf_from_history,
         extract_case_metadata,
+        case_metadata_for,
+        resources,
+        start_background_init,
+        get_runtime_stats,
+        lookup_cached_answer,
+        store_cached_answer,
+        refresh_local_index,
+        RETRIEVAL_RESOURCE,
         GEMINI_MODEL,
         TOP_K,
         RETURN_TOP
     )
+    from rag_resources import ResourceUnavailable
 except ImportError as e:
     print(f"Warning: Could not import chroma_test: {e}")
     # Fallback values for serverless environment
     GEMINI_MODEL = "models/gemini-2.5-flash"
     TOP_K = 10
     RETURN_TOP = 5
+    RETRIEVAL_RESOURCE = "collection"
+    resources = None
     
     # Dummy functions to prevent NameError
     def retrieve_and_filter(*args, **kwargs): return []
+    def retrieve_batch_from_embeddings(queries, *args, **kwargs): return [[] for _ in queries]
+    def embed_for_retrieval(queries): return [None] * len(queries), [None] * len(queries)
+    def normalize_filters(filters): return filters or {}
     def call_gemini_chat(prompt, *args, **kwargs): return "RAG is unavailable (Serverless Mode). Please configure a cloud database."
+    async def call_gemini_chat_async(prompt, *args, **kwargs): return call_gemini_chat(prompt)
+    async def stream_gemini_chat_async(prompt, *args, **kwargs): yield call_gemini_chat(prompt)
     def build_strict_rag_prompt(*args, **kwargs): return ""
-    def load_history(): return []
-    def save_history(*args, **kwargs): pass
-    def add_to_history(*args, **kwargs): pass
     def generate_pdf_from_history(*args, **kwargs): return None
     def extract_case_metadata(*args, **kwargs): return {}
+    def case_metadata_for(*args, **kwargs): return {}
+    def start_background_init(): pass
+    def get_runtime_stats(): return {}
+    def lookup_cached_answer(*args, **kwargs): return None
+    def store_cached_answer(*args, **kwargs): pass
+    def refresh_local_index(): return {}
+
+# Conversation-keyed chat history (SQLite, WAL mode)
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "chat_history.db")
+LEGACY_HISTORY_FILE = "chat_history.json"
+history_store = HistoryStore(HISTORY_DB_PATH)
+
+# How long a request waits for a resource that is still loading (seconds)
+RESOURCE_WAIT_TIMEOUT = float(os.getenv("RESOURCE_WAIT_TIMEOUT", "120"))
+
+# Concurrency limits for the blocking parts of the chat pipeline
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "2"))        # CPU-bound query embedding
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "16"))  # Chroma queries + history I/O
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))      # in-flight Gemini calls
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "200"))  # per /api/chat/batch request
+
+encode_pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+async def run_blocking(pool: ThreadPoolExecutor, fn, *args, **kwargs):
+    """Run a blocking function on one of the bounded pools without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+async def retrieve_async(query: str, top_k: int = TOP_K, return_top: int = RETURN_TOP,
+                         filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Look up references and embed on the encode pool, then query Chroma and
+    rerank on the retrieval pool. Pasted citations answered by the reference
+    index skip the embedding step.
+    """
+    q_embs, references = await run_blocking(encode_pool, embed_for_retrieval, [query])
+    results = await run_blocking(retrieval_pool, retrieve_batch_from_embeddings, [query], q_embs,
+                                 top_k=top_k, return_top=return_top, filters=filters, references=references)
+    return results[0]
+
+async def generate_answer_async(prompt: str, max_tokens: int = 2000) -> str:
+    """Call Gemini through the async client, bounded by LLM_CONCURRENCY."""
+    async with llm_semaphore:
+        return await call_gemini_chat_async(prompt, model=GEMINI_MODEL, temperature=0.0, max_tokens=max_tokens,
+                                            executor=retrieval_pool)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start loading the embedding model, Chroma and Gemini without blocking startup."""
+    start_background_init()
+    await run_blocking(retrieval_pool, history_store.migrate_from_json, LEGACY_HISTORY_FILE, DEFAULT_CONVERSATION)
+    yield
+
+async def require_resources(*names: str):
+    """Wait for the named resources; respond 503 if they are unavailable."""
+    if resources is None:
+        return
+    for name in names:
+        try:
+            await resources.wait(name, timeout=RESOURCE_WAIT_TIMEOUT)
+        except ResourceUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+async def require_filters(request) -> Optional[Dict[str, Any]]:
+    """
+    Facet filters of a request as a plain dict (None if there are none).
+    400 if they are invalid or facets are disabled; waits for the facet store.
+    """
+    if request.filters is None:
+        return None
+    try:
+        filters = normalize_filters(request.filters.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not filters:
+        return None
+    if resources is None or "facet_store" not in resources.names():
+        raise HTTPException(status_code=400, detail="Facet filters are not enabled on this server (RAG_FACETS=1)")
+    await require_resources("facet_store")
+    return filters
 
 # Create FastAPI app
 app = FastAPI(
     title="Pakistani Legal RAG Assistant API",
     description="REST API for Pakistani legal document analysis and generation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS for Flutter app
@@ -62,10 +166,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Answer returned when retrieval finds nothing usable
+NO_EVIDENCE_ANSWER = (
+    "I apologize, but I couldn't find specific legal documents matching your query in the database. "
+    "This could mean:\n\n"
+    "1. The query might need to be rephrased\n"
+    "2. The specific legal topic might not be in the current database\n"
+    "3. Try using different keywords or asking about general Pakistani legal topics\n\n"
+    "You can try asking about:\n"
+    "- Contract law and breach of contract\n"
+    "- Property and land transfer procedures\n"
+    "- Employment law and labor rights\n"
+    "- Legal notices and documentation\n"
+    "- Court procedures and judgments"
+)
+
+def evidence_summary(evidences: List[Dict[str, Any]], include_case_metadata: bool = False) -> List[Dict[str, Any]]:
+    """Evidence ids/distances for API responses; case metadata comes from the prebuilt index."""
+    out = []
+    for e in evidences:
+        item = {"id": e.get("id"), "parent_id": e.get("parent_id"), "dist": e.get("dist")}
+        if include_case_metadata:
+            item["case_metadata"] = case_metadata_for(e)
+        out.append(item)
+    return out
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 # Request/Response Models
+class FacetFilters(BaseModel):
+    court: Optional[str] = None       # substring, e.g. "lahore high court" or "lahore"
+    judge: Optional[str] = None
+    date_from: Optional[str] = None   # YYYY, YYYY-MM or YYYY-MM-DD (inclusive)
+    date_to: Optional[str] = None
+    citation: Optional[str] = None    # "pld" or "scmr"
+
 class ChatRequest(BaseModel):
     query: str
     conversation_id: Optional[str] = None
+    include_case_metadata: bool = False  # add parties/court/judge/citation per evidence
+    filters: Optional[FacetFilters] = None
 
 class ChatResponse(BaseModel):
     success: bool
@@ -73,6 +215,7 @@ class ChatResponse(BaseModel):
     timestamp: str
     message_id: Optional[str] = None
     conversation_id: Optional[str] = None
+    evidence: Optional[List[Dict[str, Any]]] = None
 
 class HistoryResponse(BaseModel):
     success: bool
@@ -82,12 +225,32 @@ class HistoryResponse(BaseModel):
 class GeneratePDFRequest(BaseModel):
     mode: str = "template"  # "template" or "full"
     doc_type: Optional[str] = None
+    conversation_id: Optional[str] = None
 
 class GeneratePDFResponse(BaseModel):
     success: bool
     pdf_url: str
     filename: str
 
+class BatchChatRequest(BaseModel):
+    queries: List[str]
+    include_case_metadata: bool = False
+    filters: Optional[FacetFilters] = None  # applied to every query
+
+class BatchChatResult(BaseModel):
+    query: str
+    success: bool
+    answer: str
+    evidence_count: int = 0
+    cached: bool = False
+    error: Optional[str] = None
+    evidence: Optional[List[Dict[str, Any]]] = None
+
+class BatchChatResponse(BaseModel):
+    success: bool
+    results: List[BatchChatResult]
+    timestamp: str
+
 class StatusResponse(BaseModel):
     status: str
     version: str
@@ -111,6 +274,32 @@ async def health_check():
     """Check if API is running"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+# Readiness check
+@app.get("/ready")
+async def readiness_check():
+    """Check if the embedding model, Chroma collection and Gemini client are loaded"""
+    if resources is None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "detail": "RAG pipeline not importable", "resources": {}}
+        )
+    ready = resources.is_ready()
+    status = resources.status()
+    if ready:
+        state = "ready"
+    elif any(r["state"] == "failed" and r["required"] for r in status.values()):
+        state = "failed"
+    else:
+        state = "starting"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": state,
+            "timestamp": datetime.now().isoformat(),
+            "resources": status
+        }
+    )
+
 # Status endpoint
 @app.get("/api/status", response_model=StatusResponse)
 async def get_status():
@@ -121,6 +310,8 @@ async def get_status():
         "model": GEMINI_MODEL,
         "endpoints": [
             "/api/chat",
+            "/api/chat/stream",
+            "/api/chat/batch",
             "/api/history",
             "/api/generate-pdf",
             "/api/pdf/{filename}",
@@ -146,15 +337,17 @@ async def chat(request: ChatRequest):
         if not query:
             raise HTTPException(status_code=400, detail="Query cannot be empty")
         
-        # Load history
-        history = load_history()
+        await require_resources("model", RETRIEVAL_RESOURCE, "gemini")
+        filters = await require_filters(request)
+        
+        conversation_id = request.conversation_id or DEFAULT_CONVERSATION
         
         # Add user query to history
-        add_to_history(history, "user", query)
+        await run_blocking(retrieval_pool, history_store.append, conversation_id, "user", query)
         
         # Retrieve evidence
         print(f"[API] Processing query: {query[:100]}...")
-        evidences = retrieve_and_filter(query, top_k=TOP_K, return_top=RETURN_TOP)
+        evidences = await retrieve_async(query, top_k=TOP_K, return_top=RETURN_TOP, filters=filters)
         print(f"[API] Retrieved {len(evidences)} evidence documents")
         
         if len(evidences) == 0:
@@ -162,59 +355,201 @@ async def chat(request: ChatRequest):
             print(f"[API] WARNING: No evidence found for query: {query}")
             
             # Provide a more helpful error message
-            answer = (
-                "I apologize, but I couldn't find specific legal documents matching your query in the database. "
-                "This could mean:\n\n"
-                "1. The query might need to be rephrased\n"
-                "2. The specific legal topic might not be in the current database\n"
-                "3. Try using different keywords or asking about general Pakistani legal topics\n\n"
-                "You can try asking about:\n"
-                "- Contract law and breach of contract\n"
-                "- Property and land transfer procedures\n"
-                "- Employment law and labor rights\n"
-                "- Legal notices and documentation\n"
-                "- Court procedures and judgments"
-            )
+            answer = NO_EVIDENCE_ANSWER
         else:
-            # Build prompt
-            prompt = build_strict_rag_prompt(query, evidences)
-            
-            # Get AI response
-            print(f"[API] Calling Gemini AI...")
-            answer = call_gemini_chat(prompt, model=GEMINI_MODEL, temperature=0.0, max_tokens=2000)
-            print(f"[API] Received AI response ({len(answer)} chars)")
+            # Serve paraphrases of already-answered questions from the semantic cache
+            answer = await run_blocking(encode_pool, lookup_cached_answer, query, evidences)
+            if answer is not None:
+                print(f"[API] Served answer from semantic cache")
+            else:
+                # Build prompt
+                prompt = build_strict_rag_prompt(query, evidences)
+                
+                # Get AI response
+                print(f"[API] Calling Gemini AI...")
+                answer = await generate_answer_async(prompt, max_tokens=2000)
+                print(f"[API] Received AI response ({len(answer)} chars)")
+                await run_blocking(retrieval_pool, store_cached_answer, query, evidences, answer)
         
         # Add assistant response to history
-        add_to_history(history, "assistant", answer)
+        row_id = await run_blocking(retrieval_pool, history_store.append, conversation_id, "assistant", answer)
         
         # Generate message ID
-        message_id = f"msg_{len(history)}"
+        message_id = f"msg_{row_id}"
         
         return {
             "success": True,
             "answer": answer,
             "timestamp": datetime.now().isoformat(),
             "message_id": message_id,
-            "conversation_id": request.conversation_id
+            "conversation_id": request.conversation_id,
+            "evidence": evidence_summary(evidences, True) if request.include_case_metadata else None
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[API] Error in chat endpoint: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+# Streaming chat endpoint (server-sent events)
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Send a legal query and stream the AI-generated answer as server-sent events.
+    
+    Events, in order:
+        retrieval: evidence count and document ids/distances (+ case_metadata if requested)
+        token:     answer text chunks as Gemini produces them
+        done:      message_id once the answer is saved to history
+        error:     sent instead of "done" if generation fails
+    """
+    query = request.query.strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    await require_resources("model", RETRIEVAL_RESOURCE, "gemini")
+    filters = await require_filters(request)
+    
+    async def event_stream():
+        try:
+            conversation_id = request.conversation_id or DEFAULT_CONVERSATION
+            await run_blocking(retrieval_pool, history_store.append, conversation_id, "user", query)
+            
+            print(f"[API] Streaming query: {query[:100]}...")
+            evidences = await retrieve_async(query, top_k=TOP_K, return_top=RETURN_TOP, filters=filters)
+            yield sse_event("retrieval", {
+                "evidence_count": len(evidences),
+                "documents": evidence_summary(evidences, request.include_case_metadata)
+            })
+            
+            chunks = []
+            cached = None
+            if len(evidences) == 0:
+                print(f"[API] WARNING: No evidence found for query: {query}")
+                chunks.append(NO_EVIDENCE_ANSWER)
+                yield sse_event("token", {"text": NO_EVIDENCE_ANSWER})
+            else:
+                cached = await run_blocking(encode_pool, lookup_cached_answer, query, evidences)
+                if cached is not None:
+                    chunks.append(cached)
+                    yield sse_event("token", {"text": cached})
+                else:
+                    prompt = build_strict_rag_prompt(query, evidences)
+                    async with llm_semaphore:
+                        async for text in stream_gemini_chat_async(prompt, model=GEMINI_MODEL, temperature=0.0,
+                                                                   max_tokens=2000, executor=retrieval_pool):
+                            chunks.append(text)
+                            yield sse_event("token", {"text": text})
+            
+            answer = "".join(chunks)
+            if evidences and cached is None:
+                await run_blocking(retrieval_pool, store_cached_answer, query, evidences, answer)
+            row_id = await run_blocking(retrieval_pool, history_store.append, conversation_id, "assistant", answer)
+            
+            yield sse_event("done", {
+                "success": True,
+                "cached": cached is not None,
+                "timestamp": datetime.now().isoformat(),
+                "message_id": f"msg_{row_id}",
+                "conversation_id": request.conversation_id
+            })
+        except Exception as e:
+            print(f"[API] Error in streaming chat endpoint: {e}")
+            yield sse_event("error", {"success": False, "detail": f"Error processing query: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Batch chat endpoint
+@app.post("/api/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(request: BatchChatRequest):
+    """
+    Answer many legal queries in one request (back-office jobs)
+    
+    Pasted citations answered by the reference index are resolved first;
+    the remaining queries are embedded with one batched model.encode call
+    and sent to Chroma as one multi-embedding query; Gemini calls then fan
+    out under LLM_CONCURRENCY. Results come back in request order. Batch
+    answers are not written to chat history.
+    
+    Args:
+        request: BatchChatRequest with a list of query strings
+        
+    Returns:
+        BatchChatResponse with one result per query
+    """
+    queries = [q.strip() for q in request.queries]
+    if not queries:
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+    if any(not q for q in queries):
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    
+    await require_resources("model", RETRIEVAL_RESOURCE, "gemini")
+    filters = await require_filters(request)
+    
+    try:
+        print(f"[API] Processing batch of {len(queries)} queries...")
+        # Reference lookups and embeddings (only for queries that need the dense search) off the event loop
+        q_embs, references = await run_blocking(encode_pool, embed_for_retrieval, queries)
+        batches = await run_blocking(retrieval_pool, retrieve_batch_from_embeddings, queries, q_embs,
+                                     top_k=TOP_K, return_top=RETURN_TOP, filters=filters, references=references)
+    except Exception as e:
+        print(f"[API] Error in batch retrieval: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing queries: {str(e)}")
+    
+    async def answer_one(query: str, evidences: List[Dict[str, Any]]) -> Dict[str, Any]:
+        result = {"query": query, "success": True, "evidence_count": len(evidences), "cached": False}
+        if request.include_case_metadata:
+            result["evidence"] = evidence_summary(evidences, True)
+        try:
+            if not evidences:
+                result["answer"] = NO_EVIDENCE_ANSWER
+                return result
+            answer = await run_blocking(encode_pool, lookup_cached_answer, query, evidences)
+            if answer is not None:
+                result["cached"] = True
+            else:
+                answer = await generate_answer_async(build_strict_rag_prompt(query, evidences), max_tokens=2000)
+                await run_blocking(retrieval_pool, store_cached_answer, query, evidences, answer)
+            result["answer"] = answer
+        except Exception as e:
+            print(f"[API] Batch query failed: {e}")
+            result.update(success=False, answer="", error=str(e))
+        return result
+    
+    results = await asyncio.gather(*[answer_one(q, ev) for q, ev in zip(queries, batches)])
+    
+    return {
+        "success": all(r["success"] for r in results),
+        "results": results,
+        "timestamp": datetime.now().isoformat()
+    }
+
 # Get history endpoint
 @app.get("/api/history", response_model=HistoryResponse)
-async def get_history():
+async def get_history(conversation_id: Optional[str] = None, limit: Optional[int] = None):
     """
-    Get complete chat history
+    Get chat history of one conversation
+    
+    Args:
+        conversation_id: Conversation to read (defaults to the shared "default" conversation)
+        limit: Only return the last N messages
     
     Returns:
-        HistoryResponse with all messages
+        HistoryResponse with the messages, oldest first
     """
     try:
-        history = load_history()
+        history = await run_blocking(
+            retrieval_pool, history_store.recent, conversation_id or DEFAULT_CONVERSATION, limit
+        )
         
         return {
             "success": True,
@@ -228,12 +563,10 @@ async def get_history():
 
 # Clear history endpoint
 @app.delete("/api/history/clear")
-async def clear_history():
-    """Clear all chat history"""
+async def clear_history(conversation_id: Optional[str] = None):
+    """Clear chat history of one conversation, or of all conversations if none is given"""
     try:
-        history_file = "chat_history.json"
-        if os.path.exists(history_file):
-            os.remove(history_file)
+        await run_blocking(retrieval_pool, history_store.clear, conversation_id)
         
         return {
             "success": True,
@@ -257,17 +590,22 @@ async def generate_pdf(request: GeneratePDFRequest):
         GeneratePDFResponse with PDF URL and filename
     """
     try:
-        history = load_history()
+        history = await run_blocking(
+            retrieval_pool, history_store.recent, request.conversation_id or DEFAULT_CONVERSATION
+        )
         
         if not history:
             raise HTTPException(status_code=400, detail="No chat history found. Have a conversation first.")
         
-        # Generate PDF
-        pdf_filename = generate_pdf_from_history(
-            history, 
-            doc_type=request.doc_type,
-            mode=request.mode
-        )
+        # Generate PDF (blocking Gemini + reportlab work, kept off the event loop)
+        async with llm_semaphore:
+            pdf_filename = await run_blocking(
+                retrieval_pool,
+                generate_pdf_from_history,
+                history, 
+                doc_type=request.doc_type,
+                mode=request.mode
+            )
         
         if not pdf_filename:
             raise HTTPException(status_code=500, detail="Failed to generate PDF")
@@ -345,10 +683,33 @@ async def get_config():
             "top_k": TOP_K,
             "return_top": RETURN_TOP,
             "db_path": "ChromaDB",
-            "collection": "pakistan_law"
+            "collection": "pakistan_law",
+            "encode_workers": ENCODE_WORKERS,
+            "retrieval_workers": RETRIEVAL_WORKERS,
+            "llm_concurrency": LLM_CONCURRENCY
         }
     }
 
+# Cache invalidation endpoint (call after re-ingesting the collection)
+@app.post("/api/cache/invalidate")
+async def invalidate_cache():
+    """Sync the local search index with Chroma and clear the semantic answer cache"""
+    index_changes = await run_blocking(retrieval_pool, refresh_local_index)
+    return {
+        "success": True,
+        "message": "Answer cache cleared successfully",
+        "local_index": index_changes
+    }
+
+# Runtime statistics endpoint
+@app.get("/api/stats")
+async def get_stats():
+    """Get cache and runtime counters"""
+    return {
+        "success": True,
+        "stats": get_runtime_stats()
+    }
+
 # Error handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -0,0 +1,28 @@
+"""
+Backfill rerank features (rk_* metadata) for documents uploaded before they
+were computed at ingest time, or after KEYWORD_BOOST / PRIORITY_PHRASES /
+EXCERPT_CHAR_LIMIT changed. Query-time reranking works without them, but
+has to scan every candidate's text.
+
+Usage: python backfill_rerank_features.py [--force] [--page-size N]
+"""
+import argparse
+
+from chroma_test import RERANK_FEATURE_VERSION, backfill_rerank_features
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store rerank features in Chroma metadata")
+    parser.add_argument("--force", action="store_true", help="recompute even up-to-date documents")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"BACKFILLING RERANK FEATURES (version {RERANK_FEATURE_VERSION})")
+    print("=" * 70)
+    result = backfill_rerank_features(page_size=args.page_size, force=args.force)
+    print(f"✓ Scanned {result['scanned']} documents, updated {result['updated']}")
+
+
+if __name__ == "__main__":
+    main()
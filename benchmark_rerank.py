@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-query reranking cost at TOP_K = 20 / 100 / 500.
+
+Compares the original per-keyword / per-phrase loop with rag_rerank
+(TermMatcher + numpy ranking), on synthetic ~10k character documents.
+No Chroma, model or Gemini needed.
+
+Usage: python benchmark_rerank.py [--repeat N] [--density D]
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from rag_rerank import AHOCORASICK_AVAILABLE, TermMatcher, rank_candidates
+
+KEYWORD_BOOST = ["notice", "demand", "breach", "contract", "claim", "payment", "overdue"]
+PRIORITY_PHRASES = [
+    "notice of demand", "legal notice", "demand notice", "final notice",
+    "specimen notice", "format of notice", "draft notice", "specimen",
+    "template", "form of notice", "notice to pay", "notice for payment"
+]
+LEGAL_WORDS = ("notice of demand legal notice breach claim payment overdue contract section order "
+               "rule article judgment appellant respondent petitioner lahore high court specimen").split()
+FILLER_WORDS = ("the court held that party shall pay within days of receipt learned counsel "
+                "submitted record perused impugned order set aside").split()
+
+
+def make_docs(n: int, words: int, density: float, seed: int = 1):
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(LEGAL_WORDS) if rng.random() < density else rng.choice(FILLER_WORDS)
+                 for _ in range(words))
+        for _ in range(n)
+    ]
+
+
+def legacy_rerank(docs, dists):
+    """The loop rerank_and_filter used before rag_rerank."""
+    candidates = []
+    for text, dist in zip(docs, dists):
+        text_lower = text.lower()
+        kw_count = sum(text_lower.count(kw.lower()) for kw in KEYWORD_BOOST)
+        p_score = sum(1 for p in PRIORITY_PHRASES if p.lower() in text.lower())
+        candidates.append({"dist": float(dist), "kw": kw_count, "p_score": p_score, "len": len(text)})
+    for c in candidates:
+        if c['len'] > 8000 and c['p_score'] == 0:
+            c['dist'] = c['dist'] + 1.0 + (c['len'] - 8000) / 20000.0
+    return sorted(candidates, key=lambda x: (-x['p_score'], -x['kw'], x['dist']))
+
+
+def new_rerank(matcher, docs, dists):
+    kw, ph = matcher.score_many(docs)
+    lengths = np.fromiter((len(t) for t in docs), dtype=np.int64, count=len(docs))
+    order, adjusted = rank_candidates(np.asarray(dists, dtype=np.float64), kw, ph, lengths)
+    return [{"dist": float(adjusted[j]), "kw": int(kw[j]), "p_score": int(ph[j]), "len": int(lengths[j])}
+            for j in order.tolist()]
+
+
+def time_per_query(fn, repeat: int) -> float:
+    fn()  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark candidate reranking")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.05, help="fraction of legal terms in the synthetic text")
+    args = parser.parse_args()
+
+    matchers = [("str.count", TermMatcher(KEYWORD_BOOST, PRIORITY_PHRASES, use_automaton=False))]
+    if AHOCORASICK_AVAILABLE:
+        matchers.append(("ahocorasick", TermMatcher(KEYWORD_BOOST, PRIORITY_PHRASES)))
+    else:
+        print("pyahocorasick not installed - only the str.count matcher is measured")
+
+    pool = make_docs(500, 1500, args.density)
+    rng = random.Random(2)
+    print(f"Synthetic documents: {len(pool)} x ~{sum(map(len, pool)) // len(pool)} chars")
+    print(f"{'top_k':>6} {'legacy ms':>10} " + " ".join(f"{name + ' ms':>16}" for name, _ in matchers))
+
+    for top_k in (20, 100, 500):
+        docs = pool[:top_k]
+        dists = [rng.uniform(0.2, 1.6) for _ in docs]
+        expected = legacy_rerank(docs, dists)
+        row = [time_per_query(lambda: legacy_rerank(docs, dists), args.repeat)]
+        for _, matcher in matchers:
+            assert new_rerank(matcher, docs, dists) == expected, "rerank mismatch"
+            row.append(time_per_query(lambda m=matcher: new_rerank(m, docs, dists), args.repeat))
+        print(f"{top_k:>6} {row[0]:>10.2f} " + " ".join(f"{v:>16.2f}" for v in row[1:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Build the case metadata index (parties, PLD/SCMR citation, court, judge,
+judgment date, clauses) for every document in the collection.
+
+Extraction runs once here with a process pool; chat queries and the API then
+look the fields up by document id instead of running the regexes per
+evidence. Re-run after uploading documents (only new cases are extracted
+unless --force is given).
+
+Usage: python build_case_metadata.py [--force] [--workers N]
+"""
+import argparse
+
+from chroma_test import CASE_METADATA_PATH, CASE_METADATA_WORKERS, build_case_metadata_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract case metadata for the whole collection")
+    parser.add_argument("--force", action="store_true", help="re-extract cases already in the index")
+    parser.add_argument("--workers", type=int, default=CASE_METADATA_WORKERS, help="processes (0 = one per CPU)")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"BUILDING CASE METADATA INDEX -> {CASE_METADATA_PATH}")
+    print("=" * 70)
+    result = build_case_metadata_index(workers=args.workers, force=args.force)
+    print(f"✓ {result['cases']} cases indexed ({result['extracted']} extracted, {result['removed']} removed)")
+
+
+if __name__ == "__main__":
+    main()
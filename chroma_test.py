@@ -13,10 +13,33 @@ import os
 import sys
 import json
 import re
+import asyncio
+import atexit
+import hashlib
+import threading
+import time
 from typing import List, Dict, Any
 
-# sentence_transformers imported conditionally below (only if not using Chroma Cloud)
+# sentence_transformers is imported lazily by the "model" resource loader
 import chromadb
+import numpy as np
+
+from rag_cache import EmbeddingCache, PromptCache, SemanticAnswerCache
+from rag_chroma import ChromaClientManager, ManagedCollection
+from rag_facets import FacetStore, normalize_filters  # noqa: F401 (re-exported for the API)
+from rag_history import JsonlHistoryLog
+from rag_index import CollectionSnapshot, LocalSearchEngine, cosine_to_distance
+from rag_lexical import BM25Index, reciprocal_rank_fusion
+from rag_metrics import RetrievalStats
+from rag_planner import FilterStats
+from rag_metadata import (CASE_FIELDS_REGEX, CaseMetadataIndex, build_case_metadata,
+                          extract_case_metadata, group_by_parent)
+from rag_references import ReferenceIndex, query_references
+from rag_rerank import (EXCERPT_CHAR_LIMIT, KEYWORD_BOOST, PRIORITY_PHRASES, feature_version,
+                        get_matcher, has_features, make_excerpt, rank_candidates, rerank_features,
+                        stored_features)
+from rag_resources import ResourceManager, ResourceUnavailable
+from rag_shards import ShardedCollection
 
 # Gemini (google-genai) client
 try:
@@ -24,9 +47,6 @@ try:
 except Exception:
     genai = None
 
-# ---------------------------
-# Configuration - adjust paths/model names as needed
-# ---------------------------
 # ---------------------------
 # Configuration - adjust paths/model names as needed
 # ---------------------------
@@ -38,88 +58,173 @@ TOP_K = 20
 RETURN_TOP = 5
 DEBUG = True  # Enable debug mode to see what's happening
 
-KEYWORD_BOOST = ["notice", "demand", "breach", "contract", "claim", "payment", "overdue"]
-PRIORITY_PHRASES = [
-    "notice of demand", "legal notice", "demand notice", "final notice",
-    "specimen notice", "format of notice", "draft notice", "specimen",
-    "template", "form of notice", "notice to pay", "notice for payment"
-]
-
-EXCERPT_CHAR_LIMIT = 1200
+# KEYWORD_BOOST, PRIORITY_PHRASES and EXCERPT_CHAR_LIMIT live in rag_rerank
+# (ingest scripts use them without importing this module)
+
+# Query embedding cache (entries, seconds; 0 disables size / expiry)
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_TTL = float(os.environ.get("EMBED_CACHE_TTL", "3600"))
+
+# Semantic answer cache: reuse answers for paraphrased questions with identical evidence
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.92"))  # cosine similarity
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "answer_cache.json")      # "" = memory only
+
+# Exact prompt -> answer cache in front of Gemini (memory LRU + SQLite)
+PROMPT_CACHE_SIZE = int(os.environ.get("PROMPT_CACHE_SIZE", "256"))
+PROMPT_CACHE_TTL = float(os.environ.get("PROMPT_CACHE_TTL", str(7 * 86400)))
+PROMPT_CACHE_PATH = os.environ.get("PROMPT_CACHE_PATH", "prompt_cache.sqlite3")   # "" = memory only
+PROMPT_CACHE_DISK_ROWS = int(os.environ.get("PROMPT_CACHE_DISK_ROWS", "10000"))    # oldest rows evicted beyond this
+PROMPT_CACHE_MAX_TEMPERATURE = float(os.environ.get("PROMPT_CACHE_MAX_TEMPERATURE", "0.0"))
+
+# Local vector search over a snapshot of the collection ("chroma" = always query Chroma)
+SEARCH_BACKEND = os.environ.get("RAG_SEARCH_BACKEND", "chroma").strip().lower()   # chroma | hnsw | exact | parallel
+SNAPSHOT_DIR = os.environ.get("RAG_SNAPSHOT_DIR", "index_snapshot")   # "" = never persisted
+INDEX_DTYPE = os.environ.get("RAG_INDEX_DTYPE", "float32").strip().lower()   # float32 | float16 | int8
+INDEX_RESCORE = int(os.environ.get("RAG_INDEX_RESCORE", "4"))   # exact: rescore top k*N in float32; 0 = off
+INDEX_EXACT_TAIL_ROWS = int(os.environ.get("RAG_INDEX_EXACT_TAIL_ROWS", "100000"))   # unsaved float32 rows kept for rescoring; 0 = no limit
+HNSW_M = int(os.environ.get("RAG_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("RAG_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF = int(os.environ.get("RAG_HNSW_EF", "64"))
+# parallel: exact search split across worker processes over shared memory (rag_parallel)
+PARALLEL_WORKERS = int(os.environ.get("RAG_PARALLEL_WORKERS", "0"))        # 0 = one per CPU
+PARALLEL_MIN_ROWS = int(os.environ.get("RAG_PARALLEL_MIN_ROWS", "20000"))  # smaller indexes are scored in-process
+PARALLEL_TIMEOUT = float(os.environ.get("RAG_PARALLEL_TIMEOUT", "30"))     # seconds to wait for a worker before replacing it
+
+# Hybrid retrieval: BM25 over the collection's documents fused (RRF) with dense hits
+HYBRID_SEARCH = os.environ.get("RAG_HYBRID", "0").strip().lower() in ("1", "true", "yes")
+LEXICAL_TOP_K = int(os.environ.get("RAG_LEXICAL_TOP_K", "20"))
+RRF_K = int(os.environ.get("RAG_RRF_K", "60"))
+
+# Exact citation / statute lookup (PLD, SCMR, Section, Article, Order..Rule): hits are
+# fused into the dense result; a query that is nothing but references skips dense search
+REFERENCE_INDEX = os.environ.get("RAG_REFERENCE_INDEX", "0").strip().lower() in ("1", "true", "yes")
+REFERENCE_TOP_K = int(os.environ.get("RAG_REFERENCE_TOP_K", "20"))
+REFERENCE_WEIGHT = float(os.environ.get("RAG_REFERENCE_WEIGHT", "2.0"))      # RRF weight vs dense = 1
+REFERENCE_SHORTCUT_TOKENS = int(os.environ.get("RAG_REFERENCE_SHORTCUT_TOKENS", "2"))  # other words allowed
+
+# Facet filters (court / judge / judgment date / citation type) on retrieval
+FACETS = os.environ.get("RAG_FACETS", "0").strip().lower() in ("1", "true", "yes")
+FACET_EXACT_LIMIT = int(os.environ.get("RAG_FACET_EXACT_LIMIT", "2000"))   # Chroma: score up to N filtered docs exactly
+FACET_OVERFETCH = int(os.environ.get("RAG_FACET_OVERFETCH", "4"))          # beyond that: fetch top_k*N, post-filter
+
+# Language / length filters as a Chroma `where` clause (rag_planner) instead of
+# post-filtering, for predicates that drop at least RAG_PUSHDOWN_MIN_DROP of the collection
+FILTER_PUSHDOWN = os.environ.get("RAG_FILTER_PUSHDOWN", "0").strip().lower() in ("1", "true", "yes")
+PUSHDOWN_MIN_DROP = float(os.environ.get("RAG_PUSHDOWN_MIN_DROP", "0.02"))
+POSTFILTER_MAX_OVERFETCH = float(os.environ.get("RAG_POSTFILTER_MAX_OVERFETCH", "4"))   # for what stays post-filtered
+FILTER_STATS_RECHECK = float(os.environ.get("RAG_FILTER_STATS_RECHECK", "60"))  # seconds between col.count() checks
+
+# Topic-sharded collections (rag_shards): "<COLLECTION>__<topic>" per topic, queried
+# concurrently on the RAG_SHARD_FANOUT shards whose centroids are closest (0 = all)
+SHARDS = os.environ.get("RAG_SHARDS", "0").strip().lower() in ("1", "true", "yes")
+SHARD_FANOUT = int(os.environ.get("RAG_SHARD_FANOUT", "2"))
+SHARD_WORKERS = int(os.environ.get("RAG_SHARD_WORKERS", "4"))
+SHARD_CENTROID_SAMPLE = int(os.environ.get("RAG_SHARD_CENTROID_SAMPLE", "1000"))   # embeddings per shard centroid
+
+# Adaptive k: start small and widen (doubling up to top_k) only when too few
+# candidates survive filtering or the distances show no clear top cluster
+ADAPTIVE_K = os.environ.get("RAG_ADAPTIVE_K", "0").strip().lower() in ("1", "true", "yes")
+ADAPTIVE_K_START = int(os.environ.get("RAG_ADAPTIVE_K_START", "8"))
+ADAPTIVE_K_MARGIN = float(os.environ.get("RAG_ADAPTIVE_K_MARGIN", "0.1"))   # distance units
+
+# Two-phase retrieval (Chroma only): query ids/distances/metadatas first, then
+# col.get the document bodies of the best return_top * overfetch candidates
+TWO_PHASE = os.environ.get("RAG_TWO_PHASE", "0").strip().lower() in ("1", "true", "yes")
+TWO_PHASE_OVERFETCH = float(os.environ.get("RAG_TWO_PHASE_OVERFETCH", "2"))
+
+# Chunked collections (rag_ingest): at most this many chunks of one parent document per answer
+MAX_CHUNKS_PER_PARENT = int(os.environ.get("RAG_MAX_CHUNKS_PER_PARENT", "2"))
+
+# Case metadata (parties, citation, court, judge, date, clauses) extracted once per document
+CASE_METADATA_PATH = os.environ.get("RAG_CASE_METADATA_PATH", "case_metadata.json")   # "" = memory only
+CASE_METADATA_WORKERS = int(os.environ.get("RAG_CASE_METADATA_WORKERS", "0"))   # 0 = one per CPU
 
 # LLM model name for Gemini: set via env GEMINI_MODEL or default
 GEMINI_MODEL = os.environ.get("GEMINI_MODEL") or "models/gemini-2.5-flash"
 
+# Check environment variables
+CHROMA_API_KEY = os.environ.get("CHROMA_API_KEY")
+CHROMA_TENANT = os.environ.get("CHROMA_TENANT")
+CHROMA_DATABASE = os.environ.get("CHROMA_DATABASE")
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+
+# Chroma Cloud connection (rag_chroma): keep-alive pool, timeouts, reconnect, heartbeat
+CHROMA_POOL_SIZE = int(os.environ.get("CHROMA_POOL_SIZE", "16"))
+CHROMA_CONNECT_TIMEOUT = float(os.environ.get("CHROMA_CONNECT_TIMEOUT", "5"))
+CHROMA_READ_TIMEOUT = float(os.environ.get("CHROMA_READ_TIMEOUT", "30"))
+CHROMA_PROBE_INTERVAL = float(os.environ.get("CHROMA_PROBE_INTERVAL", "20"))   # seconds; 0 = no heartbeat
+CHROMA_RETRIES = int(os.environ.get("CHROMA_RETRIES", "1"))   # retries after a reconnect
+
 # ---------------------------
-# Initialize embedding model (only if not using Chroma Cloud)
+# Resource loaders (run lazily / in background, never at import time)
 # ---------------------------
-# Always load embedding model (needed for both local and cloud)
-print("Loading embedding model:", MODEL_NAME)
-try:
+def _load_embedding_model():
+    """Load the SentenceTransformer used for query embeddings."""
+    print("Loading embedding model:", MODEL_NAME)
     from sentence_transformers import SentenceTransformer
     model = SentenceTransformer(MODEL_NAME)
     print(f"✓ Loaded embedding model: {MODEL_NAME}")
-except Exception as e:
-    print(f"Warning: Could not load SentenceTransformer: {e}")
-    model = None
-
-print("=" * 60)
-print("CHROMA CONNECTION DIAGNOSTIC")
-print("=" * 60)
-print("Connecting to ChromaDB...")
-
-# Check environment variables
-CHROMA_API_KEY = os.environ.get("CHROMA_API_KEY")
-CHROMA_TENANT = os.environ.get("CHROMA_TENANT")
-CHROMA_DATABASE = os.environ.get("CHROMA_DATABASE")
+    return model
 
-print(f"CHROMA_API_KEY present: {bool(CHROMA_API_KEY)}")
-print(f"CHROMA_TENANT present: {bool(CHROMA_TENANT)}")
-print(f"CHROMA_DATABASE present: {bool(CHROMA_DATABASE)}")
+def _chroma_client():
+    """A new Chroma client: Chroma Cloud if the env vars are set, else the local persistent DB."""
+    if CHROMA_API_KEY and CHROMA_TENANT and CHROMA_DATABASE:
+        # Use HttpClient with direct headers for Chroma Cloud (v2 API)
+        return chromadb.HttpClient(
+            host='api.trychroma.com',
+            ssl=True,
+            tenant=CHROMA_TENANT,
+            database=CHROMA_DATABASE,
+            headers={'X-Chroma-Token': CHROMA_API_KEY}
+        )
+    return chromadb.PersistentClient(path=DB_DIR)
+
+def _open_chroma():
+    """(client, collection) for Chroma Cloud (if env vars are set) or the local persistent DB."""
+    print("=" * 60)
+    print("CHROMA CONNECTION DIAGNOSTIC")
+    print("=" * 60)
+    print("Connecting to ChromaDB...")
+    print(f"CHROMA_API_KEY present: {bool(CHROMA_API_KEY)}")
+    print(f"CHROMA_TENANT present: {bool(CHROMA_TENANT)}")
+    print(f"CHROMA_DATABASE present: {bool(CHROMA_DATABASE)}")
 
-try:
     if CHROMA_API_KEY and CHROMA_TENANT and CHROMA_DATABASE:
         print(f"✓ All Chroma Cloud env vars found!")
         print(f"  Tenant: {CHROMA_TENANT}")
         print(f"  Database: {CHROMA_DATABASE}")
         print(f"  Attempting cloud connection...")
-        
+
         try:
-            # Use HttpClient with direct headers for Chroma Cloud (v2 API)
-            from chromadb.config import Settings
-            client_chroma = chromadb.HttpClient(
-                host='api.trychroma.com',
-                ssl=True,
-                tenant=CHROMA_TENANT,
-                database=CHROMA_DATABASE,
-                headers={'X-Chroma-Token': CHROMA_API_KEY}
-            )
+            client_chroma = _chroma_client()
             print(f"  ✓ HttpClient created (v2 API) with headers")
-            
+
             col = client_chroma.get_or_create_collection(
                 name=COLLECTION
             )
-
             print(f"  ✓ Collection '{COLLECTION}' connected (cloud)")
 
-            
             # Test count
             try:
                 count = col.count()
                 print(f"  ✓ Chroma Cloud connected! Documents: {count}")
+                answer_cache.set_collection_stamp(f"{COLLECTION}:{count}")
             except Exception as e:
                 print(f"  ✓ Cloud connection OK (count not available): {e}")
         except Exception as cloud_error:
             print(f"  ✗ Chroma Cloud connection failed: {cloud_error}")
             raise cloud_error
-            
+
     # Fallback to local ChromaDB (for development only, NOT when cloud vars are set)
     elif os.path.exists(DB_DIR):
         print(f"Using local ChromaDB at: {DB_DIR}")
         try:
-            client_chroma = chromadb.PersistentClient(path=DB_DIR)
+            client_chroma = _chroma_client()
             col = client_chroma.get_or_create_collection(COLLECTION)
             print("✓ Local ChromaDB connected successfully")
+            answer_cache.set_collection_stamp(f"{COLLECTION}:{col.count()}")
         except Exception as local_error:
             print(f"  ✗ Local ChromaDB connection failed: {local_error}")
             raise local_error
@@ -127,42 +232,369 @@ try:
         print(f"WARNING: No ChromaDB connection available!")
         print(f"  - No Chroma Cloud env vars")
         print(f"  - No local DB at: {DB_DIR}")
-        client_chroma = None
-        col = None
-except Exception as e:
-    print(f"ERROR connecting to ChromaDB: {e}")
-    import traceback
-    traceback.print_exc()
-    client_chroma = None
-    col = None
+        raise RuntimeError(f"No Chroma Cloud env vars and no local DB at: {DB_DIR}")
 
-# ---------------------------
-# Configure Gemini from environment and instantiate client
-# ---------------------------
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    print("ERROR: GEMINI_API_KEY not set in environment. Set it and re-run.")
-    sys.exit(1)
+    if SHARDS:
+        sharded = open_shards(client_chroma)
+        if sharded is not None:
+            return client_chroma, sharded
+        print(f"  RAG_SHARDS is set but '{COLLECTION}' has no topic shards (run shard_collection.py); "
+              f"using the single collection")
 
-if genai is None:
-    print("ERROR: google-genai SDK not installed. Run: pip install google-genai")
-    sys.exit(1)
+    return client_chroma, col
 
-try:
-    client = genai.Client(api_key=GEMINI_API_KEY)  # Explicitly pass API key
-except Exception as e:
-    print("Failed to instantiate google-genai client:", e)
-    sys.exit(1)
+def _reopen_chroma(previous):
+    """
+    Reconnect after a dropped connection: a new client and collection handle
+    only. The shards and router of a sharded collection are kept (rebound to
+    the new client); no diagnostics and no answer-cache stamp.
+    """
+    client_chroma = _chroma_client()
+    if isinstance(previous, ShardedCollection):
+        previous.rebind(client_chroma)
+        return client_chroma, previous
+    return client_chroma, client_chroma.get_collection(COLLECTION)
+
+def _connect_chroma():
+    """The collection, behind a ChromaClientManager that reconnects it when the connection drops."""
+    manager = ChromaClientManager(
+        _open_chroma,
+        reconnect_fn=_reopen_chroma,
+        remote=bool(CHROMA_API_KEY and CHROMA_TENANT and CHROMA_DATABASE),
+        pool_size=CHROMA_POOL_SIZE,
+        timeout=(CHROMA_CONNECT_TIMEOUT, CHROMA_READ_TIMEOUT),
+        probe_interval=CHROMA_PROBE_INTERVAL,
+        retries=CHROMA_RETRIES,
+    )
+    manager.connect()
+    return ManagedCollection(manager)
+
+def open_shards(client_chroma):
+    """ShardedCollection over the topic shards of COLLECTION, or None if it is not sharded."""
+    sharded = ShardedCollection.open(client_chroma, COLLECTION, fanout=SHARD_FANOUT,
+                                     workers=SHARD_WORKERS, centroid_sample=SHARD_CENTROID_SAMPLE)
+    if sharded is not None:
+        print(f"  ✓ {len(sharded.shards)} topic shards: {', '.join(sorted(sharded.shards))} "
+              f"(fanout {SHARD_FANOUT or 'all'})")
+        answer_cache.set_collection_stamp(f"{COLLECTION}:{sharded.count()}")
+    return sharded
+
+def _create_gemini_client():
+    """Configure Gemini from environment and instantiate the client."""
+    if not GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY not set in environment. Set it and re-run.")
+    if genai is None:
+        raise RuntimeError("google-genai SDK not installed. Run: pip install google-genai")
+    return genai.Client(api_key=GEMINI_API_KEY)  # Explicitly pass API key
+
+def _sync_local_index(engine) -> Dict[str, int]:
+    """Pull inserts/deletes from Chroma into `engine` and persist the snapshot if it changed."""
+    changes = engine.refresh(resources.get("collection"))
+    if SNAPSHOT_DIR and (changes["added"] or changes["removed"] or not CollectionSnapshot.exists(SNAPSHOT_DIR)):
+        engine.save(SNAPSHOT_DIR)
+    return changes
+
+def _sync_local_index_in_background(engine):
+    try:
+        changes = _sync_local_index(engine)
+        print(f"Local index synced with Chroma: +{changes['added']} / -{changes['removed']} documents")
+    except Exception as e:
+        print(f"Local index sync skipped (Chroma unavailable), serving snapshot: {e}")
 
-# ---------------------------
-# Regexes for metadata extraction
-# ---------------------------
-CASE_FIELDS_REGEX = {
-    "pld": re.compile(r'\bPLD\s+\d{4}\s+\w+\s+\d+', re.IGNORECASE),
-    "scmr": re.compile(r'\bSCMR\s*\d{1,6}', re.IGNORECASE),
-    "judgment_date_iso": re.compile(r'\b(?:Dated|Date of judgment|Judgment Date)[:\s\-]*([0-9]{1,2}[\/\-][0-9]{1,2}[\/\-][0-9]{2,4})', re.IGNORECASE),
-    "judgment_date_text": re.compile(r'\bJudgment\s+dated[:\s]*([A-Za-z]+\s+\d{1,2},\s*\d{4})', re.IGNORECASE),
-}
+def _build_local_index():
+    """
+    Build the local search index (RAG_SEARCH_BACKEND). Loads the on-disk
+    snapshot when there is one, so retrieval works without Chroma; otherwise
+    snapshots the Chroma collection.
+    """
+    # float32 rows for rescoring come from the saved snapshot; without one, keep (up to
+    # RAG_INDEX_EXACT_TAIL_ROWS of) them in memory
+    keep_exact = SEARCH_BACKEND in ("exact", "parallel") and INDEX_RESCORE > 0
+    if SNAPSHOT_DIR and CollectionSnapshot.exists(SNAPSHOT_DIR):
+        print(f"Loading local index snapshot from: {SNAPSHOT_DIR}")
+        snapshot = CollectionSnapshot.load(SNAPSHOT_DIR, dtype=INDEX_DTYPE, keep_exact=keep_exact,
+                                           max_tail_rows=INDEX_EXACT_TAIL_ROWS)
+        from_disk = True
+    else:
+        col = resources.get("collection")
+        print(f"Building local '{SEARCH_BACKEND}' index from collection '{COLLECTION}'...")
+        snapshot = CollectionSnapshot.from_collection(col, dtype=INDEX_DTYPE, keep_exact=keep_exact,
+                                                      max_tail_rows=INDEX_EXACT_TAIL_ROWS)
+        from_disk = False
+    if len(snapshot) == 0:
+        raise RuntimeError(f"Collection '{COLLECTION}' is empty; nothing to index locally")
+
+    if SEARCH_BACKEND == "hnsw":
+        engine = LocalSearchEngine.build_hnsw(
+            snapshot, M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION, ef=HNSW_EF
+        )
+    elif SEARCH_BACKEND == "exact":
+        engine = LocalSearchEngine.build_exact(snapshot, rescore_factor=INDEX_RESCORE)
+    elif SEARCH_BACKEND == "parallel":
+        from rag_parallel import ParallelExactIndex
+        index = ParallelExactIndex(snapshot, workers=PARALLEL_WORKERS, rescore_factor=INDEX_RESCORE,
+                                   min_rows=PARALLEL_MIN_ROWS, reply_timeout=PARALLEL_TIMEOUT)
+        engine = LocalSearchEngine(snapshot, index, backend="parallel")
+        print(f"  {index.n_workers} search worker(s) started ({index.start_seconds:.1f}s)")
+    else:
+        raise RuntimeError(f"Unknown RAG_SEARCH_BACKEND: {SEARCH_BACKEND}")
+    print(f"✓ Local {engine.backend} index ready: {len(snapshot)} documents, dim={snapshot.dim}, "
+          f"storage={INDEX_DTYPE}")
+
+    if from_disk:
+        # Catch up with Chroma once it connects; keep serving the snapshot if it never does
+        threading.Thread(target=_sync_local_index_in_background, args=(engine,),
+                         name="sync-local-index", daemon=True).start()
+    elif SNAPSHOT_DIR:
+        engine.save(SNAPSHOT_DIR)
+    return engine
+
+def _all_documents(page_size: int = 1000):
+    """(ids, documents, metadatas) of every document: from the local snapshot if there is one, else paged from Chroma."""
+    if "local_index" in resources.names():
+        snapshot = resources.get("local_index").snapshot
+        rows = np.flatnonzero(snapshot.alive).tolist()
+        ids = [snapshot.ids[r] for r in rows]
+        documents = [snapshot.documents[r] for r in rows]
+        metadatas = [snapshot.metadatas[r] for r in rows]
+        return ids, documents, metadatas
+    col = resources.get("collection")
+    ids, documents, metadatas = [], [], []
+    offset = 0
+    while True:
+        page = col.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        page_ids = page.get("ids") or []
+        ids.extend(page_ids)
+        documents.extend(page.get("documents") or [""] * len(page_ids))
+        metadatas.extend(page.get("metadatas") or [{}] * len(page_ids))
+        offset += len(page_ids)
+        if len(page_ids) < page_size:
+            break
+    return ids, documents, metadatas
+
+def _build_lexical_index():
+    """BM25 index over every document."""
+    ids, documents, metadatas = _all_documents()
+    index = BM25Index().build(ids, documents, metadatas)
+    print(f"✓ BM25 index ready: {len(index)} documents, {len(index.vocab)} terms "
+          f"({index.build_seconds:.1f}s)")
+    return index
+
+def _build_reference_index():
+    """Citation / statute-reference index over every document."""
+    ids, documents, _metadatas = _all_documents()
+    index = ReferenceIndex().build(ids, documents)
+    print(f"✓ Reference index ready: {len(index.postings)} references in {len(index)} documents "
+          f"({index.build_seconds:.1f}s)")
+    return index
+
+def _build_facet_store():
+    """Facet columns for every document, from the case metadata index (missing cases are extracted now)."""
+    ids, documents, metadatas = _all_documents()
+    keys = [str((meta or {}).get("parent_id") or _id) for _id, meta in zip(ids, metadatas)]
+    missing = [(key, text) for key, text in group_by_parent(ids, documents, metadatas)
+               if key not in case_metadata_index]
+    if missing:
+        print(f"Extracting case metadata for {len(missing)} case(s) missing from {CASE_METADATA_PATH or 'the index'}...")
+        results = build_case_metadata([text for _key, text in missing], workers=CASE_METADATA_WORKERS or None)
+        case_metadata_index.update({key: md for (key, _text), md in zip(missing, results)})
+    store = FacetStore().build(ids, case_metadata_index.lookup_many(keys))
+    stats = store.stats()
+    print(f"✓ Facet store ready: {stats['documents']} documents, {stats['courts']} courts, "
+          f"{stats['judges']} judges, {stats['dated']} dated ({store.build_seconds:.1f}s)")
+    return store
+
+def _build_filter_stats(page_size: int = 1000):
+    """Language / length filter selectivity over the stored metadata (no document bodies)."""
+    col = resources.get("collection")
+    stats = FilterStats(MIN_LENGTH, lambda lang: candidate_filter_reason(None, {"lang": lang}) is None)
+    offset = 0
+    while True:
+        page = col.get(limit=page_size, offset=offset, include=["metadatas"])
+        page_ids = page.get("ids") or []
+        stats.add(page.get("metadatas") or [{}] * len(page_ids))
+        offset += len(page_ids)
+        if len(page_ids) < page_size:
+            break
+    plan = stats.plan(PUSHDOWN_MIN_DROP, POSTFILTER_MAX_OVERFETCH)
+    print(f"✓ Filter stats ready: {len(stats)} documents, pushdown: {plan['pushed'] or 'none'}, "
+          f"post-filter: {plan['post'] or 'none'} ({stats.build_seconds:.1f}s)")
+    return stats
+
+# With a saved snapshot the local index can serve retrieval on its own, so
+# readiness (and the API's 503s) depend on it instead of the Chroma connection.
+LOCAL_SNAPSHOT_AVAILABLE = SEARCH_BACKEND != "chroma" and CollectionSnapshot.exists(SNAPSHOT_DIR)
+RETRIEVAL_RESOURCE = "local_index" if LOCAL_SNAPSHOT_AVAILABLE else "collection"
+
+resources = ResourceManager(debug=DEBUG)
+resources.register("model", _load_embedding_model)
+resources.register("collection", _connect_chroma, required=not LOCAL_SNAPSHOT_AVAILABLE)
+resources.register("gemini", _create_gemini_client)
+if SEARCH_BACKEND != "chroma":
+    # Without a snapshot, queries go to Chroma until the local index is ready (or if it fails)
+    resources.register("local_index", _build_local_index, required=LOCAL_SNAPSHOT_AVAILABLE)
+if HYBRID_SEARCH:
+    # Optional: dense-only retrieval until the BM25 index is built
+    resources.register("lexical_index", _build_lexical_index, required=False)
+if FACETS:
+    resources.register("facet_store", _build_facet_store, required=False)
+if FILTER_PUSHDOWN:
+    # Optional: everything is post-filtered until the stats are collected
+    resources.register("filter_stats", _build_filter_stats, required=False)
+if REFERENCE_INDEX:
+    # Optional: citations go through dense search until the index is built
+    resources.register("reference_index", _build_reference_index, required=False)
+
+def start_background_init():
+    """Start loading the model, Chroma collection and Gemini client in background threads."""
+    resources.start()
+
+def get_model():
+    """Embedding model, or None if it could not be loaded."""
+    try:
+        return resources.get("model")
+    except ResourceUnavailable:
+        return None
+
+def get_collection():
+    """Chroma collection, or None if no connection is available."""
+    try:
+        return resources.get("collection")
+    except ResourceUnavailable:
+        return None
+
+def get_local_index():
+    """Local search engine if one is configured and already built, else None (never blocks)."""
+    if "local_index" not in resources.names():
+        return None
+    return resources.peek("local_index")
+
+def get_lexical_index():
+    """BM25 index if hybrid search is enabled and the index is built, else None (never blocks)."""
+    if "lexical_index" not in resources.names():
+        return None
+    return resources.peek("lexical_index")
+
+def get_reference_index():
+    """Citation / statute-reference index if enabled and built, else None (never blocks)."""
+    if "reference_index" not in resources.names():
+        return None
+    return resources.peek("reference_index")
+
+def facet_filter_ids(filters: Dict[str, Any]):
+    """
+    Ids of the documents matching the facet filters, or None when there are
+    no filters. Waits for the facet store if it is still building.
+    """
+    filters = normalize_filters(filters)
+    if not filters:
+        return None
+    if "facet_store" not in resources.names():
+        raise ValueError("Facet filters need the facet store (set RAG_FACETS=1)")
+    ids = resources.get("facet_store").matching_ids(filters)
+    if DEBUG:
+        print(f"[FACETS] {filters} -> {len(ids)} document(s)")
+    return ids
+
+def _filter_stats_stale(stats) -> bool:
+    """Has the document count changed since the stats were collected? (checked every FILTER_STATS_RECHECK s)"""
+    now = time.monotonic()
+    if now - stats.checked_at < FILTER_STATS_RECHECK:
+        return False
+    stats.checked_at = now
+    col = get_collection()
+    try:
+        count = col.count() if col is not None else len(stats)
+    except Exception as e:
+        if DEBUG:
+            print(f"[PLANNER] Could not count documents: {e}")
+        return False
+    if count == len(stats):
+        return False
+    print(f"[PLANNER] Collection changed ({len(stats)} -> {count} documents); recollecting filter stats")
+    return True
+
+def filter_plan():
+    """
+    (FilterStats, plan) for the language / length filters on Chroma queries,
+    or (None, None) when pushdown is off or the stats are not collected yet.
+    """
+    if "filter_stats" not in resources.names():
+        return None, None
+    stats = resources.peek("filter_stats")
+    if stats is None:
+        return None, None
+    if _filter_stats_stale(stats):
+        # Documents written since the stats were collected may lack a pushed
+        # field, so post-filter everything until the stats are recollected
+        resources.reset("filter_stats")
+        resources.start(["filter_stats"])
+        return None, None
+    plan = stats.plan(PUSHDOWN_MIN_DROP, POSTFILTER_MAX_OVERFETCH)
+    if DEBUG:
+        print(f"[PLANNER] pushdown: {plan['pushed']}, post-filter: {plan['post']} (x{plan['overfetch']:.2f})")
+    return stats, plan
+
+def refresh_shards() -> Dict[str, int]:
+    """
+    With RAG_SHARDS: open topic shards created since startup and rebuild the
+    centroid router (other processes' writes do not reach this process's
+    router). A collection that was sharded after startup is reconnected so
+    queries switch to the shards.
+    """
+    col = get_collection()
+    if not SHARDS or col is None:
+        return {}
+    current = getattr(col, "current", col)
+    if isinstance(current, ShardedCollection):
+        changes = current.refresh()
+    else:
+        manager = getattr(col, "manager", None)
+        if manager is None:
+            return {}
+        manager.connect()
+        current = manager.collection
+        if not isinstance(current, ShardedCollection):
+            return {}
+        changes = {"shards": len(current.shards), "new_shards": len(current.shards)}
+    print(f"Shards refreshed: {changes['shards']} shards ({changes['new_shards']} new), router rebuilt")
+    return changes
+
+def refresh_local_index() -> Dict[str, int]:
+    """
+    Pull inserts/deletes from Chroma into the local index and rebuild the
+    BM25 / reference indexes and facet store in the background (call after
+    the collection changes). Topic shards and their router are refreshed
+    first, filter stats are recollected and the answer cache is cleared.
+    """
+    changes: Dict[str, int] = dict(refresh_shards())
+    engine = get_local_index()
+    if engine is not None and get_collection() is not None:
+        changes.update(_sync_local_index(engine))
+        print(f"Local index refreshed: +{changes['added']} / -{changes['removed']} documents")
+    for name in ("lexical_index", "reference_index", "facet_store", "filter_stats"):
+        if name in resources.names():
+            resources.reset(name)
+            resources.start([name])
+    # Re-ingested documents keep their ids and the collection its count, so
+    # neither the evidence keys nor the collection stamp would notice
+    invalidate_answer_cache()
+    return changes
+
+def get_gemini_client():
+    """Gemini client; raises ResourceUnavailable if it could not be created."""
+    return resources.get("gemini")
+
+def __getattr__(name: str):
+    # Backwards compatibility: `from chroma_test import col, model, client`
+    # used to return objects created at import time; resolve them on demand.
+    if name == "model":
+        return get_model()
+    if name == "col":
+        return get_collection()
+    if name == "client":
+        return get_gemini_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ---------------------------
 # Helpers: scoring + safe extraction
@@ -174,58 +606,334 @@ def phrase_score(text: str, phrases: List[str] = PRIORITY_PHRASES) -> int:
 def safe_text_len(text: str) -> int:
     return len(text or "")
 
+# Query-independent rerank features are stored in metadata at ingest time
+# (rk_* fields); this version tags which term lists / excerpt size they match.
+RERANK_FEATURE_VERSION = feature_version(KEYWORD_BOOST, PRIORITY_PHRASES, EXCERPT_CHAR_LIMIT)
+
+def stored_length(meta: Dict[str, Any]):
+    """Document length from metadata, or None for documents ingested without features."""
+    n = (meta or {}).get('rk_len')
+    return int(n) if n is not None else None
+
+def evidence_excerpt(evidence: Dict[str, Any]) -> str:
+    """The excerpt a prompt shows for an evidence: stored rk_excerpt, else cut from the text."""
+    md = evidence.get('meta') or {}
+    if has_features(md, RERANK_FEATURE_VERSION):
+        return md['rk_excerpt']
+    return make_excerpt(evidence.get('text'), EXCERPT_CHAR_LIMIT)
+
+def backfill_rerank_features(col=None, page_size: int = 500, force: bool = False) -> Dict[str, int]:
+    """
+    Add or refresh rk_* metadata for documents that lack the current
+    RERANK_FEATURE_VERSION (all documents with force=True). The local index
+    snapshot, if loaded, is updated in place and re-saved.
+    """
+    col = col if col is not None else resources.get("collection")
+    scanned = updated = 0
+    offset = 0
+    while True:
+        page = col.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        ids = page.get("ids") or []
+        docs = page.get("documents") or [""] * len(ids)
+        metas = page.get("metadatas") or [{}] * len(ids)
+        stale_ids, stale_metas = [], []
+        for _id, doc, meta in zip(ids, docs, metas):
+            if force or not has_features(meta, RERANK_FEATURE_VERSION):
+                stale_ids.append(_id)
+                stale_metas.append(dict(meta or {}, **rerank_features(doc)))
+        if stale_ids:
+            col.update(ids=stale_ids, metadatas=stale_metas)
+            engine = get_local_index()
+            if engine is not None:
+                engine.update_metadatas(stale_ids, stale_metas)
+        scanned += len(ids)
+        updated += len(stale_ids)
+        offset += len(ids)
+        if len(ids) < page_size:
+            break
+    engine = get_local_index()
+    if updated and engine is not None and SNAPSHOT_DIR:
+        engine.save(SNAPSHOT_DIR)
+    if updated and "filter_stats" in resources.names():
+        # rk_len may now be present everywhere, making the length filter pushable
+        resources.reset("filter_stats")
+        resources.start(["filter_stats"])
+    if updated:
+        # Prompts use the stored rk_excerpt, which may differ from the old one
+        invalidate_answer_cache()
+    print(f"Rerank features: {updated}/{scanned} documents updated (version {RERANK_FEATURE_VERSION})")
+    return {"scanned": scanned, "updated": updated}
+
+# ---------------------------
+# Query embeddings (cached)
+# ---------------------------
+embedding_cache = EmbeddingCache(max_size=EMBED_CACHE_SIZE, ttl_seconds=EMBED_CACHE_TTL)
+
+def embed_queries(queries: List[str]) -> List[Any]:
+    """Embed queries as float32 vectors, encoding only cache misses in one batch."""
+    model = get_model()
+    if model is None:
+        raise ResourceUnavailable("Embedding model not initialized.")
+    return embedding_cache.encode(
+        MODEL_NAME, queries,
+        lambda texts: model.encode(texts, convert_to_numpy=True)
+    )
+
+def embed_query(query: str):
+    """Embed a single query (float32 numpy vector), served from cache when possible."""
+    return embed_queries([query])[0]
+
+# ---------------------------
+# Semantic answer cache
+# ---------------------------
+answer_cache = SemanticAnswerCache(
+    max_size=ANSWER_CACHE_SIZE,
+    ttl_seconds=ANSWER_CACHE_TTL,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    path=ANSWER_CACHE_PATH,
+)
+atexit.register(answer_cache.save)
+
+def _evidence_keys(evidences: List[Dict[str, Any]]) -> List[str]:
+    """Evidence ids plus a hash of the excerpt the prompt shows, so edited bodies miss."""
+    keys = []
+    for e in evidences:
+        digest = hashlib.sha1(evidence_excerpt(e).encode("utf-8")).hexdigest()[:12]
+        keys.append(f"{e.get('id') or ''}#{digest}")
+    return keys
+
+def lookup_cached_answer(query: str, evidences: List[Dict[str, Any]]):
+    """Cached answer for a near-duplicate query with the same evidence, or None."""
+    if not evidences:
+        return None
+    answer = answer_cache.lookup(embed_query(query), _evidence_keys(evidences))
+    if answer is not None and DEBUG:
+        print(f"[CACHE] Semantic answer cache hit: {query[:50]}...")
+    return answer
+
+def store_cached_answer(query: str, evidences: List[Dict[str, Any]], answer: str):
+    """Remember a generated answer for later near-duplicate queries."""
+    if evidences and answer:
+        answer_cache.store(query, embed_query(query), _evidence_keys(evidences), answer)
+
+def invalidate_answer_cache():
+    """Invalidation hook: call after the pakistan_law collection changes."""
+    answer_cache.invalidate()
+    print("Semantic answer cache cleared.")
+
+def get_runtime_stats() -> Dict[str, Any]:
+    """Counters for caches and other runtime components (exposed by the API)."""
+    engine = get_local_index()
+    lexical = get_lexical_index()
+    references = get_reference_index()
+    facets = resources.peek("facet_store") if "facet_store" in resources.names() else None
+    filter_stats = resources.peek("filter_stats") if "filter_stats" in resources.names() else None
+    col = resources.peek("collection")
+    manager = getattr(col, "manager", None)
+    current = manager.collection if manager is not None else col
+    return {
+        "retrieval": dict(retrieval_stats.stats(), adaptive_k=ADAPTIVE_K),
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "local_index": engine.stats() if engine is not None else {"backend": SEARCH_BACKEND},
+        "lexical_index": lexical.stats() if lexical is not None else {"enabled": HYBRID_SEARCH},
+        "reference_index": references.stats() if references is not None else {"enabled": REFERENCE_INDEX},
+        "facets": facets.stats() if facets is not None else {"enabled": FACETS},
+        "filter_pushdown": filter_stats.stats() if filter_stats is not None else {"enabled": FILTER_PUSHDOWN},
+        "shards": current.stats() if isinstance(current, ShardedCollection) else {"enabled": SHARDS},
+        "chroma": manager.stats() if manager is not None else {"connected": col is not None},
+        "case_metadata": case_metadata_index.stats(),
+    }
+
 # ---------------------------
 # Retrieval & filtering
 # ---------------------------
-def retrieve_and_filter(query: str,
-                        top_k: int = TOP_K,
-                        keyword_boost: List[str] = KEYWORD_BOOST,
-                        return_top: int = RETURN_TOP) -> List[Dict[str, Any]]:
+def _query_chroma_ids(col, q_embs: List[Any], ids: List[str], top_k: int,
+                      include_documents: bool = True, where: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Exact nearest neighbours among `ids` (facet-filtered), scored locally from Chroma-stored embeddings."""
+    got_ids, vectors = [], []
+    for start in range(0, len(ids), 1000):
+        page = col.get(ids=ids[start:start + 1000], where=where, include=["embeddings"])
+        got_ids.extend(page.get("ids") or [])
+        vectors.extend(page.get("embeddings") or [])
+    space = str((getattr(col, "metadata", None) or {}).get("hnsw:space", "l2")).lower()
+    out: Dict[str, Any] = {"ids": [], "metadatas": [], "distances": [],
+                           "documents": [] if include_documents else None}
+    if not got_ids:
+        for _ in q_embs:
+            for key in ("ids", "metadatas", "distances"):
+                out[key].append([])
+            if include_documents:
+                out["documents"].append([])
+        return out
+    mat = np.asarray(vectors, dtype=np.float32)
+    mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+    queries = np.asarray([np.asarray(q, dtype=np.float32) for q in q_embs])
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    sims = queries @ mat.T
+    k = min(top_k, len(got_ids))
+    top = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+    winners = list(dict.fromkeys(got_ids[j] for j in top.reshape(-1).tolist()))
+    page = col.get(ids=winners, include=["metadatas", "documents"] if include_documents else ["metadatas"])
+    meta_of = dict(zip(page.get("ids") or [], page.get("metadatas") or []))
+    doc_of = dict(zip(page.get("ids") or [], page.get("documents") or [])) if include_documents else {}
+    for qi, cols in enumerate(top):
+        row_ids = [got_ids[j] for j in cols.tolist()]
+        out["ids"].append(row_ids)
+        out["metadatas"].append([meta_of.get(i) or {} for i in row_ids])
+        out["distances"].append(cosine_to_distance(1.0 - sims[qi, cols].astype(np.float64), space).tolist())
+        if include_documents:
+            out["documents"].append([doc_of.get(i) or "" for i in row_ids])
+    return out
+
+def _keep_ids(res: Dict[str, Any], allowed: set, top_k: int) -> Dict[str, Any]:
+    """Post-filter a multi-query Chroma result to allowed ids (first top_k per query)."""
+    out = dict(res)
+    keys = [key for key in ("ids", "documents", "metadatas", "distances") if res.get(key) is not None]
+    for key in keys:
+        out[key] = []
+    for qi, row_ids in enumerate(res["ids"]):
+        keep = [j for j, _id in enumerate(row_ids) if _id in allowed][:top_k]
+        for key in keys:
+            out[key].append([res[key][qi][j] for j in keep])
+    return out
+
+def query_collection_batch(q_embs: List[Any], top_k: int = TOP_K, queries: List[str] = None,
+                           include_documents: bool = True, ids: List[str] = None) -> Dict[str, Any]:
+    """
+    Run one nearest-neighbour query against Chroma for several embeddings.
+    Returns the raw Chroma result dict (one inner list per embedding), or None if the query failed.
+    include_documents=False skips document bodies on the Chroma path (two-phase retrieval);
+    the local index always returns them since they are already in memory.
+    ids (facet filters) restricts the search to those documents. On the Chroma
+    path the language / length filters are pushed into `where` as planned by
+    filter_plan(); what stays post-filtered is compensated by over-fetching.
+    """
+    engine = get_local_index()
+    if engine is not None:
+        try:
+            if DEBUG:
+                print(f"[DEBUG] Using local {engine.backend} index for {len(q_embs)} embedding(s)")
+            return engine.query(q_embs, n_results=top_k, include=['documents', 'metadatas', 'distances'], ids=ids)
+        except Exception as e:
+            print(f"Local index query failed, falling back to Chroma: {e}")
+
+    col = get_collection()
     if col is None:
         print("Error: Collection not initialized.")
-        return []
+        return None
+
+    filter_stats, plan = filter_plan()
+    where = plan["where"] if plan else None
+    if ids is not None:
+        try:
+            if len(ids) <= FACET_EXACT_LIMIT:
+                return _query_chroma_ids(col, q_embs, ids, top_k, include_documents, where=where)
+            # Too many to score locally: over-fetch and post-filter
+            res = query_collection_batch(q_embs, top_k=top_k * FACET_OVERFETCH, queries=queries,
+                                         include_documents=include_documents)
+            return _keep_ids(res, set(ids), top_k) if res is not None else None
+        except Exception as e:
+            print(f"Filtered Chroma query failed: {e}")
+            return None
 
     include = ['documents', 'metadatas', 'distances', 'data']
-    
-    # Check if using Chroma Cloud (no local model needed)
+    base_include = ['documents', 'metadatas', 'distances']
+    if not include_documents:
+        include = ['metadatas', 'distances']
+        base_include = ['metadatas', 'distances']
+    # Chroma validates plain Python floats
+    q_embs = [e.tolist() if hasattr(e, "tolist") else e for e in q_embs]
+    label = (queries[0][:50] if queries else "") + (f" (+{len(q_embs) - 1} more)" if len(q_embs) > 1 else "")
+    n_results = filter_stats.fetch_k(top_k, plan) if plan else top_k
+    extra = {"where": where} if where else {}
+
+    # Check if using Chroma Cloud
     CHROMA_API_KEY = os.environ.get("CHROMA_API_KEY")
     using_cloud = CHROMA_API_KEY is not None
-    
+
     try:
         if using_cloud:
-            # Chroma Cloud: Still need to generate embeddings locally
-            if model is None:
-                print("Error: Model not initialized for Chroma Cloud.")
-                return []
-            print(f"[DEBUG] Using Chroma Cloud with embeddings: {query[:50]}...")
-            q_emb = model.encode(query, convert_to_numpy=True).tolist()
-            res = col.query(
-                query_embeddings=[q_emb],
-                n_results=top_k,
-                include=['documents', 'metadatas', 'distances']
+            # Chroma Cloud: embeddings are generated locally
+            print(f"[DEBUG] Using Chroma Cloud with embeddings: {label}...")
+            return col.query(
+                query_embeddings=q_embs,
+                n_results=n_results,
+                include=base_include,
+                **extra
             )
-        else:
-            # Local ChromaDB: Use embeddings
-            if model is None:
-                print("Error: Model not initialized for local ChromaDB.")
-                return []
-            print(f"[DEBUG] Using local ChromaDB with embeddings: {query[:50]}...")
-            q_emb = model.encode(query, convert_to_numpy=True).tolist()
-            res = col.query(query_embeddings=[q_emb], n_results=top_k, include=include)
+        # Local ChromaDB: Use embeddings
+        print(f"[DEBUG] Using local ChromaDB with embeddings: {label}...")
+        return col.query(query_embeddings=q_embs, n_results=n_results, include=include, **extra)
     except Exception as e:
         if DEBUG:
             print("Chroma query failed:", e)
-        # Fallback for local
-        if not using_cloud and model is not None:
+        # Fallback for local: retry without the 'data' include
+        if not using_cloud:
             try:
-                q_emb = model.encode(query, convert_to_numpy=True).tolist()
-                res = col.query(query_embeddings=[q_emb], n_results=top_k, include=['documents', 'metadatas', 'distances'])
+                return col.query(query_embeddings=q_embs, n_results=n_results, include=base_include, **extra)
             except Exception as e2:
                 print(f"Fallback query also failed: {e2}")
-                return []
+        return None
+
+def query_collection(q_emb, top_k: int = TOP_K, query: str = "") -> Dict[str, Any]:
+    """Nearest-neighbour query for a single embedding (see query_collection_batch)."""
+    return query_collection_batch([q_emb], top_k=top_k, queries=[query])
+
+def split_query_result(res: Dict[str, Any], i: int) -> Dict[str, Any]:
+    """Slice the i-th query out of a multi-embedding Chroma result, keeping the [[...]] shape."""
+    out = {}
+    for key, val in res.items():
+        if isinstance(val, list) and len(val) > i and isinstance(val[i], list):
+            out[key] = [val[i]]
         else:
-            return []
+            out[key] = val
+    return out
+
+MIN_LENGTH = 50  # Reduced from 200 to be more lenient
 
+def candidate_filter_reason(length, meta: Dict[str, Any]):
+    """
+    Why a candidate is filtered out (too short / non-English), or None if it is kept.
+    length=None (body not fetched yet) skips the length check.
+    """
+    # Filter out very short documents (< 50 chars)
+    if length is not None and length < MIN_LENGTH:
+        return f"too short: {length} chars"
+    # Allow English, unknown, or missing language metadata
+    lang = str((meta or {}).get('lang', 'en')).lower()
+    if lang and not lang.startswith('en') and lang != 'unknown' and lang != '':
+        return f"non-English: lang={lang}"
+    return None
+
+def aggregate_by_parent(candidates: List[Dict[str, Any]], return_top: int = RETURN_TOP,
+                        max_per_parent: int = MAX_CHUNKS_PER_PARENT) -> List[Dict[str, Any]]:
+    """
+    Group ranked chunk hits by parent document: parents keep the rank of their
+    best chunk, each contributes at most max_per_parent chunks, and a parent's
+    chunks are returned together in reading order. Unchunked documents are
+    their own parent, so their order is unchanged.
+    """
+    taken: Dict[str, List[Dict[str, Any]]] = {}
+    total = 0
+    for c in candidates:
+        if total >= return_top:
+            break
+        group = taken.setdefault(c.get('parent_id') or c.get('id') or "", [])
+        if len(group) >= max(1, max_per_parent):
+            continue
+        group.append(c)
+        total += 1
+    out = []
+    for group in taken.values():
+        out.extend(sorted(group, key=lambda c: int(c['meta'].get('chunk_index', 0) or 0)))
+    return out
+
+def rerank_and_filter(res: Dict[str, Any],
+                      keyword_boost: List[str] = KEYWORD_BOOST,
+                      return_top: int = RETURN_TOP) -> List[Dict[str, Any]]:
+    """Phrase/keyword re-ranking, length penalty and language/length filtering of a Chroma result."""
     if DEBUG:
         print("chroma keys:", list(res.keys()))
 
@@ -240,6 +948,7 @@ def retrieve_and_filter(query: str,
     docs = safe_get_top_list('documents', [])
     metas = safe_get_top_list('metadatas', [])
     dists = safe_get_top_list('distances', [])
+    fused = safe_get_top_list('rrf', [])  # set by hybrid (BM25 + dense) fusion
 
     ids = []
     if 'ids' in res:
@@ -262,58 +971,54 @@ def retrieve_and_filter(query: str,
     dists = list(dists) + [float('inf')] * (n - len(dists))
     ids = list(ids) + [""] * (n - len(ids))
 
-    candidates = []
-    for doc, meta, _id, dist in zip(docs, metas, ids, dists):
-        text = doc or ""
-        text_lower = text.lower()
-        kw_count = sum(text_lower.count(kw.lower()) for kw in keyword_boost)
-        p_score = phrase_score(text)
+    # Keyword/phrase counts and lengths from ingest-time metadata; documents
+    # without current features are scanned (one pass each), then penalty + sort over arrays
+    texts = [doc or "" for doc in docs]
+    version = feature_version(keyword_boost, PRIORITY_PHRASES, EXCERPT_CHAR_LIMIT)
+    kw_counts, p_scores, lengths, present = stored_features(metas, version)
+    missing = np.flatnonzero(~present)
+    if len(missing):
+        kw_counts[missing], p_scores[missing] = get_matcher(keyword_boost, PRIORITY_PHRASES).score_many(
+            [texts[j] for j in missing])
+        lengths[missing] = [safe_text_len(texts[j]) for j in missing]
+    retrieval_stats.record_features(n - len(missing), len(missing))
+    scores = np.empty(n, dtype=np.float64)
+    for j, dist in enumerate(dists):
         try:
-            score = float(dist) if dist is not None else float('inf')
+            scores[j] = float(dist) if dist is not None else float('inf')
         except Exception:
-            score = float('inf')
+            scores[j] = float('inf')
+    order, scores = rank_candidates(scores, kw_counts, p_scores, lengths,
+                                    fused=np.asarray(fused, dtype=np.float64) if len(fused) == n and n else None)
 
+    candidates = []
+    for j in order.tolist():
+        meta = metas[j] or {}
         candidates.append({
-            "id": _id or meta.get('id') or meta.get('doc_id') or "",
-            "text": text,
-            "meta": meta or {},
-            "dist": score,
-            "kw": int(kw_count),
-            "p_score": int(p_score),
-            "len": safe_text_len(text)
+            "id": ids[j] or meta.get('id') or meta.get('doc_id') or "",
+            "text": texts[j],
+            "meta": meta,
+            "dist": float(scores[j]),
+            "kw": int(kw_counts[j]),
+            "p_score": int(p_scores[j]),
+            "len": int(lengths[j]),
+            "parent_id": str(meta.get('parent_id') or ids[j] or "")
         })
 
-    # length penalty
-    LENGTH_PENALTY_THRESHOLD = 8000
-    for c in candidates:
-        if c['len'] > LENGTH_PENALTY_THRESHOLD and c['p_score'] == 0:
-            c['dist'] = c['dist'] + 1.0 + (c['len'] - LENGTH_PENALTY_THRESHOLD) / 20000.0
-
-    candidates = sorted(candidates, key=lambda x: (-x['p_score'], -x['kw'], x['dist']))
-
     # Apply filters with more lenient criteria
     filtered = []
-    MIN_LENGTH = 50  # Reduced from 200 to be more lenient
-    
     for c in candidates:
-        # Filter out very short documents (< 50 chars)
-        if c['len'] < MIN_LENGTH:
+        reason = candidate_filter_reason(c['len'], c['meta'])
+        if reason is not None:
             if DEBUG:
-                print(f"[FILTER] Skipped doc (too short): {c['len']} chars")
+                print(f"[FILTER] Skipped doc ({reason})")
             continue
-        
-        # Allow English, unknown, or missing language metadata
-        lang = str(c['meta'].get('lang', 'en')).lower()
-        if lang and not lang.startswith('en') and lang != 'unknown' and lang != '':
-            if DEBUG:
-                print(f"[FILTER] Skipped doc (non-English): lang={lang}")
-            continue
-        
         filtered.append(c)
     
     # Fallback: if all documents were filtered out, return top unfiltered candidates
     if len(filtered) == 0 and len(candidates) > 0:
         print(f"WARNING: All {len(candidates)} documents were filtered out. Returning top {return_top} unfiltered results.")
+        retrieval_stats.record_fallback()
         # Return candidates that are at least somewhat relevant (not empty)
         fallback = [c for c in candidates if c['len'] > 0][:return_top]
         if DEBUG:
@@ -324,7 +1029,373 @@ def retrieve_and_filter(query: str,
     if DEBUG and len(filtered) > 0:
         print(f"[FILTER] Kept {len(filtered)}/{len(candidates)} documents after filtering")
 
-    return filtered[:return_top]
+    return aggregate_by_parent(filtered, return_top)
+
+def _dense_distances(q_emb, ids: List[str]) -> List[float]:
+    """Dense distances for documents the vector search did not return (lexical-only hits)."""
+    q = np.asarray(q_emb, dtype=np.float32)
+    q = q / (np.linalg.norm(q) or 1.0)
+    engine = get_local_index()
+    if engine is not None:
+        snap = engine.snapshot
+        rows = np.asarray([snap.row_of[i] for i in ids], dtype=np.int64)
+        cos_dist = 1.0 - snap.vectors.exact(rows) @ q
+        return cosine_to_distance(cos_dist.astype(np.float64), snap.space).tolist()
+    col = get_collection()
+    got = col.get(ids=ids, include=["embeddings"])
+    emb = {i: np.asarray(e, dtype=np.float32) for i, e in zip(got["ids"], got["embeddings"])}
+    space = str((getattr(col, "metadata", None) or {}).get("hnsw:space", "l2")).lower()
+    out = []
+    for i in ids:
+        vec = emb[i]
+        out.append(float(cosine_to_distance(1.0 - float(vec @ q) / (np.linalg.norm(vec) or 1.0), space)))
+    return out
+
+def _fetch_documents(ids: List[str]) -> Dict[str, Any]:
+    """id -> (document, metadata) for hits that neither the dense result nor BM25 carried."""
+    engine = get_local_index()
+    got = engine.get(ids=ids) if engine is not None else get_collection().get(ids=ids, include=["documents", "metadatas"])
+    return {_id: (doc or "", meta or {}) for _id, doc, meta in
+            zip(got.get("ids") or [], got.get("documents") or [], got.get("metadatas") or [])}
+
+def lookup_references(query: str):
+    """
+    Exact hits for the citations / statute references in a query, or None.
+    shortcut=True when the query is (almost) nothing but references, so
+    dense search can be skipped.
+    """
+    index = get_reference_index()
+    if index is None:
+        return None
+    keys, residual = query_references(query)
+    if not keys:
+        return None
+    hits = index.lookup(keys, k=REFERENCE_TOP_K)
+    if not hits:
+        return None
+    if DEBUG:
+        print(f"[REFERENCE] {keys} -> {len(hits)} document(s)")
+    return {"keys": keys, "hits": hits, "shortcut": len(residual) <= REFERENCE_SHORTCUT_TOKENS}
+
+def embed_for_retrieval(queries: List[str]):
+    """
+    (embeddings, lookup_references results) for retrieve_batch_from_embeddings.
+    Queries answered by the reference index alone are not embedded (None).
+    """
+    references = [lookup_references(q) for q in queries]
+    needed = [i for i, found in enumerate(references) if not (found and found["shortcut"])]
+    q_embs: List[Any] = [None] * len(queries)
+    if needed:
+        for i, emb in zip(needed, embed_queries([queries[i] for i in needed])):
+            q_embs[i] = emb
+    return q_embs, references
+
+def is_reference_query(query: str) -> bool:
+    """True if retrieval for this query is answered by the reference index alone (no embedding needed)."""
+    found = lookup_references(query)
+    return bool(found and found["shortcut"])
+
+def fuse_lexical_results(query: str, q_emb, res: Dict[str, Any], top_k: int = TOP_K,
+                         references: Dict[str, Any] = None, allowed: set = None) -> Dict[str, Any]:
+    """
+    Reciprocal rank fusion of the dense result for one query with BM25 hits
+    and exact reference hits (lookup_references). With a reference shortcut
+    `res` and `q_emb` are None and only the reference hits are ranked.
+    allowed (facet filters) drops BM25 / reference hits outside that id set.
+    Returns a single-query Chroma-shaped result plus an 'rrf' score list;
+    `res` unchanged if there is nothing to fuse.
+    """
+    rankings: List[List[str]] = []
+    weights: List[float] = []
+    bodies: Dict[str, Any] = {}
+    shortcut = bool(references and references["shortcut"])
+    lexical = get_lexical_index()
+    hits = lexical.search(query, k=LEXICAL_TOP_K) if lexical is not None and not shortcut else []
+    if allowed is not None:
+        hits = [(row, score) for row, score in hits if lexical.ids[row] in allowed]
+    if hits:
+        rankings.append([lexical.ids[row] for row, _score in hits])
+        weights.append(1.0)
+        for row, _score in hits:
+            bodies[lexical.ids[row]] = (lexical.documents[row], lexical.metadatas[row])
+    if references:
+        rankings.append([_id for _id, _score in references["hits"] if allowed is None or _id in allowed])
+        weights.append(REFERENCE_WEIGHT)
+    if not rankings:
+        return res
+
+    docs: Dict[str, Dict[str, Any]] = {}
+    dense_ids: List[str] = []
+    if res is not None:
+        part = split_query_result(res, 0)
+        for key in ("ids", "documents", "metadatas", "distances"):
+            part[key] = (part.get(key) or [[]])[0] or []
+        for j, _id in enumerate(part["ids"]):
+            dense_ids.append(_id)
+            docs[_id] = {
+                "document": part["documents"][j] if j < len(part["documents"]) else "",
+                "metadata": part["metadatas"][j] if j < len(part["metadatas"]) else {},
+                "distance": part["distances"][j] if j < len(part["distances"]) else None,
+            }
+    new_ids = list(dict.fromkeys(i for ranking in rankings for i in ranking if i not in docs))
+    missing = [i for i in new_ids if i not in bodies]
+    if missing:
+        try:
+            bodies.update(_fetch_documents(missing))
+        except Exception as e:
+            print(f"Could not load documents for fused hits: {e}")
+    new_ids = [i for i in new_ids if i in bodies]
+    if new_ids:
+        if q_emb is None:
+            new_dists = [0.0] * len(new_ids)  # exact reference matches, nothing to measure against
+        else:
+            try:
+                new_dists = _dense_distances(q_emb, new_ids)
+            except Exception as e:
+                if DEBUG:
+                    print(f"[HYBRID] Could not score lexical-only hits densely: {e}")
+                known = [d["distance"] for d in docs.values() if d["distance"] is not None]
+                new_dists = [max(known) if known else 2.0] * len(new_ids)
+        for _id, dist in zip(new_ids, new_dists):
+            document, metadata = bodies[_id]
+            docs[_id] = {"document": document, "metadata": metadata, "distance": dist}
+
+    rankings = [[i for i in ranking if i in docs] for ranking in rankings]
+    fused = reciprocal_rank_fusion([dense_ids] + rankings, k=RRF_K,
+                                   weights=[1.0] + weights)[:max(top_k, len(dense_ids))]
+    if DEBUG:
+        print(f"[HYBRID] dense={len(dense_ids)} lexical={len(hits)} "
+              f"references={len(references['hits']) if references else 0} "
+              f"(new={len(new_ids)}) fused={len(fused)}")
+    return {
+        "ids": [[_id for _id, _ in fused]],
+        "documents": [[docs[_id]["document"] for _id, _ in fused]],
+        "metadatas": [[docs[_id]["metadata"] for _id, _ in fused]],
+        "distances": [[docs[_id]["distance"] for _id, _ in fused]],
+        "rrf": [[score for _, score in fused]],
+    }
+
+retrieval_stats = RetrievalStats()
+
+def needs_wider_k(part: Dict[str, Any], k: int, return_top: int) -> bool:
+    """
+    Adaptive k: should a single-query result fetched with `k` be re-fetched wider?
+    Yes if fewer than return_top candidates pass the filters, or if the k-th
+    distance is still within ADAPTIVE_K_MARGIN of the best (no clear top cluster).
+    """
+    ids = (part.get('ids') or [[]])[0] or []
+    if part.get('n_candidates', len(ids)) < k:
+        return False  # collection exhausted
+    docs = (part.get('documents') or [[]])[0]
+    metas = (part.get('metadatas') or [[]])[0] or [{}] * len(ids)
+    lengths = [safe_text_len(d) for d in docs] if docs else [stored_length(m) for m in metas]
+    survivors = sum(1 for n, m in zip(lengths, metas) if candidate_filter_reason(n, m) is None)
+    if survivors < return_top:
+        return True
+    dists = part.get('candidate_distances') or (part.get('distances') or [[]])[0] or []
+    dists = [float(d) for d in dists if d is not None]
+    return bool(dists) and max(dists) - min(dists) < ADAPTIVE_K_MARGIN
+
+def _has_documents(part: Dict[str, Any]) -> bool:
+    docs = part.get('documents')
+    return bool(docs) and docs[0] is not None
+
+def fetch_winner_documents(parts: List[Any], return_top: int, texts: Dict[str, str] = None,
+                           keyword_boost: List[str] = KEYWORD_BOOST):
+    """
+    Phase two of two-phase retrieval: for results fetched without bodies,
+    keep the best return_top * TWO_PHASE_OVERFETCH candidates (metadata
+    filters applied) and load their documents with one col.get per round for
+    all queries. Candidates are taken in distance order, or in final rerank
+    order when every one of them has stored rerank features. Another round
+    runs for queries where too few fetched bodies pass the length filter.
+    Updates `parts` in place; `texts` caches bodies across calls (adaptive rounds).
+    """
+    col = get_collection()
+    per_round = max(return_top, int(round(return_top * TWO_PHASE_OVERFETCH)))
+    version = feature_version(keyword_boost, PRIORITY_PHRASES, EXCERPT_CHAR_LIMIT)
+    state = {}
+    for i, part in enumerate(parts):
+        if part is None or _has_documents(part):
+            continue
+        ids = (part.get('ids') or [[]])[0] or []
+        metas = (part.get('metadatas') or [[]])[0] or [{}] * len(ids)
+        dists = (part.get('distances') or [[]])[0] or [None] * len(ids)
+        eligible = [j for j in range(len(ids))
+                    if candidate_filter_reason(stored_length(metas[j]), metas[j]) is None]
+        kw, ph, lengths, present = stored_features([metas[j] for j in eligible], version)
+        if eligible and present.all():
+            order, _ = rank_candidates(
+                np.asarray([float(dists[j]) if dists[j] is not None else float('inf') for j in eligible]),
+                kw, ph, lengths)
+            eligible = [eligible[o] for o in order.tolist()]
+        # Nothing passes the metadata filter: rerank_and_filter's unfiltered fallback still needs bodies
+        state[i] = {"ids": ids, "metas": metas, "dists": dists, "queue": eligible or list(range(len(ids))),
+                    "chosen": [], "kept": 0}
+
+    texts = {} if texts is None else texts
+    pending = [i for i in state if state[i]["queue"]]
+    while pending and col is not None:
+        wanted = []
+        for i in pending:
+            st = state[i]
+            batch, st["queue"] = st["queue"][:per_round - st["kept"]], st["queue"][per_round - st["kept"]:]
+            st["chosen"].extend(batch)
+            wanted.extend(st["ids"][j] for j in batch if st["ids"][j] not in texts)
+        wanted = list(dict.fromkeys(wanted))
+        if wanted:
+            got = col.get(ids=wanted, include=['documents'])
+            texts.update(zip(got.get('ids') or [], got.get('documents') or []))
+            retrieval_stats.record_fetch(len(wanted))
+        next_round = []
+        for i in pending:
+            st = state[i]
+            st["kept"] = sum(1 for j in st["chosen"]
+                             if candidate_filter_reason(safe_text_len(texts.get(st["ids"][j])), st["metas"][j]) is None)
+            if st["kept"] < return_top and st["queue"]:
+                next_round.append(i)
+        pending = next_round
+
+    for i, st in state.items():
+        chosen = sorted(st["chosen"])  # keep distance order
+        parts[i] = {
+            "ids": [[st["ids"][j] for j in chosen]],
+            "metadatas": [[st["metas"][j] for j in chosen]],
+            "distances": [[st["dists"][j] for j in chosen]],
+            "documents": [[texts.get(st["ids"][j], "") for j in chosen]],
+            # phase-one view, for the adaptive k check
+            "n_candidates": len(st["ids"]),
+            "candidate_distances": st["dists"],
+        }
+        if DEBUG:
+            print(f"[TWO-PHASE] fetched {len(chosen)}/{len(st['ids'])} document bodies")
+
+def _query_adaptive(queries: List[str], q_embs: List[Any], top_k: int, return_top: int,
+                    keyword_boost: List[str] = KEYWORD_BOOST, ids: List[str] = None):
+    """Per-query results, k and round count; queries that need more candidates are re-queried together."""
+    parts: List[Any] = [None] * len(queries)
+    ks = [0] * len(queries)
+    rounds = [0] * len(queries)
+    pending = list(range(len(queries)))
+    texts: Dict[str, str] = {}
+    k = max(1, min(ADAPTIVE_K_START, top_k))
+    while pending:
+        res = query_collection_batch([q_embs[i] for i in pending], top_k=k,
+                                     queries=[queries[i] for i in pending], include_documents=not TWO_PHASE,
+                                     ids=ids)
+        if res is None:
+            break  # keep whatever an earlier round returned
+        round_parts = [split_query_result(res, j) for j in range(len(pending))]
+        if TWO_PHASE:
+            fetch_winner_documents(round_parts, return_top, texts, keyword_boost=keyword_boost)
+        wider = []
+        for j, i in enumerate(pending):
+            parts[i] = round_parts[j]
+            ks[i] = k
+            rounds[i] += 1
+            if k < top_k and needs_wider_k(parts[i], k, return_top):
+                wider.append(i)
+        pending = wider
+        k = min(k * 2, top_k)
+    if DEBUG:
+        print(f"[ADAPTIVE] k per query: {ks} (rounds: {rounds})")
+    return parts, ks, rounds
+
+def retrieve_from_embedding(query: str,
+                            q_emb,
+                            top_k: int = TOP_K,
+                            keyword_boost: List[str] = KEYWORD_BOOST,
+                            return_top: int = RETURN_TOP,
+                            filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """Query + rerank for an already-computed query embedding (blocking I/O)."""
+    return retrieve_batch_from_embeddings([query], [q_emb], top_k=top_k, keyword_boost=keyword_boost,
+                                          return_top=return_top, filters=filters)[0]
+
+def retrieve_batch_from_embeddings(queries: List[str],
+                                   q_embs: List[Any],
+                                   top_k: int = TOP_K,
+                                   keyword_boost: List[str] = KEYWORD_BOOST,
+                                   return_top: int = RETURN_TOP,
+                                   filters: Dict[str, Any] = None,
+                                   references: List[Any] = None) -> List[List[Dict[str, Any]]]:
+    """
+    One Chroma round trip for all embeddings (per adaptive round), then per-query rerank; results in input order.
+    Queries answered by the reference index alone skip the dense query (their embedding may be None).
+    filters (court / judge / date_from / date_to / citation) restrict every query to matching documents.
+    references: lookup_references() per query when the caller already has them (embed_for_retrieval).
+    """
+    if not queries:
+        return []
+    started = time.perf_counter()
+    allowed_ids = facet_filter_ids(filters)
+    if allowed_ids is not None and not allowed_ids:
+        return [[] for _ in queries]
+    allowed = set(allowed_ids) if allowed_ids is not None else None
+    if references is None:
+        references = [lookup_references(q) for q in queries]
+    dense = [i for i, found in enumerate(references) if not (found and found["shortcut"])]
+    q_embs = list(q_embs)
+    for i in dense:
+        if q_embs[i] is None:
+            q_embs[i] = embed_query(queries[i])
+
+    parts: List[Any] = [None] * len(queries)
+    ks: List[int] = []
+    rounds: List[int] = []
+    if dense:
+        dense_queries = [queries[i] for i in dense]
+        dense_embs = [q_embs[i] for i in dense]
+        if ADAPTIVE_K:
+            dense_parts, ks, rounds = _query_adaptive(dense_queries, dense_embs, top_k, return_top,
+                                                      keyword_boost=keyword_boost, ids=allowed_ids)
+        else:
+            res = query_collection_batch(dense_embs, top_k=top_k, queries=dense_queries,
+                                         include_documents=not TWO_PHASE, ids=allowed_ids)
+            dense_parts = [split_query_result(res, j) if res is not None else None for j in range(len(dense))]
+            ks, rounds = [top_k] * len(dense), [1] * len(dense)
+            if TWO_PHASE:
+                fetch_winner_documents(dense_parts, return_top, keyword_boost=keyword_boost)
+        for i, part in zip(dense, dense_parts):
+            parts[i] = part
+
+    results = []
+    for i, query in enumerate(queries):
+        if references[i] is not None:
+            retrieval_stats.record_reference(references[i]["shortcut"])
+        part = fuse_lexical_results(query, q_embs[i], parts[i], top_k=top_k, references=references[i],
+                                    allowed=allowed)
+        results.append(rerank_and_filter(part, keyword_boost=keyword_boost, return_top=return_top)
+                       if part is not None else [])
+    # One sample per call: the queries of a batch share one Chroma round trip
+    retrieval_stats.record_latency(time.perf_counter() - started, len(queries))
+    for k, n_rounds in zip(ks, rounds):
+        retrieval_stats.record(k, n_rounds)
+    return results
+
+def retrieve_and_filter_batch(queries: List[str],
+                              top_k: int = TOP_K,
+                              keyword_boost: List[str] = KEYWORD_BOOST,
+                              return_top: int = RETURN_TOP,
+                              filters: Dict[str, Any] = None) -> List[List[Dict[str, Any]]]:
+    """Batched retrieve_and_filter: one model.encode call and one col.query for all queries."""
+    try:
+        q_embs, references = embed_for_retrieval(queries)
+    except ResourceUnavailable:
+        print("Error: Model not initialized.")
+        return [[] for _ in queries]
+    return retrieve_batch_from_embeddings(queries, q_embs, top_k=top_k, keyword_boost=keyword_boost,
+                                          return_top=return_top, filters=filters, references=references)
+
+def retrieve_and_filter(query: str,
+                        top_k: int = TOP_K,
+                        keyword_boost: List[str] = KEYWORD_BOOST,
+                        return_top: int = RETURN_TOP,
+                        filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    if get_local_index() is None and get_collection() is None:
+        print("Error: Collection not initialized.")
+        return []
+    return retrieve_and_filter_batch([query], top_k=top_k, keyword_boost=keyword_boost,
+                                     return_top=return_top, filters=filters)[0]
 
 # ---------------------------
 # Prompt assembly functions
@@ -336,9 +1407,8 @@ def build_evidence_enumeration(evidences: List[Dict[str, Any]]) -> str:
     """
     parts = []
     for i, e in enumerate(evidences, start=1):
-        md = e.get('meta', {})
         doc_id = e.get('id') or f"local-{i}"
-        excerpt = (e.get('text') or "")[:EXCERPT_CHAR_LIMIT].strip().replace("\n", " ")
+        excerpt = evidence_excerpt(e)
         parts.append(f"[{i}] doc_id={doc_id} source=[REDACTED]\n{excerpt}\n")
     return "\n\n".join(parts)
 
@@ -374,101 +1444,189 @@ def build_strict_rag_prompt(query: str, evidences: List[Dict[str, Any]]) -> str:
 # ---------------------------
 # Metadata extraction
 # ---------------------------
-def extract_case_metadata(text: str) -> Dict[str, str]:
+# Built once over the collection by build_case_metadata.py; the query path is a dict lookup
+case_metadata_index = CaseMetadataIndex(CASE_METADATA_PATH)
+
+def case_metadata_for(evidence: Dict[str, Any]) -> Dict[str, str]:
     """
-    Try to extract case metadata: parties, PLD/SCMR citations, judgment date,
-    judge name, court name, statute/clause references.
-    This is heuristic — it returns what it finds, or empty dict keys if none.
+    Case metadata for one evidence from the persisted index (keyed by
+    parent_id / id); documents missing from it are extracted on the fly
+    and kept in memory.
     """
-    out = {}
-    snippet = (text or "")[:35000]  # large snippet to search
-
-    # PLD / SCMR / date heuristics
-    for k, rx in CASE_FIELDS_REGEX.items():
-        m = rx.search(snippet)
-        if m:
-            out[k] = m.group(0).strip()
-
-    # Parties (try to find 'X v. Y' near top)
-    header_lines = snippet.splitlines()[:80]
-    header_text = " ".join(header_lines)
-    m = re.search(r'([A-Z][\w\.\-\,\s]{1,120}?)\s+(?:v\.|vs\.|versus|v)\s+([A-Z][\w\.\-\,\s]{1,120}?)', header_text)
-    if m:
-        out['parties'] = m.group(0).strip()
-
-    # Judgment date (text or numeric)
-    m = re.search(r'\bJudgment\s+dated[:\s]*([A-Za-z]+\s+\d{1,2},\s*\d{4})', snippet, re.IGNORECASE)
-    if m:
-        out['judgment_date'] = m.group(1).strip()
-    else:
-        m2 = re.search(r'\b(?:Dated|Date of judgment|Judgment Date)[:\s]*([0-9]{1,2}[\/\-][0-9]{1,2}[\/\-][0-9]{2,4})', snippet, re.IGNORECASE)
-        if m2:
-            out['judgment_date'] = m2.group(1).strip()
-
-    # Judge detection: common patterns
-    judge_patterns = [
-        r'Hon(?:\'ble)?\s+Mr\.?\s+Justice\s+([A-Z][A-Za-z\-\s\.]+)',
-        r'Hon(?:\'ble)?\s+Mr?\.?\s+Justice\s+([A-Z][A-Za-z\-\s\.]+)',
-        r'J(?:ustice)?\.\s+([A-Z][A-Za-z\-\s\.]+)',
-        r'Before\s+Mr\.?\s+Justice\s+([A-Z][A-Za-z\-\s\.]+)',
-        r'Coram[:\s]+([A-Z][A-Za-z\-\s\,\.\s]+)'
-    ]
-    for p in judge_patterns:
-        m = re.search(p, header_text, re.IGNORECASE)
-        if m:
-            out['judge'] = m.group(1).strip()
-            break
-
-    # Court detection
-    court_patterns = [
-        r'(?:(?:Lahore High Court)|(?:Sindh High Court)|(?:Supreme Court of Pakistan)|(?:High Court of [A-Za-z]+))',
-        r'\bHigh Court\b', r'\bDistrict Court\b', r'\bCivil Court\b'
-    ]
-    for p in court_patterns:
-        m = re.search(p, snippet, re.IGNORECASE)
-        if m:
-            out['court'] = m.group(0).strip()
-            break
-
-    # Statute/clause references
-    clause_patterns = [
-        r'\bSection\s+\d+[A-Za-z0-9\-]*', r'\bSec\.\s*\d+', r'\bClause\s+\d+',
-        r'\bOrder\s+XXI\s+Rule\s+\d+', r'\bOrder\s+[IVXLCDM]+\b', r'\bArticle\s+\d+'
-    ]
-    clauses_found = set()
-    for p in clause_patterns:
-        for m in re.finditer(p, snippet, re.IGNORECASE):
-            clauses_found.add(m.group(0).strip())
-    if clauses_found:
-        out['clauses'] = "; ".join(sorted(clauses_found))
-
-    return out
+    key = str(evidence.get('parent_id') or evidence.get('id') or "")
+    md = case_metadata_index.get(key) if key else None
+    if md is None:
+        md = extract_case_metadata(evidence.get('text', ''))
+        if key:
+            case_metadata_index.update({key: md})
+    return md
+
+def build_case_metadata_index(workers: int = CASE_METADATA_WORKERS, page_size: int = 1000,
+                              force: bool = False) -> Dict[str, int]:
+    """
+    Run extract_case_metadata over every document with a process pool and
+    persist the results to CASE_METADATA_PATH. Without force, cases already
+    in the index are skipped.
+    """
+    ids, documents, metadatas = _all_documents(page_size)
+    cases = list(group_by_parent(ids, documents, metadatas))
+    todo = [(key, text) for key, text in cases if force or key not in case_metadata_index]
+    started = time.perf_counter()
+    results = build_case_metadata([text for _key, text in todo], workers=workers or None)
+    case_metadata_index.update({key: md for (key, _text), md in zip(todo, results)})
+    dropped = case_metadata_index.retain(key for key, _text in cases)
+    case_metadata_index.save()
+    print(f"Case metadata: {len(todo)}/{len(cases)} cases extracted in {time.perf_counter() - started:.1f}s, "
+          f"{dropped} removed -> {CASE_METADATA_PATH}")
+    return {"cases": len(cases), "extracted": len(todo), "removed": dropped}
 
 # ---------------------------
 # Gemini caller (robust multi-shape handling)
 # ---------------------------
-def call_gemini_chat(prompt_text: str, model: str = GEMINI_MODEL, temperature: float = 0.0, max_tokens: int = 1600) -> str:
+prompt_cache = PromptCache(
+    max_size=PROMPT_CACHE_SIZE,
+    ttl_seconds=PROMPT_CACHE_TTL,
+    path=PROMPT_CACHE_PATH,
+    max_disk_rows=PROMPT_CACHE_DISK_ROWS,
+)
+
+def _prompt_cacheable(temperature: float, use_cache: bool) -> bool:
+    # Only (near-)deterministic calls are cached; sampled generations should vary
+    return use_cache and float(temperature) <= PROMPT_CACHE_MAX_TEMPERATURE
+
+async def _prompt_cache_io(executor, fn, *args):
+    """Prompt cache call (SQLite tier) on `executor`; the API passes its bounded retrieval pool."""
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+def _generation_config(temperature: float, max_tokens: int):
+    """Build a generation config for google-genai, or None if the SDK has no config type."""
+    types = getattr(genai, "types", None)
+    for name in ("GenerateContentConfig", "GenerationConfig"):
+        if types is not None and hasattr(types, name):
+            return getattr(types, name)(
+                temperature=float(temperature),
+                max_output_tokens=int(max_tokens),
+            )
+    return None
+
+def extract_response_text(response) -> str:
+    """Extract the generated text from the several response shapes google-genai may return."""
+    text_output = None
+
+    # direct .text
+    if hasattr(response, "text") and response.text:
+        text_output = response.text
+
+    # typed .response
+    if not text_output and hasattr(response, "response") and response.response:
+        text_output = getattr(response, "response")
+
+    # typed candidates
+    if not text_output and hasattr(response, "candidates"):
+        try:
+            cands = getattr(response, "candidates")
+            if isinstance(cands, (list, tuple)) and len(cands) > 0:
+                first = cands[0]
+                if hasattr(first, "content") and hasattr(first.content, "parts"):
+                    parts = getattr(first.content, "parts")
+                    collected = []
+                    for p in parts:
+                        if hasattr(p, "text"):
+                            collected.append(getattr(p, "text"))
+                        else:
+                            collected.append(str(p))
+                    text_output = "".join(collected).strip()
+                elif isinstance(first, dict):
+                    text_output = first.get("content") or first.get("text") or first.get("output")
+                else:
+                    text_output = str(first)
+        except Exception:
+            if DEBUG:
+                print("[DEBUG] extracting from response.candidates failed")
+
+    # outputs / output
+    if not text_output and (hasattr(response, "outputs") or hasattr(response, "output")):
+        out = getattr(response, "outputs", None) or getattr(response, "output", None)
+        try:
+            if isinstance(out, (list, tuple)):
+                parts = []
+                for b in out:
+                    if isinstance(b, dict):
+                        parts.append(b.get("text") or b.get("content") or "")
+                    elif hasattr(b, "text"):
+                        parts.append(getattr(b, "text"))
+                    else:
+                        parts.append(str(b))
+                text_output = "\n".join(p for p in parts if p).strip()
+            elif isinstance(out, str):
+                text_output = out
+        except Exception:
+            if DEBUG:
+                print("[DEBUG] extracting from outputs failed")
+
+    # dict-like top-level
+    if not text_output and isinstance(response, dict):
+        if "text" in response:
+            text_output = response.get("text")
+        elif "candidates" in response and response["candidates"]:
+            first = response["candidates"][0]
+            if isinstance(first, dict):
+                text_output = first.get("content") or first.get("text") or first.get("output")
+        elif "output" in response:
+            out = response["output"]
+            if isinstance(out, str):
+                text_output = out
+            elif isinstance(out, list):
+                parts = []
+                for b in out:
+                    if isinstance(b, dict):
+                        parts.append(b.get("text") or b.get("content") or "")
+                    else:
+                        parts.append(str(b))
+                text_output = "\n".join(p for p in parts if p).strip()
+
+    # final fallback
+    if not text_output:
+        try:
+            text_output = str(response)
+        except Exception:
+            text_output = None
+
+    if not text_output:
+        raise RuntimeError("No usable text returned from Gemini client. Enable DEBUG for raw response details.")
+
+    return str(text_output)
+
+def call_gemini_chat(prompt_text: str, model: str = GEMINI_MODEL, temperature: float = 0.0, max_tokens: int = 1600,
+                     use_cache: bool = True) -> str:
     """
     Robust Gemini caller:
+    - serves identical (prompt, model, temperature, max_tokens) calls from prompt_cache,
     - tries to call with a GenerationConfig if available,
     - falls back to a simple call without config,
     - extracts text from several response shapes.
     """
+    cacheable = _prompt_cacheable(temperature, use_cache)
+    if cacheable:
+        cached = prompt_cache.get(prompt_text, model, temperature, max_tokens)
+        if cached is not None:
+            if DEBUG:
+                print("[DEBUG] Gemini response served from prompt cache")
+            return cached
+
     try:
         if DEBUG:
             print("\n[DEBUG] Calling Gemini model:", model)
             print("[DEBUG] prompt (first 400 chars):", prompt_text[:400].replace("\n", " "))
 
+        client = get_gemini_client()
         response = None
         last_err = None
 
-        # 1) Try with GenerationConfig if genai.types exists
+        # 1) Try with a generation config if genai.types exists
         try:
-            if hasattr(genai, "types") and hasattr(genai.types, "GenerationConfig"):
-                cfg = genai.types.GenerationConfig(
-                    temperature=float(temperature),
-                    max_output_tokens=int(max_tokens),
-                )
+            cfg = _generation_config(temperature, max_tokens)
+            if cfg is not None:
                 response = client.models.generate_content(model=model, contents=[prompt_text], config=cfg)
         except Exception as e:
             last_err = e
@@ -500,125 +1658,136 @@ def call_gemini_chat(prompt_text: str, model: str = GEMINI_MODEL, temperature: f
             raise RuntimeError(f"No response from Gemini client (last error: {last_err})")
 
         # 3) Extract text from known shapes
-        text_output = None
+        text_output = extract_response_text(response)
+        if cacheable:
+            prompt_cache.put(prompt_text, model, temperature, max_tokens, text_output)
+        return text_output
 
-        # direct .text
-        if hasattr(response, "text") and response.text:
-            text_output = response.text
+    except Exception as exc:
+        print("Gemini API call failed:", exc)
+        raise
 
-        # typed .response
-        if not text_output and hasattr(response, "response") and response.response:
-            text_output = getattr(response, "response")
+async def call_gemini_chat_async(prompt_text: str, model: str = GEMINI_MODEL, temperature: float = 0.0, max_tokens: int = 1600,
+                                 use_cache: bool = True, executor=None) -> str:
+    """
+    Non-blocking Gemini caller using the google-genai `client.aio` surface.
+    Same prompt cache, config fallback and response handling as call_gemini_chat().
+    Prompt cache reads/writes run on `executor` (default: the loop's default executor).
+    """
+    cacheable = _prompt_cacheable(temperature, use_cache)
+    if cacheable:
+        cached = await _prompt_cache_io(executor, prompt_cache.get, prompt_text, model, temperature, max_tokens)
+        if cached is not None:
+            return cached
 
-        # typed candidates
-        if not text_output and hasattr(response, "candidates"):
-            try:
-                cands = getattr(response, "candidates")
-                if isinstance(cands, (list, tuple)) and len(cands) > 0:
-                    first = cands[0]
-                    if hasattr(first, "content") and hasattr(first.content, "parts"):
-                        parts = getattr(first.content, "parts")
-                        collected = []
-                        for p in parts:
-                            if hasattr(p, "text"):
-                                collected.append(getattr(p, "text"))
-                            else:
-                                collected.append(str(p))
-                        text_output = "".join(collected).strip()
-                    elif isinstance(first, dict):
-                        text_output = first.get("content") or first.get("text") or first.get("output")
-                    else:
-                        text_output = str(first)
-            except Exception:
-                if DEBUG:
-                    print("[DEBUG] extracting from response.candidates failed")
+    try:
+        if DEBUG:
+            print("\n[DEBUG] Calling Gemini model (async):", model)
 
-        # outputs / output
-        if not text_output and (hasattr(response, "outputs") or hasattr(response, "output")):
-            out = getattr(response, "outputs", None) or getattr(response, "output", None)
-            try:
-                if isinstance(out, (list, tuple)):
-                    parts = []
-                    for b in out:
-                        if isinstance(b, dict):
-                            parts.append(b.get("text") or b.get("content") or "")
-                        elif hasattr(b, "text"):
-                            parts.append(getattr(b, "text"))
-                        else:
-                            parts.append(str(b))
-                    text_output = "\n".join(p for p in parts if p).strip()
-                elif isinstance(out, str):
-                    text_output = out
-            except Exception:
-                if DEBUG:
-                    print("[DEBUG] extracting from outputs failed")
-
-        # dict-like top-level
-        if not text_output and isinstance(response, dict):
-            if "text" in response:
-                text_output = response.get("text")
-            elif "candidates" in response and response["candidates"]:
-                first = response["candidates"][0]
-                if isinstance(first, dict):
-                    text_output = first.get("content") or first.get("text") or first.get("output")
-            elif "output" in response:
-                out = response["output"]
-                if isinstance(out, str):
-                    text_output = out
-                elif isinstance(out, list):
-                    parts = []
-                    for b in out:
-                        if isinstance(b, dict):
-                            parts.append(b.get("text") or b.get("content") or "")
-                        else:
-                            parts.append(str(b))
-                    text_output = "\n".join(p for p in parts if p).strip()
+        client = get_gemini_client()
+        response = None
+        last_err = None
 
-        # final fallback
-        if not text_output:
+        try:
+            cfg = _generation_config(temperature, max_tokens)
+            if cfg is not None:
+                response = await client.aio.models.generate_content(model=model, contents=[prompt_text], config=cfg)
+        except Exception as e:
+            last_err = e
+            if DEBUG:
+                print("[DEBUG] async config-based call failed:", repr(e))
+            response = None
+
+        if response is None:
             try:
-                text_output = str(response)
-            except Exception:
-                text_output = None
+                response = await client.aio.models.generate_content(model=model, contents=[prompt_text])
+            except Exception as e:
+                last_err = e
+                response = None
 
-        if not text_output:
-            raise RuntimeError("No usable text returned from Gemini client. Enable DEBUG for raw response details.")
+        if response is None:
+            raise RuntimeError(f"No response from Gemini client (last error: {last_err})")
 
-        return str(text_output)
+        text_output = extract_response_text(response)
+        if cacheable:
+            await _prompt_cache_io(executor, prompt_cache.put, prompt_text, model, temperature, max_tokens, text_output)
+        return text_output
 
     except Exception as exc:
         print("Gemini API call failed:", exc)
         raise
 
+async def stream_gemini_chat_async(prompt_text: str, model: str = GEMINI_MODEL, temperature: float = 0.0, max_tokens: int = 1600,
+                                   use_cache: bool = True, executor=None):
+    """
+    Async generator yielding answer text chunks as Gemini produces them
+    (google-genai generate_content_stream on the `client.aio` surface).
+    A prompt cache hit is yielded as a single chunk; completed streams are cached
+    (prompt cache I/O on `executor`, as in call_gemini_chat_async).
+    """
+    cacheable = _prompt_cacheable(temperature, use_cache)
+    if cacheable:
+        cached = await _prompt_cache_io(executor, prompt_cache.get, prompt_text, model, temperature, max_tokens)
+        if cached is not None:
+            yield cached
+            return
+
+    if DEBUG:
+        print("\n[DEBUG] Streaming Gemini model:", model)
+
+    client = get_gemini_client()
+    cfg = _generation_config(temperature, max_tokens)
+    if cfg is not None:
+        stream = await client.aio.models.generate_content_stream(model=model, contents=[prompt_text], config=cfg)
+    else:
+        stream = await client.aio.models.generate_content_stream(model=model, contents=[prompt_text])
+
+    chunks = []
+    async for chunk in stream:
+        text = getattr(chunk, "text", None)
+        if text:
+            chunks.append(text)
+            yield text
+
+    if cacheable and chunks:
+        await _prompt_cache_io(executor, prompt_cache.put, prompt_text, model, temperature, max_tokens, "".join(chunks))
+
 # ---------------------------
 # Chat History Management
 # ---------------------------
-HISTORY_FILE = "chat_history.json"
+HISTORY_FILE = "chat_history.json"        # snapshot (legacy format: JSON list)
+HISTORY_LOG_FILE = "chat_history.jsonl"   # append-only log since the last compaction
+HISTORY_COMPACT_BYTES = int(os.environ.get("HISTORY_COMPACT_BYTES", str(256 * 1024)))
 
-def load_history() -> List[Dict[str, str]]:
-    """Load chat history from file."""
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return []
-    return []
+history_log = JsonlHistoryLog(HISTORY_FILE, HISTORY_LOG_FILE, compact_bytes=HISTORY_COMPACT_BYTES)
+atexit.register(history_log.close)
+
+def load_history(tail: int = None) -> List[Dict[str, str]]:
+    """Load chat history (snapshot + log); only the last `tail` messages if given."""
+    try:
+        return history_log.load(tail)
+    except Exception:
+        return []
 
 def save_history(history: List[Dict[str, str]]):
-    """Save chat history to file."""
+    """Replace the saved chat history with `history`."""
     try:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        history_log.rewrite(history)
     except Exception as e:
         print(f"Warning: Could not save history: {e}")
 
 def add_to_history(history: List[Dict[str, str]], role: str, content: str):
-    """Add a message to history."""
-    history.append({"role": role, "content": content})
-    save_history(history)
+    """Add a message to history (appended to the log, not a full rewrite)."""
+    message = {"role": role, "content": content}
+    history.append(message)
+    try:
+        history_log.append(message)
+    except Exception as e:
+        print(f"Warning: Could not save history: {e}")
 
-def format_history_for_prompt(history: List[Dict[str, str]], max_history: int = 5) -> str:
+HISTORY_PROMPT_MESSAGES = 10  # user/assistant messages included by format_history_for_prompt()
+
+def format_history_for_prompt(history: List[Dict[str, str]], max_history: int = HISTORY_PROMPT_MESSAGES // 2) -> str:
     """Format recent chat history for inclusion in prompt."""
     if not history:
         return ""
@@ -633,8 +1802,7 @@ def format_history_for_prompt(history: List[Dict[str, str]], max_history: int =
 
 def clear_history():
     """Clear all chat history."""
-    if os.path.exists(HISTORY_FILE):
-        os.remove(HISTORY_FILE)
+    history_log.clear()
     print("Chat history cleared.")
 
 # ---------------------------
@@ -1338,8 +2506,6 @@ def generate_pdf_from_history(history: List[Dict[str, str]], doc_type: str = Non
 # CLI main flow
 # ---------------------------
 def main():
-    history = load_history()
-    
     if len(sys.argv) > 1:
         command = sys.argv[1].lower()
         
@@ -1347,6 +2513,7 @@ def main():
             clear_history()
             return
         elif command == "--show-history":
+            history = load_history()
             if history:
                 print("\n--- CHAT HISTORY ---")
                 for i, msg in enumerate(history, 1):
@@ -1361,6 +2528,7 @@ def main():
                 print("No chat history found.")
             return
         elif command == "--generate-pdf":
+            history = load_history()
             if not history:
                 print("No chat history found. Have a conversation first.")
                 return
@@ -1410,6 +2578,12 @@ def main():
     else:
         query = "How to draft a notice for breach of contract (payment overdue)?"
 
+    # Load the model, Chroma and Gemini concurrently while the query is prepared
+    start_background_init()
+
+    # Only the recent window used by format_history_for_prompt() is read
+    history = load_history(tail=HISTORY_PROMPT_MESSAGES)
+
     print("\nQuery:", query)
     add_to_history(history, "user", query)
     
@@ -1422,7 +2596,7 @@ def main():
 
     # Print metadata extracted for each evidence (helpful to know if judge/court info exists)
     for idx, ev in enumerate(evidences, start=1):
-        md = extract_case_metadata(ev.get('text', ''))
+        md = case_metadata_for(ev)
         if md:
             print(f"[METADATA] Evidence {idx} -> {md}")
         else:
@@ -1454,7 +2628,7 @@ def main():
     print("\n--- FINAL RAG ANSWER (clean) ---\n")
     print(final_answer)
     print("\nFinal answer saved to final_answer.txt")
-    print(f"Chat history: {len(history)} messages")
+    print(f"Chat history updated: {HISTORY_LOG_FILE}")
 
 if __name__ == "__main__":
     main()
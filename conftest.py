@@ -0,0 +1,104 @@
+"""
+pytest setup for the test_rag_*.py suites.
+
+chroma_test and backend_api read their configuration from the environment
+at import time; point every persisted path at a scratch directory so the
+tests never touch the local ChromaDB, caches or chat history. The older
+test_*.py files are manual scripts against a live deployment and are not
+collected.
+"""
+
+import os
+import tempfile
+
+_SCRATCH = tempfile.mkdtemp(prefix="rag-tests-")
+
+for key, value in {
+    "CHROMA_DB_DIR": os.path.join(_SCRATCH, "chroma"),
+    "ANSWER_CACHE_PATH": "",
+    "PROMPT_CACHE_PATH": "",
+    "RAG_SNAPSHOT_DIR": "",
+    "RAG_CASE_METADATA_PATH": "",
+    "HISTORY_DB_PATH": os.path.join(_SCRATCH, "chat_history.db"),
+    "CHROMA_PROBE_INTERVAL": "0",
+}.items():
+    os.environ[key] = value
+for key in ("CHROMA_API_KEY", "CHROMA_TENANT", "CHROMA_DATABASE", "GEMINI_API_KEY"):
+    os.environ.pop(key, None)
+
+collect_ignore = [
+    "test_api.py", "test_chatbot_api.py", "test_chroma_cloud.py", "test_chroma_credentials.py",
+    "test_different_documents.py", "test_import.py", "test_improved_pdf.py", "test_railway_api.py",
+    "test_retrieval.py",
+]
+
+
+# ---------------------------
+# Shared fixtures
+# ---------------------------
+import hashlib  # noqa: E402
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+TOPIC_WORDS = {
+    "criminal_law": "bail murder accused prosecution fir trial conviction sentence police".split(),
+    "family_law": "khula divorce maintenance custody dower nikah wife husband guardian".split(),
+    "contract_law": "contract breach cheque payment notice demand damages agreement recovery".split(),
+}
+FILLER = "the court held that learned counsel submitted record perused order".split()
+
+
+class HashEncoder:
+    """Stand-in for the SentenceTransformer: normalized hashed bag of words (32 dims)."""
+
+    dim = 32
+
+    def encode(self, texts, convert_to_numpy=True, **_kwargs):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in str(text).lower().split():
+                out[row, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1.0, norms)
+
+
+def make_corpus(per_topic=20, seed=0, lang="en"):
+    """(ids, documents, metadatas) of synthetic judgments spread over TOPIC_WORDS."""
+    rng = np.random.default_rng(seed)
+    ids, docs, metas = [], [], []
+    for topic, words in TOPIC_WORDS.items():
+        for i in range(per_topic):
+            text = " ".join(rng.choice(words if rng.random() < 0.6 else FILLER) for _ in range(40))
+            ids.append(f"{topic}-{i}")
+            docs.append(text)
+            metas.append({"topic": topic, "lang": lang})
+    return ids, docs, metas
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """
+    chroma_test wired to a fresh local Chroma collection (make_corpus) and
+    the HashEncoder, through a private ResourceManager.
+    """
+    import chromadb
+    import chroma_test as ct
+    from rag_resources import ResourceManager
+
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+    col = client.create_collection(ct.COLLECTION)
+    encoder = HashEncoder()
+    ids, docs, metas = make_corpus()
+    col.add(ids=ids, documents=docs, metadatas=metas, embeddings=encoder.encode(docs).tolist())
+
+    manager = ResourceManager()
+    manager.register("model", lambda: encoder)
+    manager.register("collection", lambda: col)
+    manager.register("gemini", lambda: object())
+    monkeypatch.setattr(ct, "resources", manager)
+    monkeypatch.setattr(ct, "DEBUG", False)
+    ct.embedding_cache.clear()
+    ct.pipeline_client = client
+    yield ct
+    ct.embedding_cache.clear()
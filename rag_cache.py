@@ -0,0 +1,559 @@
+"""
+In-process caches for the RAG pipeline.
+
+- LRUCache: thread-safe LRU with optional TTL and hit/miss counters
+- EmbeddingCache: query embeddings keyed on (model name, normalized query)
+- SemanticAnswerCache: answers for near-duplicate questions with the same evidence
+- PromptCache: exact prompt -> response cache (memory LRU in front of SQLite)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded LRU cache with optional time-to-live.
+
+    max_size <= 0 disables caching; ttl_seconds <= 0 means entries never expire.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 0.0):
+        self.max_size = int(max_size)
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and (now - stored_at) > self.ttl_seconds
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, stored_at = item
+            if self._expired(stored_at, now):
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold and collapse whitespace so trivially different retries share a key."""
+    return _WS_RE.sub(" ", (query or "").strip().lower())
+
+
+class EmbeddingCache(LRUCache):
+    """
+    Query-embedding cache. Values are read-only float32 numpy vectors so a
+    cached embedding can be shared between requests without copying.
+    """
+
+    def key(self, model_name: str, query: str) -> tuple:
+        return (model_name, normalize_query(query))
+
+    def get_embedding(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        return self.get(self.key(model_name, query))
+
+    def put_embedding(self, model_name: str, query: str, embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if not vec.flags.owndata:
+            vec = vec.copy()
+        vec.setflags(write=False)
+        self.put(self.key(model_name, query), vec)
+        return vec
+
+    def encode(self, model_name: str, queries: Sequence[str],
+               encode_fn: Callable[[List[str]], Any]) -> List[np.ndarray]:
+        """
+        Return embeddings for `queries`, calling encode_fn once with only the
+        cache misses (deduplicated by normalized text).
+        """
+        out: List[Optional[np.ndarray]] = [None] * len(queries)
+        pending: Dict[tuple, List[int]] = {}
+        for i, q in enumerate(queries):
+            k = self.key(model_name, q)
+            vec = self.get(k)
+            if vec is not None:
+                out[i] = vec
+            else:
+                pending.setdefault(k, []).append(i)
+
+        if pending:
+            keys = list(pending.keys())
+            texts = [queries[pending[k][0]] for k in keys]
+            encoded = np.asarray(encode_fn(texts), dtype=np.float32)
+            if encoded.ndim == 1:
+                encoded = encoded.reshape(1, -1)
+            for k, text, row in zip(keys, texts, encoded):
+                vec = self.put_embedding(model_name, text, row)
+                for i in pending[k]:
+                    out[i] = vec
+        return out
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache for near-duplicate questions.
+
+    An entry is served when the new query's embedding has cosine similarity
+    >= threshold with a cached query AND retrieval returned the same evidence
+    ids in the same order (answers cite evidence by position: [1], [2], ...).
+    Entries are evicted LRU / by age and persisted to a JSON file so they
+    survive restarts. Call invalidate() when the collection changes.
+
+    The file is shared by every process using the same path (API workers,
+    the CLI, the uploader). It carries a `generation` (time of the last
+    invalidation): invalidate() writes an empty file with a new generation,
+    and the other processes notice it (checked at most every sync_interval
+    seconds on lookup, and before every save), drop their entries and never
+    write the stale ones back.
+    """
+
+    def __init__(self, max_size: int = 512, ttl_seconds: float = 86400.0,
+                 threshold: float = 0.92, path: Optional[str] = None,
+                 save_interval: float = 30.0, sync_interval: float = 5.0):
+        self.max_size = int(max_size)
+        self.ttl_seconds = float(ttl_seconds)
+        self.threshold = float(threshold)
+        self.path = path or None
+        self.save_interval = float(save_interval)
+        self.sync_interval = float(sync_interval)
+        self.collection_stamp: Optional[str] = None
+        self.generation = 0.0          # time of the last invalidation this process knows of
+        self._file_mtime: Optional[int] = None
+        self._last_sync = time.monotonic()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._by_evidence: Dict[tuple, List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.remote_invalidations = 0
+        if self.path:
+            self._load()
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl_seconds > 0 and (now - entry["created"]) > self.ttl_seconds
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        ids = self._by_evidence.get(entry["evidence"], [])
+        if entry_id in ids:
+            ids.remove(entry_id)
+        if not ids:
+            self._by_evidence.pop(entry["evidence"], None)
+        self._dirty = True
+
+    def _insert(self, entry: Dict[str, Any]):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        self._by_evidence.setdefault(entry["evidence"], []).append(entry_id)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def lookup(self, embedding, evidence_ids: Sequence[str]) -> Optional[str]:
+        """Return a cached answer for a near-duplicate query with identical evidence, else None."""
+        key = tuple(evidence_ids)
+        self._sync()
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for entry_id in list(self._by_evidence.get(key, [])):
+                entry = self._entries[entry_id]
+                if self._expired(entry, now):
+                    self._remove(entry_id)
+                    self.evictions += 1
+                else:
+                    candidates.append(entry_id)
+            if not candidates:
+                self.misses += 1
+                return None
+            q = self._unit(embedding)
+            matrix = np.stack([self._entries[i]["embedding"] for i in candidates])
+            sims = matrix @ q
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.threshold:
+                self.misses += 1
+                return None
+            entry_id = candidates[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id]["answer"]
+
+    def store(self, query: str, embedding, evidence_ids: Sequence[str], answer: str):
+        if self.max_size <= 0 or not answer:
+            return
+        entry = {
+            "query": query,
+            "embedding": self._unit(embedding),
+            "evidence": tuple(evidence_ids),
+            "answer": answer,
+            "created": time.time(),
+        }
+        with self._lock:
+            self._insert(entry)
+            self._dirty = True
+            due = (time.monotonic() - self._last_save) >= self.save_interval
+        if due:
+            self.save()
+
+    def set_collection_stamp(self, stamp: Optional[str]):
+        """Drop every entry if the collection fingerprint differs from the cached one."""
+        if stamp is None:
+            return
+        previous, self.collection_stamp = self.collection_stamp, stamp
+        if previous is not None and previous != stamp:
+            print(f"[CACHE] Collection changed ({previous} -> {stamp}); clearing answer cache")
+            self.invalidate()
+
+    def invalidate(self):
+        """
+        Clear all cached answers (call when the collection changes). The
+        persisted file is replaced by an empty one with a new generation so
+        other processes sharing it drop their entries too.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._by_evidence.clear()
+            self.generation = max(time.time(), self.generation + 1e-6)
+            self._dirty = True
+        self.save()
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: Could not load answer cache: {e}")
+            return None
+
+    def _sync(self, force: bool = False):
+        """Drop our entries if another process invalidated the shared file since we last looked."""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        self._file_mtime = mtime
+        payload = self._read()
+        if payload is None:
+            return
+        generation = float(payload.get("generation", 0.0))
+        with self._lock:
+            if generation <= self.generation:
+                return
+            print("[CACHE] Answer cache invalidated by another process; clearing")
+            self._entries.clear()
+            self._by_evidence.clear()
+            self.generation = generation
+            self.collection_stamp = payload.get("collection_stamp") or self.collection_stamp
+            self._dirty = False
+            self.remote_invalidations += 1
+
+    def save(self):
+        """Write entries to disk atomically (no-op without a path or changes)."""
+        if not self.path:
+            return
+        self._sync(force=True)
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {
+                "generation": self.generation,
+                "collection_stamp": self.collection_stamp,
+                "entries": [
+                    {
+                        "query": e["query"],
+                        "embedding": e["embedding"].tolist(),
+                        "evidence": list(e["evidence"]),
+                        "answer": e["answer"],
+                        "created": e["created"],
+                    }
+                    for e in self._entries.values()
+                ],
+            }
+            self._dirty = False
+            self._last_save = time.monotonic()
+        # Per-process temp file in the same directory, so concurrent savers never share one
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            tmp = None
+            self._file_mtime = os.stat(self.path).st_mtime_ns
+        except Exception as e:
+            print(f"Warning: Could not save answer cache: {e}")
+        finally:
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def _load(self):
+        payload = self._read()
+        if payload is None:
+            return
+        try:
+            self._file_mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            pass
+        self.generation = float(payload.get("generation", 0.0))
+        self.collection_stamp = payload.get("collection_stamp")
+        now = time.time()
+        for raw in payload.get("entries", []):
+            entry = {
+                "query": raw.get("query", ""),
+                "embedding": self._unit(raw["embedding"]),
+                "evidence": tuple(raw.get("evidence", [])),
+                "answer": raw.get("answer", ""),
+                "created": float(raw.get("created", now)),
+            }
+            if not self._expired(entry, now):
+                self._insert(entry)
+        self._dirty = False
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            "persisted": bool(self.path),
+            "generation": self.generation,
+            "remote_invalidations": self.remote_invalidations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class PromptCache:
+    """
+    Two-tier exact cache for LLM responses.
+
+    Keyed by sha256 over (model, temperature, max_tokens, full prompt).
+    Tier 1 is an in-memory LRUCache; tier 2 is a SQLite table so answers
+    survive restarts and are shared by CLI runs and API workers. Expired
+    rows are deleted when read and on every put, which also evicts the
+    oldest rows beyond max_disk_rows (0 = no cap).
+    """
+
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 0.0, path: Optional[str] = None,
+                 max_disk_rows: int = 10000):
+        self.memory = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_disk_rows = int(max_disk_rows)
+        self.path = path or None
+        self._conn = None
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.disk_expired = 0
+        self.disk_evicted = 0
+        if self.path:
+            try:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS prompt_cache ("
+                    " key TEXT PRIMARY KEY, model TEXT, temperature REAL, max_tokens INTEGER,"
+                    " response TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS prompt_cache_created ON prompt_cache (created)")
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: Could not open prompt cache at {self.path}: {e}")
+                self._conn = None
+
+    @staticmethod
+    def key(prompt: str, model: str, temperature: float, max_tokens: int) -> str:
+        raw = json.dumps([model, float(temperature), int(max_tokens), prompt], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Optional[str]:
+        k = self.key(prompt, model, temperature, max_tokens)
+        value = self.memory.get(k)
+        if value is not None or self._conn is None:
+            return value
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT response, created FROM prompt_cache WHERE key = ?", (k,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Warning: prompt cache read failed: {e}")
+                row = None
+        if row is not None and self.ttl_seconds > 0 and time.time() - row[1] > self.ttl_seconds:
+            with self._lock:
+                try:
+                    self._conn.execute("DELETE FROM prompt_cache WHERE key = ? AND created = ?", (k, row[1]))
+                    self._conn.commit()
+                    self.disk_expired += 1
+                except sqlite3.Error as e:
+                    print(f"Warning: prompt cache delete failed: {e}")
+            row = None
+        if row is None:
+            self.disk_misses += 1
+            return None
+        self.disk_hits += 1
+        self.memory.put(k, row[0])
+        return row[0]
+
+    def put(self, prompt: str, model: str, temperature: float, max_tokens: int, response: str):
+        if not response:
+            return
+        k = self.key(prompt, model, temperature, max_tokens)
+        self.memory.put(k, response)
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO prompt_cache"
+                    " (key, model, temperature, max_tokens, response, created) VALUES (?, ?, ?, ?, ?, ?)",
+                    (k, model, float(temperature), int(max_tokens), response, time.time()),
+                )
+                self._prune()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: prompt cache write failed: {e}")
+
+    def _prune(self):
+        """Drop expired rows and the oldest rows beyond max_disk_rows (caller holds the lock)."""
+        if self.ttl_seconds > 0:
+            cur = self._conn.execute("DELETE FROM prompt_cache WHERE created < ?",
+                                     (time.time() - self.ttl_seconds,))
+            self.disk_expired += max(cur.rowcount, 0)
+        if self.max_disk_rows > 0:
+            cur = self._conn.execute(
+                "DELETE FROM prompt_cache WHERE key IN"
+                " (SELECT key FROM prompt_cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_rows,),
+            )
+            self.disk_evicted += max(cur.rowcount, 0)
+
+    def clear(self):
+        self.memory.clear()
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM prompt_cache")
+            self._conn.commit()
+
+    def _rows(self) -> Optional[int]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            try:
+                return self._conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+            except sqlite3.Error:
+                return None
+
+    def stats(self) -> Dict[str, Any]:
+        mem = self.memory.stats()
+        hits = mem["hits"] + self.disk_hits
+        lookups = mem["hits"] + mem["misses"]
+        return {
+            "memory": mem,
+            "disk": {
+                "path": self.path if self._conn is not None else None,
+                "hits": self.disk_hits,
+                "misses": self.disk_misses,
+                "rows": self._rows(),
+                "max_rows": self.max_disk_rows or None,
+                "expired": self.disk_expired,
+                "evicted": self.disk_evicted,
+            },
+            "hits": hits,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
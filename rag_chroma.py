@@ -0,0 +1,278 @@
+"""
+Chroma connection management.
+
+chroma_test used to create one client at import and keep it for the life
+of the process; a dropped connection left the collection broken until a
+restart. ChromaClientManager owns the client instead:
+
+- HTTP tuning (requests-based chromadb clients): a keep-alive connection
+  pool sized for the retrieval / shard thread pools, connect and read
+  timeouts on every request, gzip-compressed responses
+- reconnect: a request that fails with a transport error rebuilds the
+  client and is retried; repeated failures back off exponentially.
+  reconnect_fn(previous collection) -> (client, collection) does the
+  rebuild when given, so a reconnect can skip what connect_fn does once
+  (diagnostics, shard discovery, cache stamps)
+- heartbeat: a background probe every `probe_interval` seconds keeps the
+  pooled TLS connection warm, so the first query after an idle period does
+  not pay for a new handshake, and reconnects early when the server is gone
+- round-trip times of requests and probes (p50 / p95 / last)
+
+ManagedCollection is what the rest of the pipeline sees as "the
+collection": every method call goes through the manager.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+
+def _transient_errors() -> Tuple[type, ...]:
+    """Transport-level failures worth a reconnect (not bad requests or missing collections)."""
+    errors = [ConnectionError, TimeoutError]
+    if REQUESTS_AVAILABLE:
+        errors += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+    try:
+        import httpx  # newer chromadb clients
+        errors.append(httpx.TransportError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+TRANSIENT_ERRORS = _transient_errors()
+
+
+def tune_http_session(client, pool_size: int = 16, timeout: Tuple[float, float] = (5.0, 30.0)) -> bool:
+    """
+    Pool size, default timeout and gzip for the requests.Session inside a
+    chromadb HttpClient. Returns False when the client is not requests-based
+    (local PersistentClient, or chromadb versions built on httpx).
+    """
+    session = getattr(getattr(client, "_server", None), "_session", None)
+    if not REQUESTS_AVAILABLE or not isinstance(session, requests.Session):
+        reason = "requests is not installed" if not REQUESTS_AVAILABLE else \
+            f"{type(client).__name__} has no requests.Session (got {type(session).__name__})"
+        print(f"[CHROMA] Warning: HTTP tuning skipped, {reason}; "
+              f"requests use the client's default pool size and no timeout")
+        return False
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # Responses are decompressed transparently; request bodies stay uncompressed
+    # since the server is not guaranteed to accept Content-Encoding: gzip
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    session.headers["Connection"] = "keep-alive"
+    send = session.request
+
+    def request(method, url, **kwargs):
+        kwargs.setdefault("timeout", timeout)
+        return send(method, url, **kwargs)
+
+    session.request = request
+    return True
+
+
+class _Latencies:
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.last = None
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.last = seconds
+
+    def stats(self) -> Optional[Dict[str, Any]]:
+        if not self.samples:
+            return None
+        ms = np.asarray(self.samples, dtype=np.float64) * 1000.0
+        return {
+            "count": self.count,
+            "last_ms": round(self.last * 1000.0, 2),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        }
+
+
+class ChromaClientManager:
+    """
+    Owns the Chroma client and collection built by connect_fn() -> (client, collection),
+    rebuilding them when the connection fails (see module docstring).
+    """
+
+    def __init__(self, connect_fn: Callable[[], Tuple[Any, Any]], remote: bool = False,
+                 pool_size: int = 16, timeout: Tuple[float, float] = (5.0, 30.0),
+                 probe_interval: float = 20.0, retries: int = 1,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0, window: int = 500,
+                 reconnect_fn: Optional[Callable[[Any], Tuple[Any, Any]]] = None):
+        self.connect_fn = connect_fn
+        self.reconnect_fn = reconnect_fn
+        self.remote = remote
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.probe_interval = probe_interval
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.client = None
+        self._collection = None
+        self._lock = threading.Lock()
+        self._reconnect_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._probe_thread: Optional[threading.Thread] = None
+        self._failures = 0            # consecutive failed (re)connects
+        self._next_attempt = 0.0      # backoff: no reconnect before this time
+        self.connects = 0
+        self.reconnects = 0
+        self.errors = 0
+        self.tuned = False
+        self.healthy = False
+        self.last_error: Optional[str] = None
+        self.requests = _Latencies(window)
+        self.probes = _Latencies(window)
+
+    # -- connection --
+    def connect(self, reconnect: bool = False):
+        """(Re)build the client and collection; returns the collection."""
+        with self._lock:
+            if reconnect and self.reconnect_fn is not None:
+                client, collection = self.reconnect_fn(self._collection)
+            else:
+                client, collection = self.connect_fn()
+            self.tuned = tune_http_session(client, self.pool_size, self.timeout) if self.remote else False
+            self.client, self._collection = client, collection
+            self.connects += 1
+            self._failures = 0
+            self._next_attempt = 0.0
+            self.healthy = True
+        if self.remote and self.probe_interval > 0 and self._probe_thread is None:
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="chroma-heartbeat", daemon=True)
+            self._probe_thread.start()
+        return collection
+
+    @property
+    def collection(self):
+        return self._collection if self._collection is not None else self.connect()
+
+    def _reconnect(self, error: BaseException, generation: int):
+        """
+        One reconnect attempt unless another thread already reconnected since
+        `generation` (the connect count the failed call saw) or we are still
+        backing off from the last failure; raises on failure.
+        """
+        with self._reconnect_lock:
+            if self.connects != generation:
+                return
+            if time.monotonic() < self._next_attempt:
+                raise error
+            print(f"[CHROMA] Connection lost ({error!r}); reconnecting...")
+            try:
+                self.connect(reconnect=True)
+            except Exception as e:
+                self._failures += 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (self._failures - 1)))
+                delay *= 0.5 + random.random() / 2   # jitter: workers do not retry in lockstep
+                self._next_attempt = time.monotonic() + delay
+                self.healthy = False
+                self.last_error = repr(e)
+                print(f"[CHROMA] Reconnect failed ({e!r}); next attempt in {delay:.1f}s")
+                raise
+            self.reconnects += 1
+            print("[CHROMA] ✓ Reconnected")
+
+    def call(self, method: str, *args, **kwargs):
+        """collection.<method>(...) with round-trip timing, reconnecting and retrying on transport errors."""
+        for attempt in range(self.retries + 1):
+            col = self.collection
+            generation = self.connects
+            started = time.perf_counter()
+            try:
+                result = getattr(col, method)(*args, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                self.errors += 1
+                self.healthy = False
+                self.last_error = repr(e)
+                if attempt >= self.retries:
+                    raise
+                self._reconnect(e, generation)
+                continue
+            self.requests.add(time.perf_counter() - started)
+            self.healthy = True
+            return result
+
+    # -- heartbeat --
+    def probe(self) -> Optional[float]:
+        """One heartbeat round trip in seconds, or None if it failed."""
+        client = self.client
+        if client is None:
+            return None
+        started = time.perf_counter()
+        try:
+            client.heartbeat()
+        except Exception as e:
+            self.healthy = False
+            self.last_error = repr(e)
+            return None
+        rtt = time.perf_counter() - started
+        self.probes.add(rtt)
+        self.healthy = True
+        return rtt
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            generation = self.connects
+            if self.probe() is None:
+                try:
+                    self._reconnect(ConnectionError(self.last_error), generation)
+                except Exception:
+                    pass  # backing off; the next probe tries again
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "remote": self.remote,
+            "healthy": self.healthy,
+            "http_tuned": self.tuned,
+            "pool_size": self.pool_size if self.tuned else None,
+            "timeout_s": list(self.timeout) if self.tuned else None,
+            "probe_interval_s": self.probe_interval if self.remote else None,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "request_rtt": self.requests.stats(),
+            "probe_rtt": self.probes.stats(),
+        }
+
+
+class ManagedCollection:
+    """Collection look-alike whose method calls go through a ChromaClientManager."""
+
+    def __init__(self, manager: ChromaClientManager):
+        self.manager = manager
+
+    @property
+    def current(self):
+        """The underlying collection (a Chroma collection or rag_shards.ShardedCollection)."""
+        return self.manager.collection
+
+    def __getattr__(self, name: str):
+        value = getattr(self.manager.collection, name)
+        if not callable(value):
+            return value
+        return lambda *args, **kwargs: self.manager.call(name, *args, **kwargs)
@@ -0,0 +1,214 @@
+"""
+Columnar facet store for structured filters on retrieval.
+
+Built from the case metadata (rag_metadata.extract_case_metadata fields),
+one row per stored document (chunks share their parent's facets):
+
+- court / judge: int32 codes into small vocabularies (0 = unknown)
+- date: judgment date as int32 yyyymmdd (0 = unknown); year: int16, from the
+  date or, failing that, the PLD/SCMR citation year
+- citation: uint8 bitmask of citation types present (PLD, SCMR)
+
+Filters are evaluated with numpy over the columns, so restricting retrieval
+to e.g. "Lahore High Court, 2016 onwards" is a few vector compares before
+any vector scoring happens.
+"""
+
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+CITATION_BITS = {"pld": 1, "scmr": 2}
+FILTER_KEYS = ("court", "judge", "date_from", "date_to", "citation")
+
+_MONTHS = {m: i for i, m in enumerate(
+    "jan feb mar apr may jun jul aug sep oct nov dec".split(), start=1)}
+_TEXT_DATE_RE = re.compile(r'([A-Za-z]+)\s+(\d{1,2}),\s*(\d{4})')
+_NUM_DATE_RE = re.compile(r'(\d{1,2})[\/\-](\d{1,2})[\/\-](\d{2,4})')
+_YEAR_RE = re.compile(r'\b(19\d{2}|20\d{2})\b')
+_FILTER_DATE_RE = re.compile(r'^\s*(\d{4})(?:[\-\/](\d{1,2})(?:[\-\/](\d{1,2}))?)?\s*$')
+
+
+def _clean(value: Optional[str]) -> str:
+    return " ".join(str(value or "").lower().replace(".", " ").split())
+
+
+def parse_judgment_date(value: Optional[str]) -> int:
+    """'March 3, 2015' / '03/03/2015' (day first) -> 20150303; 0 if unparseable."""
+    value = value or ""
+    m = _TEXT_DATE_RE.search(value)
+    if m:
+        month = _MONTHS.get(m.group(1)[:3].lower())
+        if month:
+            return int(m.group(3)) * 10000 + month * 100 + int(m.group(2))
+    m = _NUM_DATE_RE.search(value)
+    if m:
+        day, month, year = int(m.group(1)), int(m.group(2)), int(m.group(3))
+        if year < 100:
+            year += 2000 if year < 50 else 1900
+        if 1 <= month <= 12 and 1 <= day <= 31:
+            return year * 10000 + month * 100 + day
+    return 0
+
+
+def parse_filter_date(value: Any, upper: bool = False) -> int:
+    """Filter bound '2015', '2015-06' or '2015-06-30' -> yyyymmdd (start of period, or end with upper)."""
+    if value is None or value == "":
+        return 0
+    m = _FILTER_DATE_RE.match(str(value))
+    if not m:
+        raise ValueError(f"Invalid date filter: {value!r} (expected YYYY, YYYY-MM or YYYY-MM-DD)")
+    year = int(m.group(1))
+    month = int(m.group(2)) if m.group(2) else (12 if upper else 1)
+    day = int(m.group(3)) if m.group(3) else (31 if upper else 1)
+    return year * 10000 + month * 100 + day
+
+
+def _citation_bits(value: Any) -> int:
+    kinds = [value] if isinstance(value, str) else list(value)
+    bits = 0
+    for kind in kinds:
+        if str(kind).lower() not in CITATION_BITS:
+            raise ValueError(f"Unknown citation type: {kind!r} (expected pld or scmr)")
+        bits |= CITATION_BITS[str(kind).lower()]
+    return bits
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Drop empty values and validate the rest (ValueError on unknown keys or
+    malformed dates / citation types); None/{} means no filtering.
+    """
+    out = {}
+    for key, value in (filters or {}).items():
+        if value is None or value == "":
+            continue
+        if key not in FILTER_KEYS:
+            raise ValueError(f"Unknown filter: {key!r} (expected one of {', '.join(FILTER_KEYS)})")
+        out[key] = value
+    parse_filter_date(out.get("date_from"))
+    parse_filter_date(out.get("date_to"), upper=True)
+    if "citation" in out:
+        _citation_bits(out["citation"])
+    return out
+
+
+class _Vocab:
+    """String <-> int32 code; code 0 is 'unknown'."""
+
+    def __init__(self):
+        self.values: List[str] = [""]
+        self.code_of: Dict[str, int] = {"": 0}
+
+    def code(self, value: str) -> int:
+        code = self.code_of.get(value)
+        if code is None:
+            code = self.code_of[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def matching(self, needle: str) -> np.ndarray:
+        """Codes whose value contains every word of `needle`."""
+        words = _clean(needle).split()
+        return np.asarray([c for c, v in enumerate(self.values) if c and all(w in v for w in words)],
+                          dtype=np.int32)
+
+
+class FacetStore:
+    """Facet columns for a fixed set of document ids (rows in build() order)."""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.courts = _Vocab()
+        self.judges = _Vocab()
+        self.court = np.zeros(0, dtype=np.int32)
+        self.judge = np.zeros(0, dtype=np.int32)
+        self.date = np.zeros(0, dtype=np.int32)
+        self.year = np.zeros(0, dtype=np.int16)
+        self.citation = np.zeros(0, dtype=np.uint8)
+        self.build_seconds = 0.0
+        self.filters = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, ids: Sequence[str], case_metadata: Sequence[Optional[Dict[str, str]]]) -> "FacetStore":
+        """ids[i] gets the facets of case_metadata[i] (the extract_case_metadata dict of its case)."""
+        started = time.perf_counter()
+        n = len(ids)
+        self.ids = [str(i) for i in ids]
+        self.row_of = {_id: row for row, _id in enumerate(self.ids)}
+        self.court = np.zeros(n, dtype=np.int32)
+        self.judge = np.zeros(n, dtype=np.int32)
+        self.date = np.zeros(n, dtype=np.int32)
+        self.year = np.zeros(n, dtype=np.int16)
+        self.citation = np.zeros(n, dtype=np.uint8)
+        for row, md in enumerate(case_metadata):
+            md = md or {}
+            self.court[row] = self.courts.code(_clean(md.get("court")))
+            self.judge[row] = self.judges.code(_clean(md.get("judge")))
+            date = parse_judgment_date(md.get("judgment_date"))
+            self.date[row] = date
+            bits = 0
+            for field, bit in CITATION_BITS.items():
+                if md.get(field):
+                    bits |= bit
+            self.citation[row] = bits
+            if date:
+                self.year[row] = date // 10000
+            else:
+                m = _YEAR_RE.search(md.get("pld") or "")
+                if m:
+                    self.year[row] = int(m.group(1))
+        self.build_seconds = time.perf_counter() - started
+        return self
+
+    def mask(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Boolean row mask for the filters (all rows if there are none)."""
+        filters = normalize_filters(filters)
+        self.filters += 1
+        keep = np.ones(len(self.ids), dtype=bool)
+        if "court" in filters:
+            keep &= np.isin(self.court, self.courts.matching(filters["court"]))
+        if "judge" in filters:
+            keep &= np.isin(self.judge, self.judges.matching(filters["judge"]))
+        if "citation" in filters:
+            keep &= (self.citation & _citation_bits(filters["citation"])) != 0
+        if "date_from" in filters or "date_to" in filters:
+            lo = parse_filter_date(filters.get("date_from"))
+            hi = parse_filter_date(filters.get("date_to"), upper=True)
+            # Exact dates where known, otherwise the (citation) year
+            known = self.date > 0
+            by_year = ~known & (self.year > 0)
+            year = self.year.astype(np.int32)
+            in_range = np.zeros(len(self.ids), dtype=bool)
+            in_range[known] = ((self.date[known] >= lo) if lo else True) & \
+                              ((self.date[known] <= hi) if hi else True)
+            in_range[by_year] = ((year[by_year] >= lo // 10000) if lo else True) & \
+                                ((year[by_year] <= hi // 10000) if hi else True)
+            keep &= in_range
+        return keep
+
+    def matching_ids(self, filters: Optional[Dict[str, Any]]) -> List[str]:
+        return [self.ids[r] for r in np.flatnonzero(self.mask(filters)).tolist()]
+
+    def values(self, facet: str) -> List[str]:
+        """Known values of a categorical facet (for building filter UIs)."""
+        vocab = {"court": self.courts, "judge": self.judges}[facet]
+        return sorted(v for v in vocab.values if v)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.ids),
+            "courts": len(self.courts.values) - 1,
+            "judges": len(self.judges.values) - 1,
+            "dated": int((self.date > 0).sum()),
+            "with_year": int((self.year > 0).sum()),
+            "bytes": int(self.court.nbytes + self.judge.nbytes + self.date.nbytes
+                         + self.year.nbytes + self.citation.nbytes),
+            "build_seconds": round(self.build_seconds, 3),
+            "filters": self.filters,
+        }
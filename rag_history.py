@@ -0,0 +1,385 @@
+"""
+Chat history storage.
+
+- HistoryStore: conversation-keyed store on SQLite (WAL mode) used by the API.
+  Appends are single-row INSERTs and "last N messages" reads use the
+  (conversation_id, id) index, so cost no longer grows with total history
+  size. WAL + busy_timeout lets several uvicorn workers write concurrently.
+- JsonlHistoryLog: snapshot + append-only JSON-lines log used by the CLI.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CONVERSATION = "default"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class HistoryStore:
+    """Per-conversation message store. One SQLite connection per thread."""
+
+    def __init__(self, path: str = "chat_history.db", busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_message(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "role": row["role"],
+            "content": row["content"],
+            "message_id": f"msg_{row['id']}",
+            "timestamp": row["created_at"],
+        }
+
+    def append(self, conversation_id: str, role: str, content: str) -> int:
+        """Append one message; returns its row id."""
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (conversation_id or DEFAULT_CONVERSATION, role, content, datetime.now().isoformat()),
+            )
+        return int(cur.lastrowid)
+
+    def recent(self, conversation_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Messages of a conversation, oldest first; only the last `limit` if given."""
+        conversation_id = conversation_id or DEFAULT_CONVERSATION
+        conn = self._conn()
+        if limit is None:
+            rows = conn.execute(
+                "SELECT id, role, content, created_at FROM messages WHERE conversation_id = ? ORDER BY id",
+                (conversation_id,),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT id, role, content, created_at FROM messages WHERE conversation_id = ?"
+                " ORDER BY id DESC LIMIT ?",
+                (conversation_id, int(limit)),
+            ).fetchall()
+            rows.reverse()
+        return [self._row_to_message(r) for r in rows]
+
+    def count(self, conversation_id: Optional[str] = None) -> int:
+        conn = self._conn()
+        if conversation_id is None:
+            return conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()[0]
+
+    def conversations(self) -> List[str]:
+        rows = self._conn().execute("SELECT DISTINCT conversation_id FROM messages").fetchall()
+        return [r[0] for r in rows]
+
+    def clear(self, conversation_id: Optional[str] = None) -> int:
+        """Delete one conversation (or everything); returns rows removed."""
+        conn = self._conn()
+        with conn:
+            if conversation_id is None:
+                cur = conn.execute("DELETE FROM messages")
+            else:
+                cur = conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        return cur.rowcount
+
+    def migrate_from_json(self, json_path: str, conversation_id: str = DEFAULT_CONVERSATION) -> int:
+        """
+        One-shot import of the legacy chat_history.json into `conversation_id`.
+        Recorded in the meta table so concurrent workers / restarts import it once.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not read legacy history {json_path}: {e}")
+            return 0
+
+        conn = self._conn()
+        marker = f"migrated:{os.path.abspath(json_path)}"
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT value FROM meta WHERE key = ?", (marker,)).fetchone()
+            if done is not None:
+                conn.rollback()
+                return 0
+            now = datetime.now().isoformat()
+            rows = [
+                (conversation_id, m.get("role", "user"), m.get("content", ""), now)
+                for m in (legacy if isinstance(legacy, list) else [])
+                if isinstance(m, dict)
+            ]
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(len(rows))))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Migrated {len(rows)} messages from {json_path} into conversation '{conversation_id}'")
+        return len(rows)
+
+
+class JsonlHistoryLog:
+    """
+    Flat-file history for the CLI: a JSON snapshot plus an append-only
+    JSON-lines log.
+
+    - append(): one line per message (single O_APPEND write), fsync batched
+    - load(tail=N): reads only the last N messages, from the end of the log
+    - compaction folds the log into the snapshot once the log grows past
+      compact_bytes
+    The snapshot keeps the legacy chat_history.json format (a JSON list).
+
+    Compaction holds the lock throughout (an append waits, then starts the
+    fresh log) and is crash-safe:
+    1. the log is renamed to <log>.pending (appends now go to a new log)
+    2. snapshot + pending is written and fsynced to <snapshot>.next
+    3. <log>.pending is removed: this is the commit point
+    4. <snapshot>.next replaces the snapshot
+    A reader (and the next compaction) treats <snapshot>.next as the
+    snapshot only once the pending log is gone, and otherwise reads
+    snapshot + pending + log, so a crash at any step neither loses nor
+    duplicates messages.
+    """
+
+    def __init__(self, snapshot_path: str = "chat_history.json", log_path: str = "chat_history.jsonl",
+                 compact_bytes: int = 256 * 1024, fsync_every: int = 8):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.compact_bytes = int(compact_bytes)
+        self.fsync_every = max(1, int(fsync_every))
+        self._fd: Optional[int] = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _pending_path(self) -> str:
+        return f"{self.log_path}.pending"
+
+    @property
+    def _next_path(self) -> str:
+        return f"{self.snapshot_path}.next"
+
+    # -- reading --
+    def _read_snapshot(self) -> List[Dict[str, Any]]:
+        path = self.snapshot_path
+        if os.path.exists(self._next_path) and not os.path.exists(self._pending_path):
+            path = self._next_path   # committed compaction whose final rename did not happen
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, list) else []
+        except Exception:
+            return []
+
+    @staticmethod
+    def _parse_lines(lines: List[bytes]) -> List[Dict[str, Any]]:
+        out = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                out.append(json.loads(line.decode("utf-8")))
+            except Exception:
+                continue  # torn trailing write after a crash
+        return out
+
+    def _read_lines(self, path: str, n: Optional[int]) -> List[Dict[str, Any]]:
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as f:
+            if n is None:
+                return self._parse_lines(f.read().splitlines())
+            # Read backwards in blocks until we have n complete lines
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            buf = b""
+            block = 64 * 1024
+            while pos > 0 and buf.count(b"\n") <= n:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+            lines = buf.splitlines()
+            if pos > 0:
+                lines = lines[1:]  # first line may be partial
+            return self._parse_lines(lines)[-n:] if n > 0 else []
+
+    def _read_log_tail(self, n: Optional[int]) -> List[Dict[str, Any]]:
+        return self._read_lines(self.log_path, n)
+
+    def load(self, tail: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Full history, or only the last `tail` messages."""
+        logged = self._read_log_tail(tail)
+        if tail is not None and len(logged) >= tail:
+            return logged[-tail:] if tail > 0 else []
+        if os.path.exists(self._pending_path):
+            # Log rotated by a compaction that has not committed yet
+            need = None if tail is None else tail - len(logged)
+            logged = self._read_lines(self._pending_path, need) + logged
+            if tail is not None and len(logged) >= tail:
+                return logged[-tail:]
+        snapshot = self._read_snapshot()
+        if tail is not None:
+            need = tail - len(logged)
+            snapshot = snapshot[-need:] if need > 0 else []
+        return snapshot + logged
+
+    # -- writing --
+    def _open(self) -> int:
+        if self._fd is None:
+            torn = False
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > 0:
+                with open(self.log_path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+            self._fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            # Terminate a torn last line so the next record starts cleanly
+            if torn:
+                os.write(self._fd, b"\n")
+        return self._fd
+
+    def append(self, message: Dict[str, Any]):
+        line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            fd = self._open()
+            os.write(fd, line)
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                os.fsync(fd)
+                self._unsynced = 0
+            needs_compaction = os.fstat(fd).st_size >= self.compact_bytes
+        if needs_compaction:
+            self.compact()
+
+    def flush(self):
+        with self._lock:
+            if self._fd is not None and self._unsynced:
+                os.fsync(self._fd)
+                self._unsynced = 0
+
+    def _close(self):
+        if self._fd is not None:
+            if self._unsynced:
+                os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+            self._unsynced = 0
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _fsync_dir(self, path: str):
+        """Make renames / removals in path's directory durable (no-op where unsupported)."""
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _write_json(path: str, history: List[Dict[str, Any]]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(history, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _fold(self, history: List[Dict[str, Any]]):
+        """Steps 2-4 of a compaction (see class docstring); caller holds the lock."""
+        if not os.path.exists(self._pending_path):
+            # Nothing to commit against: a plain atomic replace
+            tmp = f"{self.snapshot_path}.tmp"
+            self._write_json(tmp, history)
+            os.replace(tmp, self.snapshot_path)
+            self._fsync_dir(self.snapshot_path)
+            return
+        self._write_json(self._next_path, history)
+        os.remove(self._pending_path)
+        self._fsync_dir(self._pending_path)
+        os.replace(self._next_path, self.snapshot_path)
+        self._fsync_dir(self.snapshot_path)
+
+    def _recover(self):
+        """Finish or roll back a compaction interrupted by a crash; caller holds the lock."""
+        if os.path.exists(self._next_path):
+            if os.path.exists(self._pending_path):
+                os.remove(self._next_path)   # not committed: the pending log is folded again below
+            else:
+                os.replace(self._next_path, self.snapshot_path)
+        if os.path.exists(self._pending_path):
+            self._fold(self._read_snapshot() + self._read_lines(self._pending_path, None))
+
+    def _rotate(self) -> bool:
+        """Step 1: move the log aside so appends start a fresh one; caller holds the lock."""
+        self._close()
+        if not os.path.exists(self.log_path):
+            return False
+        os.replace(self.log_path, self._pending_path)
+        self._fsync_dir(self._pending_path)
+        return True
+
+    def compact(self):
+        """Fold the log into the snapshot and start a fresh log."""
+        with self._lock:
+            self._recover()
+            if self._rotate():
+                self._fold(self._read_snapshot() + self._read_lines(self._pending_path, None))
+
+    def rewrite(self, history: List[Dict[str, Any]]):
+        """Replace the whole history (snapshot written atomically, log reset)."""
+        with self._lock:
+            self._recover()
+            self._rotate()
+            self._fold(history)
+
+    def clear(self):
+        with self._lock:
+            self._close()
+            for path in (self.log_path, self._pending_path, self._next_path, self.snapshot_path):
+                if os.path.exists(path):
+                    os.remove(path)
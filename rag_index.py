@@ -0,0 +1,727 @@
+"""
+Local vector search over a snapshot of the Chroma collection.
+
+- CollectionSnapshot: ids, embeddings, metadatas and documents pulled
+  from a Chroma collection (paginated col.get)
+- HnswIndex: hnswlib graph with tunable M / ef_construction / ef,
+  incremental inserts and deletes (mark_deleted)
+- VectorStore: unit vectors stored as float32, float16 or int8 (per-row
+  scale), scored directly on the stored representation
+- ExactIndex: brute-force cosine search (one matmul + argpartition per
+  block of queries), with optional float32 rescoring of quantized results
+- LocalSearchEngine: answers query()/get()/count() with the same result
+  shape as a Chroma collection, so rerank_and_filter works unchanged
+
+Remote Chroma stays the source of truth; refresh() pulls inserts/deletes.
+A snapshot saved to disk lets retrieval start without any Chroma connection.
+
+Queries share a ReadWriteLock (numpy matmul and hnswlib release the GIL,
+so retrieval threads score in parallel); upserts, deletes and saves take
+it exclusively.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:  # ships with chromadb as chroma-hnswlib
+    HNSWLIB_AVAILABLE = False
+
+SNAPSHOT_PAGE_SIZE = 1000
+SNAPSHOT_EMBEDDINGS_FILE = "embeddings.npy"
+SNAPSHOT_RECORDS_FILE = "records.json"
+
+
+class ReadWriteLock:
+    """Many readers or one writer. A waiting writer holds back new readers, so refreshes are not starved."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def _as_matrix(embeddings: Any) -> np.ndarray:
+    mat = np.asarray(embeddings, dtype=np.float32)
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    return np.ascontiguousarray(mat)
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (mat / norms).astype(np.float32, copy=False)
+
+
+def cosine_to_distance(cos_dist: np.ndarray, space: str) -> np.ndarray:
+    """
+    Convert 1 - cos(q, d) into the distance Chroma would report for `space`
+    (squared L2 on unit vectors is 2 - 2cos), so rerank thresholds keep their meaning.
+    """
+    if space == "l2":
+        return 2.0 * cos_dist
+    return cos_dist
+
+
+class VectorStore:
+    """
+    Append-only matrix of unit vectors stored as float32, float16 or int8
+    (int8 keeps one float32 scale per row: x ~= codes * scale).
+
+    Scoring runs on the stored representation in row blocks, so no full
+    float32 copy is ever materialized. numpy has no BLAS kernels for int8 or
+    float16 (a native matmul on them is several times slower than float32),
+    so each block of score_block_rows rows is widened into a cache-sized
+    per-thread float32 scratch buffer and scored with sgemm. The saving is
+    memory, not time: int8 scores at about float32 speed, float16 about 3x
+    slower (the float16 -> float32 conversion dominates).
+
+    Exact float32 rows for rescoring come from a memory-mapped
+    embeddings.npy (rows saved to disk) or, with keep_exact, from an
+    in-memory tail for rows added since the last save. Without a saved file
+    every row lands in the tail, so it is capped at max_tail_rows (0 = no
+    limit): the oldest rows are dropped and rescored from their dequantized
+    values instead.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+
+    def __init__(self, dim: int, dtype: str = "float32", keep_exact: bool = False,
+                 block_rows: int = 16384, score_block_rows: int = 2048, max_tail_rows: int = 0):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported index dtype {dtype!r}; use one of {self.DTYPES}")
+        self.dim = dim
+        self.dtype = dtype
+        self.keep_exact = keep_exact and dtype != "float32"
+        self.block_rows = block_rows
+        self.score_block_rows = score_block_rows
+        self.max_tail_rows = max_tail_rows
+        self.tail_evicted = 0
+        self._scratch = threading.local()
+        self._n = 0
+        self._data = np.zeros((0, dim), dtype=np.dtype(dtype))
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._file_row = np.zeros(0, dtype=np.int64)
+        self._file: Optional[np.ndarray] = None
+        self._tail: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _reserve(self, rows: int):
+        if rows <= len(self._data):
+            return
+        capacity = max(rows, 2 * len(self._data), 1024)
+        data = np.zeros((capacity, self.dim), dtype=self._data.dtype)
+        data[:self._n] = self._data[:self._n]
+        scales = np.zeros(capacity, dtype=np.float32)
+        scales[:self._n] = self._scales[:self._n]
+        file_row = np.full(capacity, -1, dtype=np.int64)
+        file_row[:self._n] = self._file_row[:self._n]
+        self._data, self._scales, self._file_row = data, scales, file_row
+
+    def append(self, mat: np.ndarray, file_rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Store unit-normalized float32 rows; returns their row numbers."""
+        start = self._n
+        self._reserve(start + len(mat))
+        end = start + len(mat)
+        if self.dtype == "int8":
+            scales = np.abs(mat).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._data[start:end] = np.rint(mat / scales[:, None]).astype(np.int8)
+            self._scales[start:end] = scales
+        else:
+            self._data[start:end] = mat
+        if file_rows is not None:
+            self._file_row[start:end] = file_rows
+        elif self.keep_exact:
+            for i, row in enumerate(range(start, end)):
+                self._tail[row] = np.array(mat[i], dtype=np.float32)
+            self._trim_tail()
+        self._n = end
+        return np.arange(start, end, dtype=np.int64)
+
+    def _trim_tail(self):
+        excess = len(self._tail) - self.max_tail_rows if self.max_tail_rows > 0 else 0
+        if excess <= 0:
+            return
+        for row in list(itertools.islice(self._tail, excess)):   # oldest first
+            del self._tail[row]
+        self.tail_evicted += excess
+
+    def attach_file(self, file_matrix: np.ndarray, file_rows: np.ndarray):
+        """Use `file_matrix` (memmapped float32) as the exact source; file_rows[i] backs row i (-1 = none)."""
+        self._file = file_matrix
+        self._file_row[:self._n] = file_rows[:self._n]
+        self._tail = {r: v for r, v in self._tail.items() if file_rows[r] < 0}
+
+    def stored(self, rows: np.ndarray):
+        """(codes, scales) of rows in the storage dtype; scales are 1.0 unless int8."""
+        rows = np.asarray(rows, dtype=np.int64)
+        scales = self._scales[rows] if self.dtype == "int8" else np.ones(len(rows), dtype=np.float32)
+        return self._data[rows], scales
+
+    def dequantize(self, rows: np.ndarray) -> np.ndarray:
+        block = self._data[rows].astype(np.float32)
+        if self.dtype == "int8":
+            block *= self._scales[rows][:, None]
+        return block
+
+    def exact(self, rows: np.ndarray) -> np.ndarray:
+        """float32 rows: stored values, the memmapped file, the tail, or dequantized as a last resort."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.dtype == "float32":
+            return self._data[rows]
+        out = self.dequantize(rows)
+        if self._file is not None:
+            file_rows = self._file_row[rows]
+            backed = file_rows >= 0
+            if backed.any():
+                out[backed] = self._file[file_rows[backed]]
+        for i, row in enumerate(rows.tolist()):
+            vec = self._tail.get(row)
+            if vec is not None:
+                out[i] = vec
+        return out
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine scores (n_queries, n_rows) computed block by block on the stored dtype."""
+        out = np.empty((len(queries), self._n), dtype=np.float32)
+        if self.dtype == "float32":
+            np.matmul(queries, self._data[:self._n].T, out=out)
+            return out
+        step = self.score_block_rows
+        scratch = getattr(self._scratch, "buf", None)
+        if scratch is None or scratch.shape != (step, self.dim):
+            scratch = self._scratch.buf = np.empty((step, self.dim), dtype=np.float32)
+        for start in range(0, self._n, step):
+            end = min(start + step, self._n)
+            block = scratch[:end - start]
+            np.copyto(block, self._data[start:end], casting="unsafe")
+            np.matmul(queries, block.T, out=out[:, start:end])
+            if self.dtype == "int8":
+                out[:, start:end] *= self._scales[start:end]
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dtype": self.dtype,
+            "rows": self._n,
+            "bytes": int(self._data[:self._n].nbytes + (self._scales[:self._n].nbytes if self.dtype == "int8" else 0)),
+            "exact_source": "memory" if self.dtype == "float32" else ("mmap" if self._file is not None else "none"),
+            "exact_tail_rows": len(self._tail),
+            "exact_tail_limit": self.max_tail_rows or None,
+            "exact_tail_evicted": self.tail_evicted,
+        }
+
+
+class CollectionSnapshot:
+    """
+    In-memory copy of a collection. Rows are append-only; deleted rows are
+    tombstoned so row numbers can double as stable index labels.
+    Embeddings live in a VectorStore (float32, float16 or int8).
+    """
+
+    def __init__(self, dim: int = 0, space: str = "l2", dtype: str = "float32", keep_exact: bool = False,
+                 max_tail_rows: int = 0):
+        self.dim = dim
+        self.space = space
+        self.dtype = dtype
+        self.keep_exact = keep_exact
+        self.max_tail_rows = max_tail_rows
+        self.ids: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.documents: List[str] = []
+        self.vectors = VectorStore(dim, dtype, keep_exact, max_tail_rows=max_tail_rows)
+        self._alive = np.zeros(0, dtype=bool)   # grows by doubling
+        self.row_of: Dict[str, int] = {}
+        self.source_count = 0
+        self.loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """
+        Unit-normalized float32 rows (including tombstoned ones). A view for
+        float32 storage; materialized from the exact source otherwise.
+        """
+        return self.vectors.exact(np.arange(len(self.ids)))
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[:len(self.ids)]
+
+    @classmethod
+    def from_collection(cls, col, page_size: int = SNAPSHOT_PAGE_SIZE, dtype: str = "float32",
+                        keep_exact: bool = False, max_tail_rows: int = 0) -> "CollectionSnapshot":
+        """Pull every id, embedding, metadata and document from a Chroma collection."""
+        space = str((getattr(col, "metadata", None) or {}).get("hnsw:space", "l2")).lower()
+        snap = cls(space=space, dtype=dtype, keep_exact=keep_exact, max_tail_rows=max_tail_rows)
+        offset = 0
+        while True:
+            page = col.get(limit=page_size, offset=offset,
+                           include=["embeddings", "metadatas", "documents"])
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            snap.add(ids, page.get("embeddings"), page.get("metadatas"), page.get("documents"))
+            offset += len(ids)
+            if len(ids) < page_size:
+                break
+        snap.source_count = offset
+        snap.loaded_at = time.time()
+        return snap
+
+    def add(self, ids: Sequence[str], embeddings: Any,
+            metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+            documents: Optional[Sequence[str]] = None,
+            file_rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Append rows (existing ids are replaced); returns the new row numbers."""
+        mat = _normalize(_as_matrix(embeddings))
+        if self.dim == 0:
+            self.dim = mat.shape[1]
+            self.vectors = VectorStore(self.dim, self.dtype, self.keep_exact, max_tail_rows=self.max_tail_rows)
+        if mat.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {mat.shape[1]} != index dimension {self.dim}")
+        self.delete([i for i in ids if i in self.row_of])
+
+        start = len(self.ids)
+        rows = self.vectors.append(mat, file_rows)
+        if start + len(ids) > len(self._alive):
+            alive = np.zeros(max(start + len(ids), 2 * len(self._alive), 1024), dtype=bool)
+            alive[:start] = self._alive[:start]
+            self._alive = alive
+        self._alive[start:start + len(ids)] = True
+        self.ids.extend(str(i) for i in ids)
+        self.metadatas.extend((m or {}) for m in (metadatas if metadatas is not None else [None] * len(ids)))
+        self.documents.extend((d or "") for d in (documents if documents is not None else [None] * len(ids)))
+        for row, _id in zip(rows.tolist(), ids):
+            self.row_of[str(_id)] = row
+        return rows
+
+    def delete(self, ids: Sequence[str]) -> List[int]:
+        """Tombstone rows; returns the row numbers removed."""
+        removed = []
+        for _id in ids:
+            row = self.row_of.pop(str(_id), None)
+            if row is not None:
+                self._alive[row] = False
+                removed.append(row)
+        return removed
+
+    # -- persistence --
+    @staticmethod
+    def exists(path: str) -> bool:
+        return bool(path) and os.path.exists(os.path.join(path, SNAPSHOT_RECORDS_FILE)) \
+            and os.path.exists(os.path.join(path, SNAPSHOT_EMBEDDINGS_FILE))
+
+    def save(self, path: str, block_rows: int = 16384):
+        """
+        Write live rows to `path` (float32 embeddings.npy + records.json, each
+        replaced atomically). Quantized snapshots then rescore from the new file.
+        """
+        os.makedirs(path, exist_ok=True)
+        rows = np.flatnonzero(self.alive)
+        emb_path = os.path.join(path, SNAPSHOT_EMBEDDINGS_FILE)
+        out = np.lib.format.open_memmap(emb_path + ".tmp", mode="w+", dtype=np.float32,
+                                        shape=(len(rows), self.dim))
+        for start in range(0, len(rows), block_rows):
+            out[start:start + block_rows] = self.vectors.exact(rows[start:start + block_rows])
+        out.flush()
+        del out
+        os.replace(emb_path + ".tmp", emb_path)
+
+        records = {
+            "dim": self.dim,
+            "space": self.space,
+            "source_count": self.source_count,
+            "loaded_at": self.loaded_at,
+            "ids": [self.ids[r] for r in rows],
+            "metadatas": [self.metadatas[r] for r in rows],
+            "documents": [self.documents[r] for r in rows],
+        }
+        rec_path = os.path.join(path, SNAPSHOT_RECORDS_FILE)
+        with open(rec_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(rec_path + ".tmp", rec_path)
+
+        if self.dtype != "float32":
+            file_rows = np.full(len(self.ids), -1, dtype=np.int64)
+            file_rows[rows] = np.arange(len(rows))
+            self.vectors.attach_file(np.load(emb_path, mmap_mode="r"), file_rows)
+
+    @classmethod
+    def load(cls, path: str, dtype: str = "float32", keep_exact: bool = False,
+             block_rows: int = 16384, max_tail_rows: int = 0) -> "CollectionSnapshot":
+        """
+        Read a snapshot written by save(); raises if the two files do not match.
+        Embeddings are memory-mapped and quantized block by block.
+        """
+        with open(os.path.join(path, SNAPSHOT_RECORDS_FILE), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        emb = np.load(os.path.join(path, SNAPSHOT_EMBEDDINGS_FILE), mmap_mode="r")
+        if emb.shape[0] != len(records["ids"]):
+            raise ValueError(f"Snapshot at {path} is inconsistent: "
+                             f"{emb.shape[0]} embeddings vs {len(records['ids'])} records")
+        snap = cls(dim=int(records.get("dim") or emb.shape[1]), space=records.get("space", "l2"),
+                   dtype=dtype, keep_exact=keep_exact, max_tail_rows=max_tail_rows)
+        ids = records["ids"]
+        metadatas = records.get("metadatas") or [None] * len(ids)
+        documents = records.get("documents") or [None] * len(ids)
+        for start in range(0, len(ids), block_rows):
+            end = start + block_rows
+            snap.add(ids[start:end], emb[start:end], metadatas[start:end], documents[start:end],
+                     file_rows=np.arange(start, min(end, len(ids))))
+        if dtype != "float32":
+            snap.vectors.attach_file(emb, np.arange(len(snap.ids)))
+        snap.source_count = int(records.get("source_count", len(ids)))
+        snap.loaded_at = float(records.get("loaded_at", 0.0))
+        return snap
+
+
+class HnswIndex:
+    """hnswlib graph over unit vectors (cosine space); labels are snapshot rows."""
+
+    def __init__(self, dim: int, M: int = 16, ef_construction: int = 200, ef: int = 64,
+                 max_elements: int = 1024):
+        if not HNSWLIB_AVAILABLE:
+            raise RuntimeError("hnswlib not installed. Run: pip install chroma-hnswlib")
+        self.dim = dim
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self._index = hnswlib.Index(space="cosine", dim=dim)
+        self._index.init_index(max_elements=max(1, max_elements), M=M, ef_construction=ef_construction)
+        self._index.set_ef(ef)
+        self._size = 0   # labels ever added (drives capacity)
+        self._live = 0   # labels not marked deleted
+
+    def add(self, embeddings: np.ndarray, labels: np.ndarray):
+        if len(labels) == 0:
+            return
+        needed = self._size + len(labels)
+        capacity = self._index.get_max_elements()
+        if needed > capacity:
+            self._index.resize_index(max(needed, capacity * 2))
+        self._index.add_items(embeddings, labels, num_threads=-1)
+        self._size = needed
+        self._live += len(labels)
+
+    def delete(self, labels: Sequence[int]):
+        for label in labels:
+            try:
+                self._index.mark_deleted(int(label))
+                self._live -= 1
+            except RuntimeError:
+                pass  # already deleted / never added
+
+    def search(self, queries: np.ndarray, k: int):
+        """(labels, 1 - cos) arrays of shape (n_queries, k')."""
+        k = min(k, self._live)
+        if k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        # ef stays as set at build time: hnswlib searches with max(ef, k) on its own,
+        # and set_ef here would race with other threads' searches
+        return self._index.knn_query(queries, k=k, num_threads=1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "M": self.M,
+            "ef_construction": self.ef_construction,
+            "ef": self.ef,
+            "elements": self._live,
+            "capacity": self._index.get_max_elements(),
+        }
+
+
+class ExactIndex:
+    """
+    Brute-force cosine search over the snapshot's VectorStore (rows are unit
+    vectors, so scores are one matmul). Inserts/deletes are the snapshot's own.
+
+    With quantized storage, rescore_factor > 0 re-ranks the best
+    k * rescore_factor candidates with exact float32 vectors.
+    """
+
+    def __init__(self, snapshot: CollectionSnapshot, block_elements: int = 1 << 24,
+                 rescore_factor: int = 0):
+        self.snapshot = snapshot
+        self.block_elements = block_elements   # caps the (queries x documents) score block
+        self.rescore_factor = rescore_factor if snapshot.dtype != "float32" else 0
+        self.rescored = 0
+
+    def add(self, embeddings: np.ndarray, labels: np.ndarray):
+        pass  # rows already live in the snapshot matrix
+
+    def delete(self, labels: Sequence[int]):
+        pass  # tombstones live in snapshot.alive
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int):
+        """Best-first (columns, scores) of the k highest scores per row."""
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def _rescore(self, queries: np.ndarray, candidates: np.ndarray, k: int):
+        vectors = self.snapshot.vectors
+        flat = candidates.reshape(-1)
+        exact = vectors.exact(flat).reshape(candidates.shape + (vectors.dim,))
+        scores = np.einsum("qd,qcd->qc", queries, exact)
+        cols, top_scores = self._top(scores, k)
+        self.rescored += candidates.size
+        return np.take_along_axis(candidates, cols, axis=1), top_scores
+
+    def search(self, queries: np.ndarray, k: int):
+        """(labels, 1 - cos) arrays of shape (n_queries, k'), best first."""
+        vectors = self.snapshot.vectors
+        alive = self.snapshot.alive
+        n_docs = len(vectors)
+        k = min(k, len(self.snapshot))
+        if k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        has_dead = len(self.snapshot) < n_docs
+        first_k = min(k * self.rescore_factor, len(self.snapshot)) if self.rescore_factor else k
+        step = max(1, self.block_elements // max(n_docs, 1))
+
+        labels = np.empty((len(queries), k), dtype=np.int64)
+        sims = np.empty((len(queries), k), dtype=np.float32)
+        for start in range(0, len(queries), step):
+            block = queries[start:start + step]
+            scores = vectors.scores(block)
+            if has_dead:
+                scores[:, ~alive] = -np.inf
+            top, top_scores = self._top(scores, first_k)
+            if first_k > k:
+                top, top_scores = self._rescore(block, top, k)
+            labels[start:start + step] = top
+            sims[start:start + step] = top_scores
+        return labels, 1.0 - sims
+
+    def stats(self) -> Dict[str, Any]:
+        out = {"elements": len(self.snapshot), "rescore_factor": self.rescore_factor,
+               "rescored_candidates": self.rescored}
+        out.update(self.snapshot.vectors.stats())
+        return out
+
+
+class LocalSearchEngine:
+    """Chroma-collection look-alike backed by a snapshot and a vector index."""
+
+    def __init__(self, snapshot: CollectionSnapshot, index: Any, backend: str = "hnsw"):
+        self.snapshot = snapshot
+        self.index = index
+        self.backend = backend
+        self._lock = ReadWriteLock()
+        self._stats_lock = threading.Lock()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.refreshes = 0
+
+    @classmethod
+    def build_hnsw(cls, snapshot: CollectionSnapshot, M: int = 16, ef_construction: int = 200,
+                   ef: int = 64) -> "LocalSearchEngine":
+        index = HnswIndex(snapshot.dim or 1, M=M, ef_construction=ef_construction, ef=ef,
+                          max_elements=max(len(snapshot.ids), 1))
+        rows = np.flatnonzero(snapshot.alive)
+        for start in range(0, len(rows), SNAPSHOT_PAGE_SIZE * 16):
+            block = rows[start:start + SNAPSHOT_PAGE_SIZE * 16]
+            index.add(snapshot.vectors.exact(block), block)
+        return cls(snapshot, index, backend="hnsw")
+
+    @classmethod
+    def build_exact(cls, snapshot: CollectionSnapshot, rescore_factor: int = 0) -> "LocalSearchEngine":
+        return cls(snapshot, ExactIndex(snapshot, rescore_factor=rescore_factor), backend="exact")
+
+    # -- Chroma-compatible reads --
+    def count(self) -> int:
+        return len(self.snapshot)
+
+    def _rows_result(self, rows: Sequence[int], include: Sequence[str]) -> Dict[str, Any]:
+        snap = self.snapshot
+        out: Dict[str, Any] = {"ids": [snap.ids[r] for r in rows]}
+        out["documents"] = [snap.documents[r] for r in rows] if "documents" in include else None
+        out["metadatas"] = [snap.metadatas[r] for r in rows] if "metadatas" in include else None
+        out["embeddings"] = snap.vectors.exact(np.asarray(rows, dtype=np.int64)).tolist() \
+            if "embeddings" in include else None
+        return out
+
+    def _search_rows(self, queries: np.ndarray, rows: np.ndarray, k: int, block_rows: int = 16384):
+        """Exact search restricted to `rows` (facet-filtered candidates); same shape as index.search()."""
+        rows = rows[self.snapshot.alive[rows]] if len(rows) else rows
+        k = min(k, len(rows))
+        top_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        top_sims = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(rows), block_rows):
+            block = rows[start:start + block_rows]
+            sims = queries @ self.snapshot.vectors.exact(block).T
+            cand_rows = np.concatenate([top_rows, np.broadcast_to(block, sims.shape)], axis=1)
+            cand_sims = np.concatenate([top_sims, sims.astype(np.float32)], axis=1)
+            cols, top_sims = ExactIndex._top(cand_sims, k)
+            top_rows = np.take_along_axis(cand_rows, cols, axis=1)
+        return top_rows, 1.0 - top_sims
+
+    def query(self, query_embeddings: Any, n_results: int = 10,
+              include: Sequence[str] = ("documents", "metadatas", "distances"),
+              ids: Optional[Sequence[str]] = None, **_ignored) -> Dict[str, Any]:
+        """
+        Nearest neighbours for each query embedding, shaped like col.query().
+        ids restricts the search to those documents (scored exactly).
+        """
+        started = time.perf_counter()
+        queries = _normalize(_as_matrix(query_embeddings))
+        with self._lock.read():
+            if ids is not None:
+                rows = np.asarray([self.snapshot.row_of[i] for i in ids if i in self.snapshot.row_of], dtype=np.int64)
+                labels, cos_dist = self._search_rows(queries, rows, n_results)
+            else:
+                labels, cos_dist = self.index.search(queries, n_results)
+            dists = cosine_to_distance(np.asarray(cos_dist, dtype=np.float64), self.snapshot.space)
+            result: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": [],
+                                      "embeddings": None}
+            for q_labels, q_dists in zip(labels, dists):
+                rows = [int(r) for r in q_labels]
+                part = self._rows_result(rows, include)
+                result["ids"].append(part["ids"])
+                result["documents"].append(part["documents"])
+                result["metadatas"].append(part["metadatas"])
+                result["distances"].append(q_dists.tolist())
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                result[key] = None
+        with self._stats_lock:
+            self.queries += len(queries)
+            self.query_seconds += time.perf_counter() - started
+        return result
+
+    def get(self, ids: Optional[Sequence[str]] = None,
+            include: Sequence[str] = ("documents", "metadatas"), **_ignored) -> Dict[str, Any]:
+        with self._lock.read():
+            snap = self.snapshot
+            if ids is None:
+                rows = np.flatnonzero(snap.alive).tolist()
+            else:
+                rows = [snap.row_of[i] for i in ids if i in snap.row_of]
+            return self._rows_result(rows, include)
+
+    # -- incremental updates --
+    def upsert(self, ids: Sequence[str], embeddings: Any,
+               metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+               documents: Optional[Sequence[str]] = None):
+        with self._lock.write():
+            replaced = [self.snapshot.row_of[i] for i in ids if i in self.snapshot.row_of]
+            self.index.delete(replaced)
+            rows = self.snapshot.add(ids, embeddings, metadatas, documents)
+            self.index.add(self.snapshot.vectors.exact(rows), rows)
+
+    def delete(self, ids: Sequence[str]):
+        with self._lock.write():
+            self.index.delete(self.snapshot.delete(ids))
+
+    def update_metadatas(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]) -> int:
+        """Replace metadata of rows we already hold (no re-embedding); returns rows updated."""
+        updated = 0
+        with self._lock.write():
+            for _id, meta in zip(ids, metadatas):
+                row = self.snapshot.row_of.get(str(_id))
+                if row is not None:
+                    self.snapshot.metadatas[row] = meta or {}
+                    updated += 1
+        return updated
+
+    def refresh(self, col, page_size: int = SNAPSHOT_PAGE_SIZE) -> Dict[str, int]:
+        """
+        Sync with the remote collection: add ids we have not seen, drop ids
+        that disappeared. (Documents re-uploaded under an existing id need upsert().)
+        """
+        remote_ids: List[str] = []
+        offset = 0
+        while True:
+            page = col.get(limit=page_size, offset=offset, include=[])
+            ids = page.get("ids") or []
+            remote_ids.extend(ids)
+            offset += len(ids)
+            if len(ids) < page_size:
+                break
+        remote = set(remote_ids)
+        with self._lock.read():
+            local = set(self.snapshot.row_of)
+        added = [i for i in remote_ids if i not in local]
+        removed = [i for i in local if i not in remote]
+
+        for start in range(0, len(added), page_size):
+            batch = added[start:start + page_size]
+            page = col.get(ids=batch, include=["embeddings", "metadatas", "documents"])
+            self.upsert(page["ids"], page["embeddings"], page.get("metadatas"), page.get("documents"))
+        if removed:
+            self.delete(removed)
+        self.snapshot.source_count = len(remote_ids)
+        self.snapshot.loaded_at = time.time()
+        with self._stats_lock:
+            self.refreshes += 1
+        return {"added": len(added), "removed": len(removed)}
+
+    def save(self, path: str):
+        with self._lock.write():
+            self.snapshot.save(path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "documents": len(self.snapshot),
+            "dim": self.snapshot.dim,
+            "space": self.snapshot.space,
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds / self.queries * 1000.0, 3) if self.queries else None,
+            "refreshes": self.refreshes,
+            "snapshot_age_seconds": round(time.time() - self.snapshot.loaded_at, 1) if self.snapshot.loaded_at else None,
+            "index": self.index.stats(),
+        }
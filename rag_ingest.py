@@ -0,0 +1,202 @@
+"""
+Ingestion helpers: split documents into overlapping, section-aware chunks
+and upload them to Chroma.
+
+Each chunk is stored as its own vector with metadata:
+  parent_id, chunk_index, chunk_count, section, char_start, char_end
+plus the parent's own metadata, lang / rk_len (and the other rk_* rerank
+features when a feature_fn is given to upload_chunks).
+Chunk ids are "<parent_id>::c<index>".
+Retrieval groups hits back by parent_id (see aggregate_by_parent in chroma_test).
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+CHUNK_CHARS = 1000
+CHUNK_OVERLAP = 150
+DEFAULT_LANG = "unknown"   # passes the language filter, like a missing field
+
+# Headings in judgments / statutes: "Section 12.", "Order XXI", "Article 199", "Judgment:";
+# all-caps lines ("CONTRACT LAW IN PAKISTAN") are caught by _UPPER_HEADING_RE
+_HEADING_RE = re.compile(
+    r"^\s*(?:"
+    r"(?:section|article|order|rule|chapter|part|schedule)\s+[0-9ivxlcdm]+[a-z\-]*\b.*"
+    r"|(?:judgment|order|facts|background|held|conclusion|prayer|arguments?)\s*:?\s*"
+    r")$",
+    re.IGNORECASE,
+)
+_UPPER_HEADING_RE = re.compile(r"^[^a-z]*[A-Z][^a-z]*$")
+_SENTENCE_END_RE = re.compile(r"(?<=[.;:?!])\s+")
+
+
+def chunk_id(parent_id: str, index: int) -> str:
+    return f"{parent_id}::c{index:04d}"
+
+
+def _is_heading(line: str) -> bool:
+    line = line.strip()
+    if not line or len(line) > 120:
+        return False
+    if _UPPER_HEADING_RE.match(line) and len(line) >= 6:
+        return True
+    return bool(_HEADING_RE.match(line)) and not line.endswith((",", ";"))
+
+
+def _paragraphs(text: str):
+    """(start, end, is_heading) spans of blank-line separated paragraphs and heading lines."""
+    spans = []
+    pos = 0
+    for block in re.split(r"(\n\s*\n)", text):
+        start, pos = pos, pos + len(block)
+        if not block.strip():
+            continue
+        first_line_end = block.find("\n")
+        first = block if first_line_end < 0 else block[:first_line_end]
+        if first_line_end >= 0 and _is_heading(first):
+            # Heading glued to its paragraph: split it off
+            spans.append((start, start + len(first), True))
+            spans.append((start + first_line_end + 1, pos, False))
+        else:
+            spans.append((start, pos, _is_heading(block)))
+    return spans
+
+
+def _split_long(text: str, start: int, end: int, limit: int):
+    """Cut an over-long span at sentence ends (or hard at `limit`)."""
+    pieces = []
+    piece_start = start
+    cursor = start
+    for m in _SENTENCE_END_RE.finditer(text, start, end):
+        if m.end() - piece_start > limit and cursor > piece_start:
+            pieces.append((piece_start, cursor))
+            piece_start = cursor
+        cursor = m.end()
+    if end - piece_start > limit and cursor > piece_start:
+        pieces.append((piece_start, cursor))
+        piece_start = cursor
+    while end - piece_start > limit:
+        pieces.append((piece_start, piece_start + limit))
+        piece_start += limit
+    if end > piece_start:
+        pieces.append((piece_start, end))
+    return pieces
+
+
+def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    Pack paragraphs into chunks of up to chunk_chars, starting a new chunk at
+    section headings. Every chunk after the first repeats the last `overlap`
+    characters of the previous one (cut at a word boundary).
+    Returns [{"text", "section", "char_start", "char_end"}].
+    """
+    text = text or ""
+    units = []   # (start, end, heading)
+    for start, end, heading in _paragraphs(text):
+        if end - start > chunk_chars:
+            units.extend((s, e, False) for s, e in _split_long(text, start, end, chunk_chars))
+        else:
+            units.append((start, end, heading))
+
+    chunks: List[Dict[str, Any]] = []
+    section = ""
+    cur_start: Optional[int] = None
+    cur_end = 0
+    cur_section = ""
+
+    def flush():
+        if cur_start is not None and text[cur_start:cur_end].strip():
+            chunks.append({"char_start": cur_start, "char_end": cur_end, "section": cur_section})
+
+    for start, end, heading in units:
+        if heading:
+            # New section: close the current chunk unless it is only a heading so far
+            if cur_start is not None and cur_end - cur_start > chunk_chars // 4:
+                flush()
+                cur_start = None
+            section = " ".join(text[start:end].split())[:120]
+        if cur_start is not None and end - cur_start > chunk_chars:
+            flush()
+            cur_start = None
+        if cur_start is None:
+            cur_start, cur_section = start, section
+        cur_end = end
+    flush()
+
+    out = []
+    prev_end = None
+    for c in chunks:
+        body = text[c["char_start"]:c["char_end"]].strip()
+        if prev_end is not None and overlap > 0:
+            tail_start = max(0, prev_end - overlap)
+            space = text.find(" ", tail_start, prev_end)
+            tail = text[(space + 1 if space >= 0 else tail_start):prev_end].strip()
+            if tail:
+                body = f"{tail}\n{body}"
+        out.append({"text": body, "section": c["section"],
+                    "char_start": c["char_start"], "char_end": c["char_end"]})
+        prev_end = c["char_end"]
+    return out
+
+
+def chunk_documents(documents: Sequence[Dict[str, Any]], chunk_chars: int = CHUNK_CHARS,
+                    overlap: int = CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    documents: [{"id", "text", "metadata"}] -> chunks [{"id", "text", "metadata"}]
+    ready for col.add / upload_chunks.
+    """
+    out = []
+    for doc in documents:
+        parent_id = str(doc["id"])
+        base_meta = dict(doc.get("metadata") or {})
+        pieces = chunk_text(doc.get("text") or "", chunk_chars, overlap)
+        for i, piece in enumerate(pieces):
+            meta = dict(base_meta)
+            meta.update({
+                "parent_id": parent_id,
+                "chunk_index": i,
+                "chunk_count": len(pieces),
+                "section": piece["section"],
+                "char_start": piece["char_start"],
+                "char_end": piece["char_end"],
+            })
+            out.append({"id": chunk_id(parent_id, i), "text": piece["text"], "metadata": meta})
+    return out
+
+
+def upload_chunks(col, chunks: Sequence[Dict[str, Any]], encode_fn: Callable[[List[str]], Any],
+                  batch_size: int = 64, replace_parents: bool = True,
+                  feature_fn: Optional[Callable[[str], Dict[str, Any]]] = None) -> int:
+    """
+    Embed and add chunks in batches. With replace_parents, chunks previously
+    stored for the same parents are deleted first (a re-chunked document may
+    have fewer chunks than before). feature_fn(text) adds query-independent
+    fields to each chunk's metadata (rag_rerank.rerank_features); lang and
+    rk_len are always written so filter pushdown stays valid.
+    Returns the number of chunks written.
+    """
+    if replace_parents:
+        parents = sorted({c["metadata"]["parent_id"] for c in chunks})
+        for parent_id in parents:
+            col.delete(where={"parent_id": parent_id})
+            col.delete(ids=[parent_id])  # unchunked legacy copy of the same document
+    written = 0
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        texts = [c["text"] for c in batch]
+        embeddings = encode_fn(texts)
+        metadatas = [dict(c["metadata"]) for c in batch]
+        if feature_fn is not None:
+            metadatas = [dict(m, **feature_fn(t)) for m, t in zip(metadatas, texts)]
+        # A pushed-down filter (rag_planner) excludes documents missing its field
+        for meta, text in zip(metadatas, texts):
+            meta.setdefault("lang", DEFAULT_LANG)
+            meta["rk_len"] = len(text)
+        col.add(
+            ids=[c["id"] for c in batch],
+            documents=texts,
+            metadatas=metadatas,
+            embeddings=[e.tolist() if hasattr(e, "tolist") else list(e) for e in embeddings],
+        )
+        written += len(batch)
+    return written
@@ -0,0 +1,141 @@
+"""
+Lexical retrieval for the RAG pipeline.
+
+- tokenize: lower-cased word tokens that keep legal references intact
+  ("489-f" is indexed as "489-f", "489" and "f"; roman numerals like "xxi" stay)
+- BM25Index: in-memory inverted index, postings stored CSR-style in numpy
+  arrays (indptr / doc / tf) instead of per-term Python lists
+- reciprocal_rank_fusion: merge several rankings of ids into one
+"""
+
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-/][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens for indexing and querying; compound tokens also emit their parts."""
+    tokens = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        if tok in STOPWORDS:
+            continue
+        tokens.append(tok)
+        if "-" in tok or "/" in tok:
+            tokens.extend(p for p in re.split(r"[-/]", tok) if p and p not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed document set. Rows are positions in the lists
+    passed to build(); ids/documents/metadatas are kept so lexical-only hits
+    can be returned without another round trip.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.vocab: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.post_doc = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.doc_norm = np.zeros(0, dtype=np.float32)   # k1 * (1 - b + b * len / avg_len)
+        self.built_at = 0.0
+        self.build_seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, ids: Sequence[str], documents: Sequence[str],
+              metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> "BM25Index":
+        started = time.perf_counter()
+        self.ids = [str(i) for i in ids]
+        self.documents = [d or "" for d in documents]
+        self.metadatas = [m or {} for m in (metadatas if metadatas is not None else [None] * len(ids))]
+
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_rows: List[int] = []
+        tfs: List[int] = []
+        doc_len = np.zeros(len(self.ids), dtype=np.float32)
+        for row, text in enumerate(self.documents):
+            counts = Counter(tokenize(text))
+            doc_len[row] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_rows.append(row)
+                tfs.append(tf)
+
+        term_arr = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_arr, kind="stable")
+        self.vocab = vocab
+        self.post_doc = np.asarray(doc_rows, dtype=np.int32)[order]
+        self.post_tf = np.asarray(tfs, dtype=np.float32)[order]
+        df = np.bincount(term_arr, minlength=len(vocab))
+        self.indptr = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+        n_docs = max(len(self.ids), 1)
+        self.idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_len = float(doc_len.mean()) if len(doc_len) else 1.0
+        self.doc_norm = (self.k1 * (1.0 - self.b + self.b * doc_len / max(avg_len, 1.0))).astype(np.float32)
+        self.built_at = time.time()
+        self.build_seconds = time.perf_counter() - started
+        return self
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[int, float]]:
+        """Top-k (row, score) pairs, best first; empty if no query term is indexed."""
+        started = time.perf_counter()
+        terms = [self.vocab[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocab]
+        hits: List[Tuple[int, float]] = []
+        if terms and k > 0:
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            for t in terms:
+                start, end = self.indptr[t], self.indptr[t + 1]
+                docs = self.post_doc[start:end]
+                tf = self.post_tf[start:end]
+                # rows are unique within one posting list, so fancy-index += is safe
+                scores[docs] += self.idf[t] * tf * (self.k1 + 1.0) / (tf + self.doc_norm[docs])
+            matched = np.flatnonzero(scores)
+            if len(matched) > k:
+                matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+            matched = matched[np.argsort(-scores[matched], kind="stable")]
+            hits = [(int(r), float(scores[r])) for r in matched]
+        self.queries += 1
+        self.query_seconds += time.perf_counter() - started
+        return hits
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.ids),
+            "terms": len(self.vocab),
+            "postings": int(len(self.post_doc)),
+            "postings_bytes": int(self.post_doc.nbytes + self.post_tf.nbytes + self.indptr.nbytes),
+            "build_seconds": round(self.build_seconds, 3),
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds / self.queries * 1000.0, 3) if self.queries else None,
+        }
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60,
+                           weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists: score(id) = sum(weight / (k + rank)), rank starting at 1."""
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, _id in enumerate(ranking, start=1):
+            fused[_id] = fused.get(_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda kv: -kv[1])
@@ -0,0 +1,243 @@
+"""
+Case metadata (parties, PLD/SCMR citation, court, judge, judgment date,
+statute/clause references) extracted from judgment text.
+
+- extract_case_metadata: heuristic regex extraction, patterns compiled once
+  at import
+- build_case_metadata: run the extraction over many documents with a
+  process pool (it is pure-Python regex work, so threads would not help)
+- CaseMetadataIndex: extraction results keyed by document id, persisted as
+  JSON so the query path is a dictionary lookup
+
+Chunked documents (rag_ingest) are indexed under their parent_id, with the
+chunks joined back in order, so parties / court from the first page apply
+to every chunk of the judgment.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+SNIPPET_CHARS = 35000    # only the start of a judgment is searched
+HEADER_LINES = 80        # parties / judge are looked for in the first lines
+
+CASE_FIELDS_REGEX = {
+    "pld": re.compile(r'\bPLD\s+\d{4}\s+\w+\s+\d+', re.IGNORECASE),
+    "scmr": re.compile(r'\bSCMR\s*\d{1,6}', re.IGNORECASE),
+    "judgment_date_iso": re.compile(r'\b(?:Dated|Date of judgment|Judgment Date)[:\s\-]*([0-9]{1,2}[\/\-][0-9]{1,2}[\/\-][0-9]{2,4})', re.IGNORECASE),
+    "judgment_date_text": re.compile(r'\bJudgment\s+dated[:\s]*([A-Za-z]+\s+\d{1,2},\s*\d{4})', re.IGNORECASE),
+}
+
+PARTIES_RE = re.compile(r'([A-Z][\w\.\-\,\s]{1,120}?)\s+(?:v\.|vs\.|versus|v)\s+([A-Z][\w\.\-\,\s]{1,120}?)')
+JUDGMENT_DATE_TEXT_RE = re.compile(r'\bJudgment\s+dated[:\s]*([A-Za-z]+\s+\d{1,2},\s*\d{4})', re.IGNORECASE)
+JUDGMENT_DATE_NUM_RE = re.compile(r'\b(?:Dated|Date of judgment|Judgment Date)[:\s]*([0-9]{1,2}[\/\-][0-9]{1,2}[\/\-][0-9]{2,4})', re.IGNORECASE)
+
+JUDGE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'Hon(?:\'ble)?\s+Mr\.?\s+Justice\s+([A-Z][A-Za-z\-\s\.]+)',
+    r'Hon(?:\'ble)?\s+Mr?\.?\s+Justice\s+([A-Z][A-Za-z\-\s\.]+)',
+    r'J(?:ustice)?\.\s+([A-Z][A-Za-z\-\s\.]+)',
+    r'Before\s+Mr\.?\s+Justice\s+([A-Z][A-Za-z\-\s\.]+)',
+    r'Coram[:\s]+([A-Z][A-Za-z\-\s\,\.\s]+)',
+)]
+
+COURT_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'(?:(?:Lahore High Court)|(?:Sindh High Court)|(?:Supreme Court of Pakistan)|(?:High Court of [A-Za-z]+))',
+    r'\bHigh Court\b', r'\bDistrict Court\b', r'\bCivil Court\b',
+)]
+
+CLAUSE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'\bSection\s+\d+[A-Za-z0-9\-]*', r'\bSec\.\s*\d+', r'\bClause\s+\d+',
+    r'\bOrder\s+XXI\s+Rule\s+\d+', r'\bOrder\s+[IVXLCDM]+\b', r'\bArticle\s+\d+',
+)]
+
+
+def _extractor_version() -> str:
+    """Hash of every pattern, so a persisted index is rebuilt when the heuristics change."""
+    patterns = [rx.pattern for rx in CASE_FIELDS_REGEX.values()]
+    patterns += [PARTIES_RE.pattern, JUDGMENT_DATE_TEXT_RE.pattern, JUDGMENT_DATE_NUM_RE.pattern]
+    patterns += [rx.pattern for rx in JUDGE_PATTERNS + COURT_PATTERNS + CLAUSE_PATTERNS]
+    payload = json.dumps([patterns, SNIPPET_CHARS, HEADER_LINES])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+EXTRACTOR_VERSION = _extractor_version()
+
+
+def extract_case_metadata(text: str) -> Dict[str, str]:
+    """
+    Try to extract case metadata: parties, PLD/SCMR citations, judgment date,
+    judge name, court name, statute/clause references.
+    This is heuristic — it returns what it finds, or empty dict keys if none.
+    """
+    out = {}
+    snippet = (text or "")[:SNIPPET_CHARS]  # large snippet to search
+
+    # PLD / SCMR / date heuristics
+    for k, rx in CASE_FIELDS_REGEX.items():
+        m = rx.search(snippet)
+        if m:
+            out[k] = m.group(0).strip()
+
+    # Parties (try to find 'X v. Y' near top)
+    header_text = " ".join(snippet.splitlines()[:HEADER_LINES])
+    m = PARTIES_RE.search(header_text)
+    if m:
+        out['parties'] = m.group(0).strip()
+
+    # Judgment date (text or numeric)
+    m = JUDGMENT_DATE_TEXT_RE.search(snippet)
+    if m:
+        out['judgment_date'] = m.group(1).strip()
+    else:
+        m2 = JUDGMENT_DATE_NUM_RE.search(snippet)
+        if m2:
+            out['judgment_date'] = m2.group(1).strip()
+
+    # Judge detection: common patterns
+    for rx in JUDGE_PATTERNS:
+        m = rx.search(header_text)
+        if m:
+            out['judge'] = m.group(1).strip()
+            break
+
+    # Court detection
+    for rx in COURT_PATTERNS:
+        m = rx.search(snippet)
+        if m:
+            out['court'] = m.group(0).strip()
+            break
+
+    # Statute/clause references
+    clauses_found = set()
+    for rx in CLAUSE_PATTERNS:
+        for m in rx.finditer(snippet):
+            clauses_found.add(m.group(0).strip())
+    if clauses_found:
+        out['clauses'] = "; ".join(sorted(clauses_found))
+
+    return out
+
+
+def build_case_metadata(texts: Sequence[str], workers: Optional[int] = None,
+                        chunksize: int = 16) -> List[Dict[str, str]]:
+    """extract_case_metadata for every text, in order; workers=1 runs inline."""
+    texts = [(t or "")[:SNIPPET_CHARS] for t in texts]
+    if workers == 1 or len(texts) < 2 * chunksize:
+        return [extract_case_metadata(t) for t in texts]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(extract_case_metadata, texts, chunksize=chunksize))
+
+
+def group_by_parent(ids: Sequence[str], documents: Sequence[str],
+                    metadatas: Sequence[Optional[Dict[str, Any]]]) -> Iterable[Tuple[str, str]]:
+    """
+    (key, text) per case: unchunked documents as they are, chunks joined in
+    chunk order under their parent_id (clipped to SNIPPET_CHARS).
+    """
+    parents: Dict[str, List[Tuple[int, str]]] = {}
+    for _id, doc, meta in zip(ids, documents, metadatas):
+        meta = meta or {}
+        key = str(meta.get("parent_id") or _id)
+        parents.setdefault(key, []).append((int(meta.get("chunk_index", 0) or 0), doc or ""))
+    for key, parts in parents.items():
+        parts.sort(key=lambda p: p[0])
+        text, size = [], 0
+        for _i, doc in parts:
+            if size >= SNIPPET_CHARS:
+                break
+            text.append(doc)
+            size += len(doc) + 1
+        yield key, "\n".join(text)
+
+
+class CaseMetadataIndex:
+    """
+    Case metadata keyed by document (parent) id, persisted as one JSON file.
+    An index written by a different EXTRACTOR_VERSION is ignored on load.
+    """
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self._entries: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self.built_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def lookup_many(self, keys: Sequence[str]) -> List[Optional[Dict[str, str]]]:
+        """Bulk lookup for index builders (not counted as query hits/misses)."""
+        with self._lock:
+            return [self._entries.get(k) for k in keys]
+
+    def update(self, entries: Dict[str, Dict[str, str]]):
+        with self._lock:
+            self._entries.update(entries)
+
+    def retain(self, keys: Iterable[str]) -> int:
+        """Drop entries whose key is not in `keys`; returns how many were dropped."""
+        keep = set(keys)
+        with self._lock:
+            stale = [k for k in self._entries if k not in keep]
+            for k in stale:
+                del self._entries[k]
+        return len(stale)
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            payload = {"version": EXTRACTOR_VERSION, "built_at": time.time(), "documents": dict(self._entries)}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self.built_at = payload["built_at"]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except Exception as e:
+            print(f"Warning: Could not load case metadata index: {e}")
+            return
+        if payload.get("version") != EXTRACTOR_VERSION:
+            print(f"Case metadata index {self.path} was built by another extractor version; "
+                  f"ignoring it (rebuild with build_case_metadata.py)")
+            return
+        self._entries = payload.get("documents") or {}
+        self.built_at = float(payload.get("built_at") or 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._entries),
+                "version": EXTRACTOR_VERSION,
+                "built_at": self.built_at or None,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
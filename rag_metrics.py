@@ -0,0 +1,108 @@
+"""
+Lightweight runtime metrics for the RAG pipeline.
+
+- RetrievalStats: per-query k and query rounds, and per-call latency (a
+  batch is one sample with its size, kept apart from single queries), with
+  a rolling window for percentiles, plus two-phase body fetch counts, how often rerank
+  features came from metadata, how often citation lookups seeded or
+  replaced dense search and how often filtering left nothing but the
+  unfiltered fallback (exposed through get_runtime_stats / /api/stats)
+"""
+
+import threading
+from collections import Counter, deque
+from typing import Any, Dict
+
+import numpy as np
+
+
+class RetrievalStats:
+    """Thread-safe counters for retrieval calls."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)         # single-query calls
+        self._batch_latencies = deque(maxlen=window)   # (seconds, queries) per batch call
+        self._ks = deque(maxlen=window)
+        self.k_histogram: Counter = Counter()
+        self.queries = 0
+        self.rounds = 0
+        self.widened = 0
+        self.bodies_fetched = 0   # two-phase: documents loaded by id
+        self.fetch_rounds = 0
+        self.features_stored = 0     # candidates ranked from rk_* metadata
+        self.features_computed = 0   # legacy candidates scanned at query time
+        self.reference_seeded = 0    # dense results fused with exact citation hits
+        self.reference_shortcuts = 0  # citation-only queries answered without dense search
+        self.unfiltered_fallbacks = 0  # every candidate failed the language / length filters
+
+    def record(self, k: int, rounds: int):
+        """k and query rounds of one dense query."""
+        with self._lock:
+            self.queries += 1
+            self.rounds += rounds
+            self.widened += 1 if rounds > 1 else 0
+            self.k_histogram[int(k)] += 1
+            self._ks.append(int(k))
+
+    def record_latency(self, seconds: float, batch_size: int = 1):
+        """Wall time of one retrieval call answering batch_size queries."""
+        with self._lock:
+            if batch_size <= 1:
+                self._latencies.append(seconds)
+            else:
+                self._batch_latencies.append((seconds, int(batch_size)))
+
+    def record_fetch(self, documents: int):
+        with self._lock:
+            self.bodies_fetched += documents
+            self.fetch_rounds += 1
+
+    def record_features(self, stored: int, computed: int):
+        with self._lock:
+            self.features_stored += stored
+            self.features_computed += computed
+
+    def record_reference(self, shortcut: bool):
+        with self._lock:
+            if shortcut:
+                self.reference_shortcuts += 1
+            else:
+                self.reference_seeded += 1
+
+    def record_fallback(self):
+        with self._lock:
+            self.unfiltered_fallbacks += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = np.asarray(self._latencies, dtype=np.float64) * 1000.0
+            batches = np.asarray(self._batch_latencies, dtype=np.float64).reshape(-1, 2)
+            batch_lat = batches[:, 0] * 1000.0
+            ks = np.asarray(self._ks, dtype=np.float64)
+            return {
+                "queries": self.queries,
+                "widened": self.widened,
+                "avg_rounds": round(self.rounds / self.queries, 3) if self.queries else None,
+                "avg_k": round(float(ks.mean()), 2) if len(ks) else None,
+                "k_histogram": {str(k): n for k, n in sorted(self.k_histogram.items())},
+                "bodies_fetched": self.bodies_fetched,
+                "fetch_rounds": self.fetch_rounds,
+                "features_stored": self.features_stored,
+                "features_computed": self.features_computed,
+                "reference_seeded": self.reference_seeded,
+                "reference_shortcuts": self.reference_shortcuts,
+                "unfiltered_fallbacks": self.unfiltered_fallbacks,
+                "latency_ms": {
+                    "p50": round(float(np.percentile(lat, 50)), 2),
+                    "p95": round(float(np.percentile(lat, 95)), 2),
+                    "max": round(float(lat.max()), 2),
+                } if len(lat) else None,
+                "batch_latency_ms": {
+                    "calls": len(batches),
+                    "avg_batch_size": round(float(batches[:, 1].mean()), 2),
+                    "p50": round(float(np.percentile(batch_lat, 50)), 2),
+                    "p95": round(float(np.percentile(batch_lat, 95)), 2),
+                    "max": round(float(batch_lat.max()), 2),
+                } if len(batches) else None,
+            }
@@ -0,0 +1,352 @@
+"""
+Multi-process exact search over a local snapshot.
+
+A single Python process scores on one core. ParallelExactIndex copies the
+snapshot's stored vectors (float32 / float16 / int8 codes, int8 scales and
+the alive mask) into shared memory and starts N worker processes attached
+to it. Each query block is broadcast to the workers, each scores its
+contiguous slice of rows and returns its local top-k, and the parent merges
+the per-shard results (then rescores with float32 vectors, like ExactIndex).
+
+Slices are recomputed from the current row count on every query, so rows
+appended by upsert() are spread over all workers. Below min_rows the search
+stays in-process, where the IPC round trip would cost more than it saves.
+
+Every busy worker is read before a failure is raised, so no reply is left
+in a pipe to be taken for the next query's; a worker that exited, or did
+not reply within reply_timeout seconds (stuck, stopped, swapping), is
+respawned on the current shared blocks.
+
+Memory: the shared blocks are a copy. The parent keeps the snapshot's own
+VectorStore (inline search below min_rows, upserts, snapshot saves), so
+the stored vectors are resident twice, plus the float32 exact copy when
+rescoring; stats() reports both sizes.
+
+Used as RAG_SEARCH_BACKEND=parallel (see chroma_test._build_local_index).
+"""
+
+import multiprocessing as mp
+import os
+import threading
+import time
+import weakref
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from rag_index import CollectionSnapshot, ExactIndex
+
+# BLAS threads per worker: the workers are the parallelism
+_WORKER_ENV = {"OMP_NUM_THREADS": "1", "OPENBLAS_NUM_THREADS": "1", "MKL_NUM_THREADS": "1"}
+_env_lock = threading.Lock()
+
+
+def _attach(layout: Dict[str, Any]):
+    """numpy views over the shared blocks of `layout` (plus the handles keeping them open)."""
+    handles, arrays = [], {}
+    shapes = {
+        "data": ((layout["capacity"], layout["dim"]), layout["dtype"]),
+        "scales": ((layout["capacity"],), "float32"),
+        "alive": ((layout["capacity"],), "bool"),
+    }
+    for key, (shape, dtype) in shapes.items():
+        # Workers share the parent's resource tracker, so attaching does not
+        # add a registration of their own; the parent unlinks the blocks
+        shm = shared_memory.SharedMemory(name=layout["names"][key])
+        handles.append(shm)
+        arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return arrays, handles
+
+
+def _search_slice(arrays: Dict[str, np.ndarray], dtype: str, queries: np.ndarray, k: int,
+                  lo: int, hi: int, block_rows: int):
+    """Top-k (rows, sims) of rows [lo, hi) for every query, best first."""
+    data, scales, alive = arrays["data"], arrays["scales"], arrays["alive"]
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    best_sims = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(lo, hi, block_rows):
+        end = min(start + block_rows, hi)
+        block = data[start:end]
+        sims = queries @ (block if dtype == "float32" else block.astype(np.float32)).T
+        if dtype == "int8":
+            sims *= scales[start:end]
+        sims[:, ~alive[start:end]] = -np.inf
+        cand_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), sims.shape)], axis=1)
+        cand_sims = np.concatenate([best_sims, sims.astype(np.float32, copy=False)], axis=1)
+        cols, best_sims = ExactIndex._top(cand_sims, min(k, cand_sims.shape[1]))
+        best_rows = np.take_along_axis(cand_rows, cols, axis=1)
+    return best_rows, best_sims
+
+
+def _worker_main(conn, layout: Dict[str, Any], block_rows: int):
+    arrays, handles = _attach(layout)
+    dtype = layout["dtype"]
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        op = msg[0]
+        if op == "stop":
+            break
+        try:
+            if op == "attach":
+                del arrays
+                for shm in handles:
+                    shm.close()
+                layout = msg[1]
+                arrays, handles = _attach(layout)
+                conn.send(("ok",))
+            elif op == "search":
+                _op, queries, k, lo, hi = msg
+                conn.send(("ok",) + _search_slice(arrays, dtype, queries, k, lo, hi, block_rows))
+            else:
+                conn.send(("error", f"unknown op {op!r}"))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+    del arrays
+    for shm in handles:
+        shm.close()
+
+
+def _shutdown(processes, conns, blocks):
+    for conn in conns:
+        try:
+            conn.send(("stop",))
+        except Exception:
+            pass
+    for proc in processes:
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.terminate()
+    for shm in blocks:
+        for release in (shm.unlink, shm.close):
+            try:
+                release()
+            except Exception:
+                pass
+
+
+class ParallelExactIndex(ExactIndex):
+    """
+    ExactIndex whose scoring is split across worker processes holding the
+    snapshot's vectors in shared memory. Same add/delete/search interface.
+    """
+
+    def __init__(self, snapshot: CollectionSnapshot, workers: int = 0, rescore_factor: int = 0,
+                 min_rows: int = 20000, block_rows: int = 16384, start_method: str = "spawn",
+                 reply_timeout: float = 30.0):
+        super().__init__(snapshot, rescore_factor=rescore_factor)
+        self.n_workers = max(1, workers or os.cpu_count() or 1)
+        self.min_rows = min_rows
+        self.block_rows = block_rows
+        self.reply_timeout = reply_timeout
+        self._ctx = mp.get_context(start_method)
+        self._lock = threading.Lock()
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._layout: Dict[str, Any] = {}
+        self.capacity = 0
+        self.parallel_queries = 0
+        self.inline_queries = 0
+        self.grown = 0
+
+        n = len(snapshot.ids)
+        self._allocate(max(1024, int(n * 1.25)))
+        self._write(np.arange(n, dtype=np.int64))
+
+        self.respawned = 0
+        self.timeouts = 0
+
+        started = time.perf_counter()
+        self._conns, self._processes = [], []
+        for i in range(self.n_workers):
+            conn, proc = self._spawn(i)
+            self._conns.append(conn)
+            self._processes.append(proc)
+        self.start_seconds = time.perf_counter() - started
+        self._finalizer = weakref.finalize(self, _shutdown, self._processes, self._conns, self._blocks)
+
+    # -- workers --
+    def _spawn(self, i: int):
+        """(parent end of the pipe, process) of a new worker attached to the current blocks."""
+        with _env_lock:
+            saved = {key: os.environ.get(key) for key in _WORKER_ENV}
+            os.environ.update(_WORKER_ENV)
+            try:
+                parent_conn, child_conn = self._ctx.Pipe()
+                proc = self._ctx.Process(target=_worker_main, args=(child_conn, self._layout, self.block_rows),
+                                         name=f"rag-search-{i}", daemon=True)
+                proc.start()
+                child_conn.close()
+            finally:
+                for key, value in saved.items():
+                    if value is None:
+                        os.environ.pop(key, None)
+                    else:
+                        os.environ[key] = value
+        return parent_conn, proc
+
+    def _respawn(self, i: int):
+        """Replace worker i (exited, or its pipe is unusable); same list objects as the finalizer's."""
+        conn, proc = self._conns[i], self._processes[i]
+        try:
+            conn.close()
+        except Exception:
+            pass
+        if proc.is_alive():
+            proc.kill()        # SIGTERM would stay pending in a stopped process
+        proc.join(timeout=5)
+        self._conns[i], self._processes[i] = self._spawn(i)
+        self.respawned += 1
+        print(f"[PARALLEL] Search worker {i} respawned")
+
+    def _send(self, i: int, msg) -> bool:
+        try:
+            self._conns[i].send(msg)
+            return True
+        except (BrokenPipeError, EOFError, OSError):
+            self._respawn(i)
+            return False
+
+    def _gather(self, busy: Sequence[int], failed: Sequence[int] = ()):
+        """
+        Replies of the workers in `busy`, in order. Every one is read before
+        anything is raised, so a failed query leaves no stale reply behind;
+        `failed` are workers whose request could not be sent at all. A worker
+        with no reply by the deadline is replaced, like one that exited.
+        """
+        replies, errors = [], [f"worker {i}: request not delivered" for i in failed]
+        deadline = time.monotonic() + self.reply_timeout
+        for i in busy:
+            try:
+                if self._conns[i].poll(max(0.0, deadline - time.monotonic())):
+                    reply = self._conns[i].recv()
+                else:
+                    self.timeouts += 1
+                    self._respawn(i)
+                    reply = ("error", f"no reply within {self.reply_timeout}s")
+            except (EOFError, OSError) as e:
+                self._respawn(i)
+                reply = ("error", f"exited ({e!r})")
+            if reply[0] != "ok":
+                errors.append(f"worker {i}: {reply[1]}")
+            replies.append(reply[1:])
+        if errors:
+            raise RuntimeError(f"Search worker failed: {'; '.join(errors)}")
+        return replies
+
+    # -- shared memory --
+    def _allocate(self, capacity: int):
+        """New shared blocks of `capacity` rows, keeping the current contents."""
+        dim = self.snapshot.vectors.dim
+        dtype = self.snapshot.vectors.dtype
+        specs = {"data": ((capacity, dim), dtype), "scales": ((capacity,), "float32"),
+                 "alive": ((capacity,), "bool")}
+        blocks, arrays, names = [], {}, {}
+        for key, (shape, kind) in specs.items():
+            nbytes = max(1, int(np.prod(shape)) * np.dtype(kind).itemsize)
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            arr = np.ndarray(shape, dtype=np.dtype(kind), buffer=shm.buf)
+            arr[:] = 0
+            if key in self._arrays:
+                arr[:self.capacity] = self._arrays[key][:self.capacity]
+            blocks.append(shm)
+            arrays[key] = arr
+            names[key] = shm.name
+        old = list(self._blocks)
+        self._arrays = arrays
+        self._blocks[:] = blocks   # same list object as the finalizer's
+        self._layout = {"names": names, "capacity": capacity, "dim": dim, "dtype": dtype}
+        self.capacity = capacity
+        return old
+
+    def _grow(self, rows: int):
+        old = self._allocate(max(rows, 2 * self.capacity))
+        # Workers that cannot attach are replaced by ones started on the new blocks
+        sent = [i for i in range(len(self._conns)) if self._send(i, ("attach", self._layout))]
+        for i in sent:
+            conn = self._conns[i]
+            try:
+                self._gather([i])
+            except RuntimeError as e:
+                print(f"[PARALLEL] {e}")
+                if self._conns[i] is conn:   # not already replaced by _gather
+                    self._respawn(i)
+        for shm in old:
+            shm.unlink()
+            try:
+                shm.close()
+            except BufferError:
+                pass  # a view is still alive somewhere; the mapping goes with it
+        self.grown += 1
+
+    def _write(self, rows: np.ndarray):
+        if len(rows) == 0:
+            return
+        codes, scales = self.snapshot.vectors.stored(rows)
+        self._arrays["data"][rows] = codes
+        self._arrays["scales"][rows] = scales
+        self._arrays["alive"][rows] = self.snapshot.alive[rows]
+
+    # -- index interface --
+    def add(self, embeddings: np.ndarray, labels: np.ndarray):
+        labels = np.asarray(labels, dtype=np.int64)
+        with self._lock:
+            if len(labels) and int(labels.max()) >= self.capacity:
+                self._grow(int(labels.max()) + 1)
+            self._write(labels)
+
+    def delete(self, labels: Sequence[int]):
+        labels = np.asarray(list(labels), dtype=np.int64)
+        with self._lock:
+            self._arrays["alive"][labels[labels < self.capacity]] = False
+
+    def search(self, queries: np.ndarray, k: int):
+        """(labels, 1 - cos) arrays of shape (n_queries, k'), best first."""
+        n_docs = len(self.snapshot.vectors)
+        if n_docs < self.min_rows or self.n_workers == 1:
+            self.inline_queries += len(queries)
+            return super().search(queries, k)
+        k = min(k, len(self.snapshot))
+        if k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        first_k = min(k * self.rescore_factor, len(self.snapshot)) if self.rescore_factor else k
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        bounds = np.linspace(0, n_docs, self.n_workers + 1).astype(np.int64)
+        with self._lock:
+            busy, failed = [], []
+            for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+                if hi > lo:
+                    (busy if self._send(i, ("search", queries, first_k, int(lo), int(hi))) else failed).append(i)
+            parts = self._gather(busy, failed)
+        rows = np.concatenate([p[0] for p in parts], axis=1)
+        sims = np.concatenate([p[1] for p in parts], axis=1)
+        cols, top_sims = self._top(sims, first_k)
+        top = np.take_along_axis(rows, cols, axis=1)
+        if first_k > k:
+            top, top_sims = self._rescore(queries, top, k)
+        self.parallel_queries += len(queries)
+        return top, 1.0 - top_sims
+
+    def close(self):
+        self._finalizer()
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out.update({
+            "workers": self.n_workers,
+            "workers_alive": sum(1 for p in self._processes if p.is_alive()),
+            "min_rows": self.min_rows,
+            "shared_capacity_rows": self.capacity,
+            "shared_bytes": int(sum(shm.size for shm in self._blocks)),
+            "snapshot_bytes": self.snapshot.vectors.stats()["bytes"],   # parent's copy, see module docstring
+            "respawned": self.respawned,
+            "timeouts": self.timeouts,
+            "parallel_queries": self.parallel_queries,
+            "inline_queries": self.inline_queries,
+            "grown": self.grown,
+            "start_seconds": round(self.start_seconds, 3),
+        })
+        return out
@@ -0,0 +1,120 @@
+"""
+Filter pushdown planning for Chroma queries.
+
+rerank_and_filter drops non-English and too-short documents after the
+nearest-neighbour query, so every dropped hit is a wasted result slot. Both
+predicates can be expressed as a Chroma `where` clause instead:
+
+- language: {"lang": {"$nin": [rejected values]}}
+- length:   {"rk_len": {"$gte": MIN_LENGTH}} (stored at ingest, see rag_rerank)
+
+Chroma excludes documents that lack a filtered key, whereas the post-filter
+keeps them (missing lang = English, missing length = not checked), so a
+predicate is only pushed down when every document stores its field.
+FilterStats counts, once, how many documents each predicate would drop;
+plan() pushes down the predicates that drop enough to matter and sizes the
+over-fetch for whatever is still post-filtered. The counts describe the
+collection at build time: chroma_test recollects them when col.count()
+changes, and rag_ingest writes lang / rk_len on every chunk so new
+documents do not break a pushed predicate in the meantime.
+"""
+
+import math
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class FilterStats:
+    """Selectivity of the language / length predicates over the stored metadata."""
+
+    def __init__(self, min_length: int, lang_allowed: Callable[[Any], bool]):
+        self.min_length = min_length
+        self.lang_allowed = lang_allowed
+        self.total = 0
+        self.lang_values: Counter = Counter()   # raw stored value -> documents
+        self.missing_lang = 0
+        self.missing_len = 0
+        self.short = 0
+        self.build_seconds = 0.0
+        self.checked_at = time.monotonic()   # last time the caller compared the document count
+        self.plans: Counter = Counter()
+
+    def __len__(self) -> int:
+        return self.total
+
+    def add(self, metadatas: Iterable[Optional[Dict[str, Any]]]) -> "FilterStats":
+        started = time.perf_counter()
+        for meta in metadatas:
+            meta = meta or {}
+            self.total += 1
+            if "lang" in meta:
+                self.lang_values[meta["lang"]] += 1
+            else:
+                self.missing_lang += 1
+            length = meta.get("rk_len")
+            if length is None:
+                self.missing_len += 1
+            elif int(length) < self.min_length:
+                self.short += 1
+        self.build_seconds += time.perf_counter() - started
+        return self
+
+    def rejected_langs(self):
+        return [v for v in self.lang_values if not self.lang_allowed(v)]
+
+    def plan(self, min_drop: float = 0.02, max_overfetch: float = 4.0) -> Dict[str, Any]:
+        """
+        {"where": Chroma filter or None, "pushed": [...], "post": [...], "overfetch": factor}.
+        A predicate is pushed down when it is expressible over every document
+        and drops at least min_drop of them; the post-filtered remainder is
+        compensated by fetching up to max_overfetch times more results.
+        """
+        total = max(self.total, 1)
+        rejected = self.rejected_langs()
+        predicates = {
+            "lang": ({"lang": {"$nin": rejected}},
+                     sum(self.lang_values[v] for v in rejected) / total,
+                     self.missing_lang == 0 and all(isinstance(v, str) for v in rejected)),
+            "length": ({"rk_len": {"$gte": self.min_length}},
+                       self.short / total,
+                       self.missing_len == 0),
+        }
+        clauses, pushed, post = [], [], []
+        keep_fraction = 1.0
+        for name, (clause, drop, pushable) in predicates.items():
+            if drop <= 0.0:
+                continue
+            if pushable and drop >= min_drop:
+                clauses.append(clause)
+                pushed.append(name)
+            else:
+                post.append(name)
+                keep_fraction *= 1.0 - drop  # assumes the predicates are independent
+        where = None
+        if len(clauses) == 1:
+            where = clauses[0]
+        elif clauses:
+            where = {"$and": clauses}
+        overfetch = 1.0
+        if post:
+            overfetch = min(max_overfetch, 1.0 / keep_fraction) if keep_fraction > 0 else max_overfetch
+        self.plans["pushdown" if pushed else "postfilter"] += 1
+        return {"where": where, "pushed": pushed, "post": post, "overfetch": overfetch}
+
+    def fetch_k(self, k: int, plan: Dict[str, Any]) -> int:
+        """Results to request so that about k survive the post-filter."""
+        return max(k, int(math.ceil(k * plan["overfetch"])))
+
+    def stats(self) -> Dict[str, Any]:
+        total = max(self.total, 1)
+        rejected = self.rejected_langs()
+        return {
+            "documents": self.total,
+            "lang_dropped": round(sum(self.lang_values[v] for v in rejected) / total, 4),
+            "short_dropped": round(self.short / total, 4),
+            "missing_lang": self.missing_lang,
+            "missing_len": self.missing_len,   # > 0: run backfill_rerank_features.py to push length down
+            "build_seconds": round(self.build_seconds, 3),
+            "plans": dict(self.plans),
+        }
@@ -0,0 +1,166 @@
+"""
+Exact legal-reference lookup.
+
+- extract_references: normalized keys for the citations and statute
+  references a text contains, e.g.
+    "PLD 2015 Lah. 123"        -> "pld 2015 lahore 123"
+    "2004 SCMR 1234"           -> "scmr 2004 1234" (and "scmr 1234")
+    "Section 489-F", "Sec. 489F" -> "section 489f"
+    "Article 199"              -> "article 199"
+    "Order XXI Rule 37", "O. 21 R. 37" -> "order 21 rule 37"
+- ReferenceIndex: inverted index from those keys to documents, so a pasted
+  citation resolves without embedding it
+
+Patterns follow CASE_FIELDS_REGEX and the clause patterns in rag_metadata,
+widened to the common abbreviated forms.
+"""
+
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag_lexical import tokenize
+
+# Court abbreviations used in PLD citations
+PLD_COURTS = {
+    "lah": "lahore", "lhr": "lahore", "kar": "karachi", "khi": "karachi", "pesh": "peshawar",
+    "pes": "peshawar", "isl": "islamabad", "qta": "quetta", "bal": "quetta", "supreme": "sc",
+}
+
+_ROMAN = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+
+PLD_RE = re.compile(r'\bPLD\s+(\d{4})\s+([A-Za-z][A-Za-z\.]*)\s+(\d+)', re.IGNORECASE)
+SCMR_RE = re.compile(r'\b(?:(\d{4})\s+)?SCMR\s*(\d{1,6})\b', re.IGNORECASE)
+SECTION_RE = re.compile(r'\b(?:Section|Sec\.?)\s*(\d+(?:-?[A-Za-z]{1,2})?)\b', re.IGNORECASE)
+ARTICLE_RE = re.compile(r'\b(?:Article|Art\.)\s*(\d+(?:-?[A-Za-z])?)\b', re.IGNORECASE)
+ORDER_RULE_RE = re.compile(
+    r'\b(?:Order|O\.)\s*([IVXLCDM]+|\d+)\s*,?\s*(?:Rule|R\.|r\.)\s*(\d+(?:-?[A-Za-z])?)\b', re.IGNORECASE)
+
+
+def _roman_to_int(value: str) -> Optional[int]:
+    total, prev = 0, 0
+    for ch in reversed(value.lower()):
+        n = _ROMAN.get(ch)
+        if n is None:
+            return None
+        total = total - n if n < prev else total + n
+        prev = max(prev, n)
+    return total or None
+
+
+def _number(value: str) -> str:
+    """'489-F' / '489F' -> '489f'."""
+    return value.lower().replace("-", "")
+
+
+def _matches(text: str) -> List[Tuple[int, int, List[str]]]:
+    """(start, end, keys) for every reference in text; the first key is the most specific."""
+    out = []
+    for m in PLD_RE.finditer(text):
+        court = m.group(2).lower().rstrip(".").replace(".", "")
+        court = PLD_COURTS.get(court, court)
+        out.append((m.start(), m.end(), [f"pld {m.group(1)} {court} {int(m.group(3))}"]))
+    for m in SCMR_RE.finditer(text):
+        page = int(m.group(2))
+        keys = [f"scmr {m.group(1)} {page}", f"scmr {page}"] if m.group(1) else [f"scmr {page}"]
+        out.append((m.start(), m.end(), keys))
+    for m in SECTION_RE.finditer(text):
+        out.append((m.start(), m.end(), [f"section {_number(m.group(1))}"]))
+    for m in ARTICLE_RE.finditer(text):
+        out.append((m.start(), m.end(), [f"article {_number(m.group(1))}"]))
+    for m in ORDER_RULE_RE.finditer(text):
+        order = m.group(1)
+        order_no = int(order) if order.isdigit() else _roman_to_int(order)
+        if order_no:
+            out.append((m.start(), m.end(), [f"order {order_no} rule {_number(m.group(2))}"]))
+    return out
+
+
+def extract_references(text: str) -> Counter:
+    """Occurrences of every normalized reference key in a document."""
+    counts: Counter = Counter()
+    for _start, _end, keys in _matches(text or ""):
+        counts.update(keys)
+    return counts
+
+
+def query_references(query: str) -> Tuple[List[str], List[str]]:
+    """
+    (keys, residual tokens) for a query: the most specific key of each
+    reference, and the content words left once the references are removed.
+    """
+    query = query or ""
+    matches = sorted(_matches(query))
+    keys = list(dict.fromkeys(m[2][0] for m in matches))
+    residual, pos = [], 0
+    for start, end, _keys in matches:
+        if start >= pos:
+            residual.append(query[pos:start])
+        pos = max(pos, end)
+    residual.append(query[pos:])
+    return keys, tokenize(" ".join(residual))
+
+
+class ReferenceIndex:
+    """
+    Inverted index: reference key -> (rows, occurrence counts), numpy arrays
+    per key. Rows are positions in the ids passed to build().
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.build_seconds = 0.0
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self, ids: Sequence[str], documents: Sequence[str]) -> "ReferenceIndex":
+        started = time.perf_counter()
+        self.ids = [str(i) for i in ids]
+        rows: Dict[str, List[int]] = {}
+        counts: Dict[str, List[int]] = {}
+        for row, text in enumerate(documents):
+            for key, n in extract_references(text).items():
+                rows.setdefault(key, []).append(row)
+                counts.setdefault(key, []).append(n)
+        self.postings = {
+            key: (np.asarray(rows[key], dtype=np.int32), np.asarray(counts[key], dtype=np.int32))
+            for key in rows
+        }
+        self.build_seconds = time.perf_counter() - started
+        return self
+
+    def lookup(self, keys: Sequence[str], k: int = 20) -> List[Tuple[str, float]]:
+        """
+        Documents containing any of the keys, best first: most distinct keys
+        matched, then most occurrences. Scores are matched + occurrences / (1 + occurrences).
+        """
+        self.lookups += 1
+        found = [self.postings[key] for key in keys if key in self.postings]
+        if not found or k <= 0:
+            return []
+        rows = np.concatenate([r for r, _c in found])
+        occ = np.concatenate([c for _r, c in found]).astype(np.float64)
+        uniq, inverse = np.unique(rows, return_inverse=True)
+        matched = np.bincount(inverse, minlength=len(uniq)).astype(np.float64)
+        total = np.bincount(inverse, weights=occ, minlength=len(uniq))
+        scores = matched + total / (1.0 + total)
+        order = np.argsort(-scores, kind="stable")[:k]
+        self.hits += 1
+        return [(self.ids[int(uniq[j])], float(scores[j])) for j in order]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.ids),
+            "references": len(self.postings),
+            "postings": int(sum(len(r) for r, _c in self.postings.values())),
+            "build_seconds": round(self.build_seconds, 3),
+            "lookups": self.lookups,
+            "hits": self.hits,
+        }
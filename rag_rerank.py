@@ -0,0 +1,204 @@
+"""
+Keyword/phrase reranking for retrieved candidates.
+
+- TermMatcher: all KEYWORD_BOOST / PRIORITY_PHRASES counts for a document in
+  one pass over the lower-cased text (Aho-Corasick automaton, pyahocorasick
+  from requirements.txt; C-level str.count per term if it is missing)
+- rank_candidates: length penalty + (phrase, keyword, distance) ordering over
+  numpy arrays
+- document_features / stored_features: the same scores computed once at
+  ingest time and kept in metadata (rk_* fields), tagged with a version hash
+  of the term lists so a changed list falls back to scanning the text
+- KEYWORD_BOOST / PRIORITY_PHRASES / EXCERPT_CHAR_LIMIT and rerank_features:
+  the pipeline's term lists, here so ingest scripts need not import chroma_test
+
+Scores are identical to the original loop: kw is the total number of keyword
+substring occurrences, p_score the number of distinct phrases present.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+LENGTH_PENALTY_THRESHOLD = 8000
+
+KEYWORD_BOOST = ["notice", "demand", "breach", "contract", "claim", "payment", "overdue"]
+PRIORITY_PHRASES = [
+    "notice of demand", "legal notice", "demand notice", "final notice",
+    "specimen notice", "format of notice", "draft notice", "specimen",
+    "template", "form of notice", "notice to pay", "notice for payment"
+]
+
+EXCERPT_CHAR_LIMIT = 1200
+
+# Metadata fields written by document_features()
+FEATURE_FIELDS = ("rk_kw", "rk_phrase", "rk_len", "rk_excerpt", "rk_version")
+
+
+class TermMatcher:
+    """Compiled matcher for one (keywords, phrases) pair."""
+
+    def __init__(self, keywords: Sequence[str], phrases: Sequence[str], use_automaton: bool = True):
+        self.keywords = [k.lower() for k in keywords if k]
+        self.phrases = [p.lower() for p in phrases if p]
+        # Distinct terms; a term may be both a keyword and a phrase
+        self.terms: List[str] = list(dict.fromkeys(self.keywords + self.phrases))
+        index = {t: i for i, t in enumerate(self.terms)}
+        self._kw_idx = [index[k] for k in self.keywords]
+        self._phrase_idx = [index[p] for p in self.phrases]
+        self._lengths = [len(t) for t in self.terms]
+        self._automaton = None
+        if use_automaton and AHOCORASICK_AVAILABLE and self.terms:
+            automaton = ahocorasick.Automaton()
+            for i, term in enumerate(self.terms):
+                automaton.add_word(term, i)
+            automaton.make_automaton()
+            self._automaton = automaton
+
+    @property
+    def backend(self) -> str:
+        return "ahocorasick" if self._automaton is not None else "str.count"
+
+    def term_counts(self, text_lower: str) -> List[int]:
+        """Occurrences of every term in already lower-cased text."""
+        if self._automaton is None:
+            return [text_lower.count(t) for t in self.terms]
+        counts = [0] * len(self.terms)
+        free = [0] * len(self.terms)   # str.count semantics: a term's matches do not overlap
+        lengths = self._lengths
+        for end, i in self._automaton.iter(text_lower):
+            start = end - lengths[i] + 1
+            if start >= free[i]:
+                counts[i] += 1
+                free[i] = end + 1
+        return counts
+
+    def score(self, text: str) -> Tuple[int, int]:
+        """(keyword count, distinct phrase count) for one document."""
+        counts = self.term_counts((text or "").lower())
+        kw = sum(counts[i] for i in self._kw_idx)
+        p_score = sum(1 for i in self._phrase_idx if counts[i])
+        return kw, p_score
+
+    def score_many(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Keyword and phrase scores for a batch as int32 arrays."""
+        kw = np.zeros(len(texts), dtype=np.int32)
+        ph = np.zeros(len(texts), dtype=np.int32)
+        for j, text in enumerate(texts):
+            kw[j], ph[j] = self.score(text)
+        return kw, ph
+
+
+_matchers: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], TermMatcher] = {}
+
+
+def get_matcher(keywords: Sequence[str], phrases: Sequence[str]) -> TermMatcher:
+    """Matcher for this term list, built once and reused across queries."""
+    key = (tuple(keywords), tuple(phrases))
+    matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = TermMatcher(keywords, phrases)
+        _matchers[key] = matcher
+    return matcher
+
+
+_versions: Dict[Tuple[Tuple[str, ...], Tuple[str, ...], int], str] = {}
+
+
+def feature_version(keywords: Sequence[str], phrases: Sequence[str], excerpt_chars: int) -> str:
+    """Short hash of everything the stored features depend on."""
+    key = (tuple(keywords), tuple(phrases), int(excerpt_chars))
+    version = _versions.get(key)
+    if version is None:
+        payload = json.dumps([[k.lower() for k in keywords], [p.lower() for p in phrases], int(excerpt_chars)])
+        version = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+        _versions[key] = version
+    return version
+
+
+def make_excerpt(text: str, excerpt_chars: int) -> str:
+    """Evidence excerpt as shown in the prompt: first excerpt_chars, on one line."""
+    return (text or "")[:excerpt_chars].strip().replace("\n", " ")
+
+
+def document_features(text: str, keywords: Sequence[str], phrases: Sequence[str],
+                      excerpt_chars: int) -> Dict[str, Any]:
+    """Query-independent rerank features for one document, as metadata fields."""
+    kw, p_score = get_matcher(keywords, phrases).score(text)
+    return {
+        "rk_kw": int(kw),
+        "rk_phrase": int(p_score),
+        "rk_len": len(text or ""),
+        "rk_excerpt": make_excerpt(text, excerpt_chars),
+        "rk_version": feature_version(keywords, phrases, excerpt_chars),
+    }
+
+
+def rerank_features(text: str) -> Dict[str, Any]:
+    """rk_* metadata fields for one document with the pipeline's term lists."""
+    return document_features(text, KEYWORD_BOOST, PRIORITY_PHRASES, EXCERPT_CHAR_LIMIT)
+
+
+def has_features(meta: Optional[Dict[str, Any]], version: str) -> bool:
+    return bool(meta) and meta.get("rk_version") == version
+
+
+def stored_features(metas: Sequence[Optional[Dict[str, Any]]], version: str
+                    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (kw, p_score, lengths, present) read from metadata. Rows whose rk_version
+    differs (or is missing) have present=False and zero scores; rk_len does
+    not depend on the term lists, so it is used whenever it is there
+    (length -1 means unknown).
+    """
+    n = len(metas)
+    kw = np.zeros(n, dtype=np.int32)
+    ph = np.zeros(n, dtype=np.int32)
+    lengths = np.full(n, -1, dtype=np.int64)
+    present = np.zeros(n, dtype=bool)
+    for j, meta in enumerate(metas):
+        if not meta:
+            continue
+        if "rk_len" in meta:
+            lengths[j] = int(meta["rk_len"])
+        if meta.get("rk_version") == version:
+            kw[j] = int(meta.get("rk_kw", 0))
+            ph[j] = int(meta.get("rk_phrase", 0))
+            present[j] = lengths[j] >= 0
+    return kw, ph, lengths, present
+
+
+def rank_candidates(dists: np.ndarray, kw: np.ndarray, p_score: np.ndarray,
+                    lengths: np.ndarray,
+                    length_threshold: int = LENGTH_PENALTY_THRESHOLD,
+                    fused: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Apply the long-document penalty and sort by (-p_score, -kw, dist).
+    With `fused` (hybrid fusion scores, higher is better) the order is
+    (-p_score, fused): BM25 already ranks query-term matches, so the static
+    keyword boost is not applied on top; penalized documents go after
+    unpenalized ones. Returns (order, penalized distances); the sort is
+    stable like sorted().
+    """
+    dists = np.asarray(dists, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    penalize = (lengths > length_threshold) & (p_score == 0)
+    adjusted = np.where(
+        penalize,
+        dists + 1.0 + (lengths - length_threshold) / 20000.0,
+        dists,
+    )
+    if fused is None:
+        order = np.lexsort((adjusted, -kw.astype(np.int64), -p_score.astype(np.int64)))
+    else:
+        last_key = penalize.astype(np.float64) - np.asarray(fused, dtype=np.float64)
+        order = np.lexsort((last_key, -p_score.astype(np.int64)))
+    return order, adjusted
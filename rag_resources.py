@@ -0,0 +1,214 @@
+"""
+Background resource manager for the RAG pipeline.
+
+Heavy resources (embedding model, Chroma collection, Gemini client) are
+registered with a loader function and started in background threads instead
+of being created at import time. Callers block (or await) only on the
+resource they actually need. A loader that fails is retried on a later
+get()/wait()/start() once its backoff (doubling per failure) has elapsed.
+"""
+
+import asyncio
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class ResourceUnavailable(RuntimeError):
+    """Raised when a resource failed to load or did not become ready in time."""
+
+
+class _Resource:
+    def __init__(self, name: str, loader: Callable[[], Any], required: bool):
+        self.name = name
+        self.loader = loader
+        self.required = required
+        self.state = PENDING
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.load_seconds: Optional[float] = None
+        self.event = threading.Event()
+        self.failures = 0            # consecutive failed loads
+        self.retry_at = 0.0          # monotonic time after which a FAILED resource may reload
+        self.reload_pending = False  # reset() arrived while loading: rebuild once this load ends
+        self.async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+
+class ResourceManager:
+    """
+    Registry of lazily-initialized resources.
+
+    - register(name, loader): loader() returns the resource or raises
+    - start(): kick off every registered loader in a background thread
+    - get(name): block until the resource is ready (loads inline if never started)
+    - wait(name): asyncio-friendly version of get()
+
+    A failed resource stays FAILED for retry_base * 2**(failures - 1)
+    seconds (at most retry_max); the next start()/get()/wait() after that
+    loads it again.
+    """
+
+    def __init__(self, debug: bool = False, retry_base: float = 5.0, retry_max: float = 300.0):
+        self._resources: Dict[str, _Resource] = {}
+        self._lock = threading.Lock()
+        self.debug = debug
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+
+    def register(self, name: str, loader: Callable[[], Any], required: bool = True):
+        with self._lock:
+            self._resources[name] = _Resource(name, loader, required)
+
+    def _claim(self, name: str) -> Optional[_Resource]:
+        """
+        Move a resource from PENDING (or FAILED, once its backoff has elapsed)
+        to LOADING; returns it if this caller should load it.
+        """
+        with self._lock:
+            res = self._resources.get(name)
+            if res is None:
+                raise KeyError(f"Unknown resource: {name}")
+            if res.state == FAILED and time.monotonic() >= res.retry_at:
+                if self.debug:
+                    print(f"[RESOURCES] Retrying '{name}' (attempt {res.failures + 1})")
+                res.event.clear()
+            elif res.state != PENDING:
+                return None
+            res.state = LOADING
+            return res
+
+    def _load(self, res: _Resource):
+        started = time.perf_counter()
+        try:
+            value = res.loader()
+            res.value = value
+            res.error = None
+            res.failures = 0
+            res.state = READY
+        except BaseException as e:  # loaders may sys.exit() or raise anything
+            res.error = e
+            res.failures += 1
+            delay = min(self.retry_max, self.retry_base * (2 ** (res.failures - 1)))
+            res.retry_at = time.monotonic() + delay
+            res.state = FAILED
+            print(f"[RESOURCES] Failed to load '{res.name}': {e} (retry in {delay:.0f}s)")
+            if self.debug:
+                traceback.print_exc()
+        finally:
+            res.load_seconds = time.perf_counter() - started
+            with self._lock:
+                res.event.set()
+                waiters, res.async_waiters = res.async_waiters, []
+                reload = res.reload_pending and self._resources.get(res.name) is res
+                if reload:
+                    self._resources[res.name] = _Resource(res.name, res.loader, res.required)
+            for loop, event in waiters:
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    pass  # the waiting loop is already closed
+            if self.debug and res.state == READY:
+                print(f"[RESOURCES] '{res.name}' ready in {res.load_seconds:.2f}s")
+            if reload:
+                # The load that just finished may predate the change reset() was for
+                print(f"[RESOURCES] Reloading '{res.name}' (reset while it was loading)")
+                self.start([res.name])
+
+    def start(self, names: Optional[Iterable[str]] = None):
+        """Start loading resources in background daemon threads."""
+        for name in list(names or self._resources.keys()):
+            res = self._claim(name)
+            if res is None:
+                continue
+            t = threading.Thread(target=self._load, args=(res,), name=f"load-{name}", daemon=True)
+            t.start()
+
+    def get(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Return the resource, loading it inline if nobody started it yet."""
+        res = self._claim(name)
+        if res is not None:
+            self._load(res)
+        res = self._resources[name]
+        if not res.event.wait(timeout):
+            raise ResourceUnavailable(f"Resource '{name}' not ready after {timeout}s")
+        return self._value(res)
+
+    @staticmethod
+    def _value(res: _Resource) -> Any:
+        if res.state != READY:
+            raise ResourceUnavailable(f"Resource '{res.name}' failed to load: {res.error}")
+        return res.value
+
+    def peek(self, name: str) -> Any:
+        """Return the resource if it is already loaded, else None (never blocks)."""
+        res = self._resources.get(name)
+        if res is None or res.state != READY:
+            return None
+        return res.value
+
+    async def wait(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Await a resource without blocking the event loop (or parking a thread)."""
+        res = self._resources.get(name)
+        if res is None:
+            raise KeyError(f"Unknown resource: {name}")
+        if res.state == READY:
+            return res.value
+        self.start([name])   # no-op unless pending, or failed with the backoff elapsed
+        res = self._resources[name]
+        event = asyncio.Event()
+        with self._lock:
+            if res.event.is_set():
+                event.set()
+            else:
+                res.async_waiters.append((asyncio.get_running_loop(), event))
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise ResourceUnavailable(f"Resource '{name}' not ready after {timeout}s") from None
+        finally:
+            with self._lock:
+                res.async_waiters = [w for w in res.async_waiters if w[1] is not event]
+        return self._value(res)
+
+    def reset(self, name: str) -> bool:
+        """
+        Forget a loaded/failed resource so the next get() reloads it. A
+        resource that is still loading is reloaded in the background as soon
+        as the current load finishes; returns False in that case.
+        """
+        with self._lock:
+            res = self._resources[name]
+            if res.state == LOADING:
+                res.reload_pending = True
+                return False
+            self._resources[name] = _Resource(name, res.loader, res.required)
+            return True
+
+    def is_ready(self, names: Optional[Iterable[str]] = None) -> bool:
+        names = list(names) if names is not None else [
+            n for n, r in self._resources.items() if r.required
+        ]
+        return all(self._resources[n].state == READY for n in names)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for name, res in self._resources.items():
+            out[name] = {
+                "state": res.state,
+                "required": res.required,
+                "load_seconds": round(res.load_seconds, 3) if res.load_seconds is not None else None,
+                "error": str(res.error) if res.error else None,
+                "failures": res.failures,
+                "retry_in": (round(max(0.0, res.retry_at - time.monotonic()), 1)
+                             if res.state == FAILED else None),
+            }
+        return out
+
+    def names(self) -> List[str]:
+        return list(self._resources.keys())
@@ -0,0 +1,341 @@
+"""
+Topic-sharded Chroma collections.
+
+Documents are stored in one collection per `topic` metadata value
+("pakistan_law__contract_law", "pakistan_law__employment_law", ...;
+documents without a topic go to "pakistan_law__general"). ShardedCollection
+wraps the shards behind the subset of the Chroma collection API the
+pipeline uses (query / get / add / update / delete / count), so retrieval,
+two-phase fetches, backfills and rag_ingest.upload_chunks work unchanged:
+
+- query: a centroid router (mean embedding per shard) picks the `fanout`
+  closest shards per query embedding; the shards are queried concurrently
+  and their hits merged by distance
+- get / update / delete: sent to every shard concurrently (ids live in
+  exactly one shard)
+- add: each document goes to the shard of its topic, created on first use,
+  so ingesting one area never writes to the others
+- refresh: picks up shards another process created since open() and
+  re-samples every centroid (writes through this object update the router
+  as they happen, writes from other processes only on refresh)
+"""
+
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+SHARD_SEPARATOR = "__"
+DEFAULT_TOPIC = "general"
+RESULT_KEYS = ("ids", "embeddings", "documents", "metadatas", "distances")
+
+
+def _slug(topic: Any) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "_", str(topic or "").lower()).strip("_")
+    return slug or DEFAULT_TOPIC
+
+
+def shard_name(base: str, topic: Any) -> str:
+    """Collection name of a topic's shard: '<base>__<topic slug>'."""
+    return f"{base}{SHARD_SEPARATOR}{_slug(topic)}"
+
+
+def _collection_names(client) -> List[str]:
+    # chromadb < 0.6 returns Collection objects, later versions return names
+    return [getattr(c, "name", c) for c in client.list_collections()]
+
+
+def _unit(vectors) -> np.ndarray:
+    mat = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return mat / np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+
+
+class ShardRouter:
+    """
+    Routes query embeddings to the shards with the most similar centroids.
+
+    add() runs on writer threads while route() runs on query threads: the
+    centroid dicts are copied on write and swapped in under the lock, so a
+    query routes on one consistent set of centroids without locking.
+    """
+
+    def __init__(self, fanout: int = 2):
+        self.fanout = fanout
+        self._sums: Dict[str, np.ndarray] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.routed: Counter = Counter()
+
+    def add(self, topic: str, embeddings) -> None:
+        """Fold (a sample of) a shard's document embeddings into its centroid."""
+        if embeddings is None or len(embeddings) == 0:
+            return
+        vectors = _unit(embeddings)
+        with self._lock:
+            sums, counts = dict(self._sums), dict(self._counts)
+            sums[topic] = sums[topic] + vectors.sum(axis=0) if topic in sums else vectors.sum(axis=0)
+            counts[topic] = counts.get(topic, 0) + len(vectors)
+            self._sums, self._counts = sums, counts
+
+    def topics(self) -> List[str]:
+        return sorted(self._sums)
+
+    def route(self, query_embeddings: Sequence[Any]) -> List[List[str]]:
+        """Shard topics per query embedding, closest first."""
+        sums = self._sums
+        topics = sorted(sums)
+        if not topics:
+            return [[] for _ in query_embeddings]
+        if self.fanout <= 0 or self.fanout >= len(topics):
+            picked = [list(topics) for _ in query_embeddings]
+        else:
+            centroids = _unit([sums[t] for t in topics])
+            sims = _unit(query_embeddings) @ centroids.T
+            order = np.argsort(-sims, axis=1, kind="stable")[:, :self.fanout]
+            picked = [[topics[j] for j in row] for row in order.tolist()]
+        with self._lock:
+            for row in picked:
+                self.routed.update(row)
+        return picked
+
+    def routed_counts(self) -> Counter:
+        """Copy of the per-topic routing counter."""
+        with self._lock:
+            return Counter(self.routed)
+
+
+class ShardedCollection:
+    """Per-topic collections behind one collection-like object (see module docstring)."""
+
+    def __init__(self, client, base: str, shards: Dict[str, Any], fanout: int = 2,
+                 workers: int = 4, centroid_sample: int = 1000, metadata: Dict[str, Any] = None):
+        self.client = client
+        self._metadata = metadata
+        self.name = base
+        self.shards = dict(shards)
+        self.router = ShardRouter(fanout)
+        self.centroid_sample = centroid_sample
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="shard")
+        self.queries = 0
+        self.shard_queries = 0
+        self.refreshes = 0
+        self._sample_centroids(self.router, self.shards)
+
+    def _sample_centroids(self, router: ShardRouter, shards: Dict[str, Any]):
+        for topic, col in shards.items():
+            sample = col.get(limit=self.centroid_sample, include=["embeddings"])
+            router.add(topic, sample.get("embeddings"))
+
+    @classmethod
+    def open(cls, client, base: str, **kwargs) -> Optional["ShardedCollection"]:
+        """The existing shards of `base`, or None if it has not been sharded."""
+        prefix = base + SHARD_SEPARATOR
+        shards = {name[len(prefix):]: client.get_collection(name)
+                  for name in _collection_names(client) if name.startswith(prefix)}
+        return cls(client, base, shards, **kwargs) if shards else None
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Open shards created since open() (another process ingesting a new
+        topic, shard_collection.py) and rebuild the router from fresh
+        centroid samples. Queries keep using the old router until it is swapped in.
+        """
+        prefix = self.name + SHARD_SEPARATOR
+        names = [name for name in _collection_names(self.client) if name.startswith(prefix)]
+        added = 0
+        with self._lock:
+            shards = dict(self.shards)
+            for name in names:
+                topic = name[len(prefix):]
+                if topic not in shards:
+                    shards[topic] = self.client.get_collection(name)
+                    added += 1
+            self.shards = shards
+        router = ShardRouter(self.router.fanout)
+        self._sample_centroids(router, shards)
+        router.routed = self.router.routed_counts()
+        self.router = router
+        with self._lock:
+            self.refreshes += 1
+        return {"shards": len(shards), "new_shards": added}
+
+    def rebind(self, client):
+        """Same shards and router on a new client (reconnect after a dropped connection)."""
+        with self._lock:
+            self.shards = {topic: client.get_collection(shard_name(self.name, topic)) for topic in self.shards}
+            self.client = client
+
+    @property
+    def metadata(self):
+        # Every shard is created with the same settings (distance space)
+        if self._metadata:
+            return self._metadata
+        first = next(iter(self.shards.values()), None)
+        return getattr(first, "metadata", None)
+
+    def _shard(self, topic: str):
+        with self._lock:
+            col = self.shards.get(topic)
+            if col is None:
+                meta = self.metadata
+                col = self.client.get_or_create_collection(shard_name(self.name, topic),
+                                                           **({"metadata": meta} if meta else {}))
+                # Copy on write: readers iterate self.shards without the lock
+                self.shards = dict(self.shards, **{topic: col})
+            return col
+
+    def _map(self, fn: Callable[[str, Any], Any], topics: Sequence[str]) -> List[Any]:
+        """fn(topic, collection) for each topic, concurrently; results in topic order."""
+        if len(topics) == 1:
+            return [fn(topics[0], self.shards[topics[0]])]
+        return list(self._pool.map(lambda t: fn(t, self.shards[t]), topics))
+
+    # -- reads --------------------------------------------------------------
+
+    def count(self) -> int:
+        return sum(self._map(lambda _t, col: col.count(), list(self.shards)))
+
+    def query(self, query_embeddings, n_results: int = 10, include=None, where=None, **kwargs) -> Dict[str, Any]:
+        """Route each embedding, query the chosen shards concurrently, merge by distance."""
+        query_embeddings = list(query_embeddings)
+        include = list(include) if include is not None else ["metadatas", "documents", "distances"]
+        routes = self.router.route(query_embeddings)
+        by_topic: Dict[str, List[int]] = {}
+        for qi, topics in enumerate(routes):
+            for topic in topics:
+                by_topic.setdefault(topic, []).append(qi)
+        topics = list(by_topic)
+        extra = dict(kwargs, **({"where": where} if where else {}))
+        shard_include = include if "distances" in include else include + ["distances"]  # needed to merge
+        results = self._map(
+            lambda topic, col: col.query(query_embeddings=[query_embeddings[qi] for qi in by_topic[topic]],
+                                         n_results=n_results, include=shard_include, **extra),
+            topics) if topics else []
+        with self._lock:
+            self.queries += len(query_embeddings)
+            self.shard_queries += sum(len(qs) for qs in by_topic.values())
+
+        keys = [key for key in RESULT_KEYS if key == "ids" or key in include]
+        out: Dict[str, Any] = {key: [[] for _ in query_embeddings] if key in keys else None for key in RESULT_KEYS}
+        hits: List[List[Any]] = [[] for _ in query_embeddings]
+        for topic, res in zip(topics, results):
+            for j, qi in enumerate(by_topic[topic]):
+                for pos, dist in enumerate(res["distances"][j]):
+                    hits[qi].append((float(dist), res, j, pos))
+        for qi, found in enumerate(hits):
+            found.sort(key=lambda h: h[0])
+            for _dist, res, j, pos in found[:n_results]:
+                for key in keys:
+                    out[key][qi].append(res[key][j][pos])
+        return out
+
+    def get(self, ids=None, where=None, limit: int = None, offset: int = None, include=None, **kwargs) -> Dict[str, Any]:
+        """By ids: every shard concurrently. Paged (limit/offset): shards in topic order."""
+        include = list(include) if include is not None else ["metadatas", "documents"]
+        keys = ["ids"] + [key for key in RESULT_KEYS if key in include]
+        out: Dict[str, Any] = {key: [] if key in keys else None for key in RESULT_KEYS}
+        extra = dict(kwargs, **({"where": where} if where else {}))
+        topics = sorted(self.shards)
+        if ids is not None or (limit is None and not offset):
+            if ids is not None:
+                extra["ids"] = list(ids)
+            parts = self._map(lambda _t, col: col.get(include=include, **extra), topics)
+        else:
+            parts, skip, want = [], int(offset or 0), int(limit)
+            for topic in topics:
+                if want <= 0:
+                    break
+                col = self.shards[topic]
+                n = col.count() if not where else len(col.get(where=where, include=[])["ids"])
+                if skip >= n:
+                    skip -= n
+                    continue
+                part = col.get(include=include, limit=want, offset=skip, **extra)
+                got = len(part.get("ids") or [])
+                parts.append(part)
+                skip, want = 0, want - got
+        for part in parts:
+            for key in keys:
+                out[key].extend(part.get(key) or [])
+        if ids is not None:
+            # Chroma-like: results in the requested order
+            pos = {_id: i for i, _id in enumerate(out["ids"])}
+            order = [pos[_id] for _id in dict.fromkeys(ids) if _id in pos]
+            for key in keys:
+                out[key] = [out[key][i] for i in order]
+        return out
+
+    # -- writes -------------------------------------------------------------
+
+    def _write(self, method: str, ids, documents=None, metadatas=None, embeddings=None, **kwargs):
+        metadatas = list(metadatas) if metadatas is not None else [{}] * len(ids)
+        groups: Dict[str, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            groups.setdefault(_slug((meta or {}).get("topic")), []).append(i)
+        for topic, rows in groups.items():
+            pick = lambda values: [values[i] for i in rows] if values is not None else None
+            getattr(self._shard(topic), method)(ids=pick(list(ids)), documents=pick(documents),
+                                                metadatas=pick(metadatas), embeddings=pick(embeddings), **kwargs)
+            if embeddings is not None:
+                self.router.add(topic, pick(embeddings))
+
+    def add(self, ids, documents=None, metadatas=None, embeddings=None, **kwargs):
+        """Each document goes to the shard of its `topic` metadata."""
+        self._write("add", ids, documents, metadatas, embeddings, **kwargs)
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None, **kwargs):
+        self._write("upsert", ids, documents, metadatas, embeddings, **kwargs)
+
+    def _owners(self, ids) -> Dict[str, List[int]]:
+        topics = sorted(self.shards)
+        found = self._map(lambda _t, col: col.get(ids=list(ids), include=[])["ids"], topics)
+        row_of = {_id: i for i, _id in enumerate(ids)}
+        return {topic: [row_of[_id] for _id in got] for topic, got in zip(topics, found) if got}
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        for topic, rows in self._owners(ids).items():
+            pick = lambda values: [values[i] for i in rows] if values is not None else None
+            self.shards[topic].update(ids=pick(list(ids)), embeddings=pick(embeddings),
+                                      metadatas=pick(metadatas), documents=pick(documents), **kwargs)
+
+    def delete(self, ids=None, where=None, **kwargs):
+        self._map(lambda _t, col: col.delete(ids=ids, where=where, **kwargs), sorted(self.shards))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "shards": len(self.shards),
+                "fanout": self.router.fanout,
+                "queries": self.queries,
+                "avg_shards_per_query": round(self.shard_queries / self.queries, 3) if self.queries else None,
+                "routed": dict(self.router.routed_counts()),
+                "refreshes": self.refreshes,
+            }
+
+
+def split_collection(client, base: str, col, page_size: int = 500, fanout: int = 2) -> Dict[str, int]:
+    """
+    Copy every document of `col` (with its embedding) into the topic shards
+    of `base`; re-running upserts. Returns documents copied per topic.
+    The source collection is left untouched.
+    """
+    sharded = (ShardedCollection.open(client, base, fanout=fanout)
+               or ShardedCollection(client, base, {}, fanout=fanout, metadata=getattr(col, "metadata", None)))
+    copied: Counter = Counter()
+    offset = 0
+    while True:
+        page = col.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        ids = page.get("ids") or []
+        if ids:
+            metas = page.get("metadatas") or [{}] * len(ids)
+            sharded.upsert(ids=ids, documents=page.get("documents"), metadatas=metas,
+                           embeddings=page.get("embeddings"))
+            copied.update(_slug((m or {}).get("topic")) for m in metas)
+        offset += len(ids)
+        if len(ids) < page_size:
+            break
+    return dict(copied)
@@ -0,0 +1,52 @@
+"""
+Split the pakistan_law collection into per-topic shards
+("pakistan_law__contract_law", ...) by the `topic` metadata the upload
+scripts set. Embeddings are copied, nothing is re-encoded, and the source
+collection is left as it is. Re-running upserts, so it also picks up
+documents added to the source since the last split.
+
+Serve from the shards with RAG_SHARDS=1 (see RAG_SHARD_FANOUT).
+
+Usage: python shard_collection.py [--page-size N]
+"""
+import argparse
+import os
+
+import chromadb
+
+from chroma_test import ANSWER_CACHE_PATH, COLLECTION, DB_DIR, SHARD_FANOUT
+from rag_cache import SemanticAnswerCache
+from rag_shards import split_collection
+
+
+def connect():
+    api_key = os.environ.get("CHROMA_API_KEY")
+    tenant = os.environ.get("CHROMA_TENANT")
+    database = os.environ.get("CHROMA_DATABASE")
+    if api_key and tenant and database:
+        return chromadb.CloudClient(api_key=api_key, tenant=tenant, database=database)
+    return chromadb.PersistentClient(path=DB_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split the collection into topic shards")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"SHARDING '{COLLECTION}' BY TOPIC")
+    print("=" * 70)
+    client = connect()
+    copied = split_collection(client, COLLECTION, client.get_collection(COLLECTION),
+                              page_size=args.page_size, fanout=SHARD_FANOUT)
+    for topic, n in sorted(copied.items()):
+        print(f"  {COLLECTION}__{topic}: {n} documents")
+    print(f"✓ {sum(copied.values())} documents in {len(copied)} shards")
+    if ANSWER_CACHE_PATH:
+        # Shard copies may carry newer bodies than the previous split
+        SemanticAnswerCache(path=ANSWER_CACHE_PATH).invalidate()
+        print("✓ Semantic answer cache cleared")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Tests for the chat endpoints of backend_api with the retrieval and Gemini
+calls replaced by fakes (no model, Chroma or network needed).
+
+Run: python -m pytest -q test_rag_api.py
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+import backend_api
+from rag_resources import ResourceManager
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """backend_api with ready fake resources; records which thread ran each step."""
+    manager = ResourceManager()
+    for name in ("model", "collection", "gemini"):
+        manager.register(name, lambda: object())
+        manager.get(name)
+    monkeypatch.setattr(backend_api, "resources", manager)
+    monkeypatch.setattr(backend_api, "RETRIEVAL_RESOURCE", "collection")
+    calls = {"embed": [], "batch": [], "threads": {}, "is_reference": lambda query: False}
+
+    def embed_for_retrieval(queries):
+        calls["threads"]["embed"] = threading.current_thread().name
+        references = [{"shortcut": True} if calls["is_reference"](q) else None for q in queries]
+        calls["embed"].extend(q for q, found in zip(queries, references) if found is None)
+        return [None if found else [1.0, 0.0] for found in references], references
+
+    def retrieve_batch_from_embeddings(queries, q_embs, top_k=10, return_top=5, filters=None, references=None):
+        calls["batch"].append((list(queries), list(q_embs), references))
+        calls["threads"]["retrieve"] = threading.current_thread().name
+        time.sleep(calls.get("retrieve_delay", 0.0))
+        return [[{"id": f"doc-{q}", "text": f"evidence for {q}", "distance": 0.1, "metadata": {}}]
+                for q in queries]
+
+    async def call_gemini_chat_async(prompt, **kwargs):
+        return "answer"
+
+    for name, fn in {
+        "embed_for_retrieval": embed_for_retrieval,
+        "retrieve_batch_from_embeddings": retrieve_batch_from_embeddings,
+        "call_gemini_chat_async": call_gemini_chat_async,
+        "lookup_cached_answer": lambda *args, **kwargs: None,
+        "store_cached_answer": lambda *args, **kwargs: None,
+    }.items():
+        monkeypatch.setattr(backend_api, name, fn)
+    return calls
+
+
+def _post_many(payloads, path="/api/chat"):
+    async def run():
+        transport = httpx.ASGITransport(app=backend_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[client.post(path, json=p) for p in payloads])
+    return asyncio.run(run())
+
+
+def test_chat_runs_blocking_steps_on_the_worker_pools(api):
+    (response,) = _post_many([{"query": "bail in murder cases", "conversation_id": "t-pools"}])
+    assert response.status_code == 200
+    assert response.json()["answer"] == "answer"
+    assert api["threads"]["embed"].startswith("encode")
+    assert api["threads"]["retrieve"].startswith("retrieval")
+
+
+def test_slow_retrieval_does_not_serialize_requests(api):
+    api["retrieve_delay"] = 0.3
+    started = time.perf_counter()
+    responses = _post_many([{"query": f"query {i}", "conversation_id": f"t-par-{i}"} for i in range(4)])
+    elapsed = time.perf_counter() - started
+    assert [r.status_code for r in responses] == [200] * 4
+    assert elapsed < 4 * 0.3   # blocking retrievals overlap on the retrieval pool
+
+
+def test_unready_resource_returns_503(api, monkeypatch):
+    manager = ResourceManager(retry_base=60)
+    manager.register("model", lambda: 1 / 0)
+    manager.register("collection", lambda: object())
+    manager.register("gemini", lambda: object())
+    monkeypatch.setattr(backend_api, "resources", manager)
+    (response,) = _post_many([{"query": "anything"}])
+    assert response.status_code == 503
+
+
+def _events(body: str):
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+def test_stream_sends_retrieval_tokens_then_done(api, monkeypatch):
+    async def stream_gemini_chat_async(prompt, **kwargs):
+        for text in ("Section ", "302 ", "PPC"):
+            yield text
+    monkeypatch.setattr(backend_api, "stream_gemini_chat_async", stream_gemini_chat_async)
+    stored = []
+    monkeypatch.setattr(backend_api, "store_cached_answer", lambda q, ev, answer: stored.append(answer))
+
+    (response,) = _post_many([{"query": "punishment for murder", "conversation_id": "t-stream"}],
+                             path="/api/chat/stream")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _events(response.text)
+    assert [name for name, _ in events] == ["retrieval", "token", "token", "token", "done"]
+    assert events[0][1]["evidence_count"] == 1
+    assert "".join(data["text"] for name, data in events if name == "token") == "Section 302 PPC"
+    assert events[-1][1]["cached"] is False
+    assert stored == ["Section 302 PPC"]
+
+
+def test_stream_serves_cached_answer_as_one_token(api, monkeypatch):
+    monkeypatch.setattr(backend_api, "lookup_cached_answer", lambda q, ev: "cached answer")
+    (response,) = _post_many([{"query": "punishment for murder", "conversation_id": "t-stream"}],
+                             path="/api/chat/stream")
+    events = _events(response.text)
+    assert [name for name, _ in events] == ["retrieval", "token", "done"]
+    assert events[1][1]["text"] == "cached answer"
+    assert events[-1][1]["cached"] is True
+
+
+def test_batch_embeds_only_queries_that_need_dense_search(api):
+    api["is_reference"] = lambda query: query.startswith("PLD")
+    queries = ["PLD 2010 SC 123", "bail after arrest", "PLD 2015 Lahore 7", "khula procedure"]
+    (response,) = _post_many([{"queries": queries}], path="/api/chat/batch")
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["query"] for r in body["results"]] == queries
+    assert api["embed"] == ["bail after arrest", "khula procedure"]
+    ((sent_queries, sent_embs, references),) = api["batch"]
+    assert sent_queries == queries
+    assert [emb is None for emb in sent_embs] == [True, False, True, False]
+    assert [found is not None for found in references] == [True, False, True, False]   # looked up once
+    assert api["threads"]["embed"].startswith("encode")                               # not on the event loop
+
+
+def test_batch_of_only_citations_never_embeds(api):
+    api["is_reference"] = lambda query: True
+    (response,) = _post_many([{"queries": ["PLD 2010 SC 123", "2015 SCMR 1"]}], path="/api/chat/batch")
+    assert response.status_code == 200
+    assert api["embed"] == []
+    assert all(r["answer"] == "answer" for r in response.json()["results"])
+
+
+def test_prompt_cache_io_runs_on_the_retrieval_pool(api, monkeypatch, tmp_path):
+    import chroma_test as ct
+    from rag_cache import PromptCache
+
+    threads = []
+
+    class RecordingCache(PromptCache):
+        def get(self, *args):
+            threads.append(threading.current_thread().name)
+            return super().get(*args)
+
+        def put(self, *args):
+            threads.append(threading.current_thread().name)
+            return super().put(*args)
+
+    class Models:
+        async def generate_content(self, model, contents, config=None):
+            return type("Response", (), {"text": "generated"})()
+
+    client = type("Client", (), {})()
+    client.aio = type("Aio", (), {"models": Models()})()
+    monkeypatch.setattr(ct, "prompt_cache", RecordingCache(max_size=8, path=str(tmp_path / "prompts.sqlite3")))
+    monkeypatch.setattr(ct, "get_gemini_client", lambda: client)
+    monkeypatch.setattr(backend_api, "call_gemini_chat_async", ct.call_gemini_chat_async)
+
+    assert asyncio.run(backend_api.generate_answer_async("prompt")) == "generated"
+    assert asyncio.run(backend_api.generate_answer_async("prompt")) == "generated"   # cache hit
+    assert len(threads) == 3                                 # get, put, get
+    assert all(name.startswith("retrieval") for name in threads)
@@ -0,0 +1,183 @@
+"""
+Tests for the rag_cache caches (embedding LRU/TTL, semantic answer cache,
+prompt cache). No model or network: embeddings are small fixed vectors.
+
+Run: python -m pytest -q test_rag_cache.py
+"""
+
+import time
+
+import numpy as np
+
+from rag_cache import EmbeddingCache, LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1      # "b" is now the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_ttl_expires_entries():
+    cache = LRUCache(max_size=4, ttl_seconds=0.05)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_embedding_cache_encodes_only_misses_once():
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+    cache = EmbeddingCache(max_size=16)
+    first = cache.encode("m", ["Contract law", "contract   LAW ", "tort"], encode)
+    assert calls == [["Contract law", "tort"]]          # normalized duplicates share one encode
+    assert first[0] is first[1]
+    assert not first[0].flags.writeable
+    second = cache.encode("m", ["tort", "lease"], encode)
+    assert calls[-1] == ["lease"]
+    assert second[0] is first[2]
+    # Another model name never shares entries
+    cache.encode("other", ["tort"], encode)
+    assert calls[-1] == ["tort"]
+
+
+# ---------------------------
+# SemanticAnswerCache
+# ---------------------------
+from rag_cache import SemanticAnswerCache  # noqa: E402
+
+
+def _vec(*values):
+    return np.asarray(values, dtype=np.float32)
+
+
+def test_answer_cache_serves_near_duplicates_with_same_evidence():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store("what is bail", _vec(1, 0, 0), ["a", "b"], "answer")
+    assert cache.lookup(_vec(0.99, 0.05, 0), ["a", "b"]) == "answer"
+    assert cache.lookup(_vec(0.99, 0.05, 0), ["b", "a"]) is None      # evidence order matters
+    assert cache.lookup(_vec(0, 1, 0), ["a", "b"]) is None            # not similar enough
+
+
+def test_answer_cache_save_uses_private_temp_files(tmp_path):
+    path = str(tmp_path / "answers.json")
+    a = SemanticAnswerCache(path=path, save_interval=3600)
+    b = SemanticAnswerCache(path=path, save_interval=3600)
+    a.store("q1", _vec(1, 0), ["x"], "from a")
+    b.store("q2", _vec(0, 1), ["y"], "from b")
+    a.save()
+    b.save()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["answers.json"]   # no temp files left behind
+    assert SemanticAnswerCache(path=path).lookup(_vec(0, 1), ["y"]) == "from b"
+
+
+def test_invalidation_reaches_other_processes(tmp_path):
+    path = str(tmp_path / "answers.json")
+    api = SemanticAnswerCache(path=path, save_interval=3600, sync_interval=0)
+    api.store("q", _vec(1, 0), ["x"], "stale answer")
+    api.save()
+
+    # e.g. the uploader, after adding documents
+    uploader = SemanticAnswerCache(path=path)
+    uploader.invalidate()
+
+    assert api.lookup(_vec(1, 0), ["x"]) is None
+    assert api.stats()["remote_invalidations"] == 1
+    assert api.generation == uploader.generation
+    # The stale entries are not written back either
+    api.store("q2", _vec(0, 1), ["y"], "fresh answer")
+    api.save()
+    reloaded = SemanticAnswerCache(path=path)
+    assert reloaded.lookup(_vec(1, 0), ["x"]) is None
+    assert reloaded.lookup(_vec(0, 1), ["y"]) == "fresh answer"
+
+
+def test_stale_process_save_cannot_resurrect_invalidated_entries(tmp_path):
+    path = str(tmp_path / "answers.json")
+    worker = SemanticAnswerCache(path=path, save_interval=3600, sync_interval=3600)
+    worker.store("q", _vec(1, 0), ["x"], "stale answer")
+    SemanticAnswerCache(path=path).invalidate()
+    worker.save()     # checks the shared file first, even between syncs
+    assert SemanticAnswerCache(path=path).lookup(_vec(1, 0), ["x"]) is None
+
+
+def test_collection_stamp_change_clears_cache(tmp_path):
+    path = str(tmp_path / "answers.json")
+    cache = SemanticAnswerCache(path=path, save_interval=0)
+    cache.set_collection_stamp("pakistan_law:10")
+    cache.store("q", _vec(1, 0), ["x"], "answer")
+    reopened = SemanticAnswerCache(path=path)
+    reopened.set_collection_stamp("pakistan_law:10")
+    assert reopened.lookup(_vec(1, 0), ["x"]) == "answer"
+    reopened.set_collection_stamp("pakistan_law:12")
+    assert reopened.lookup(_vec(1, 0), ["x"]) is None
+    assert SemanticAnswerCache(path=path).collection_stamp == "pakistan_law:12"
+
+
+# ---------------------------
+# PromptCache
+# ---------------------------
+import rag_cache  # noqa: E402
+from rag_cache import PromptCache  # noqa: E402
+
+
+def test_prompt_cache_keys_on_every_generation_parameter():
+    cache = PromptCache(max_size=8)
+    cache.put("prompt", "gemini", 0.0, 2000, "response")
+    assert cache.get("prompt", "gemini", 0.0, 2000) == "response"
+    assert cache.get("prompt", "gemini", 0.0, 1000) is None
+    assert cache.get("prompt", "gemini", 0.5, 2000) is None
+    assert cache.get("prompt", "other", 0.0, 2000) is None
+    assert cache.get("prompt ", "gemini", 0.0, 2000) is None     # exact prompts only
+
+
+def test_prompt_cache_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "prompts.sqlite3")
+    PromptCache(max_size=8, path=path).put("prompt", "gemini", 0.0, 2000, "response")
+    reopened = PromptCache(max_size=8, path=path)
+    assert reopened.get("prompt", "gemini", 0.0, 2000) == "response"
+    assert reopened.stats()["disk"]["hits"] == 1
+    assert reopened.get("prompt", "gemini", 0.0, 2000) == "response"   # now from memory
+    assert reopened.stats()["disk"]["hits"] == 1
+    reopened.clear()
+    assert PromptCache(max_size=8, path=path).get("prompt", "gemini", 0.0, 2000) is None
+
+
+def test_prompt_cache_disk_tier_drops_expired_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / "prompts.sqlite3")
+    clock = [1000.0]
+    monkeypatch.setattr(rag_cache.time, "time", lambda: clock[0])
+    cache = PromptCache(max_size=8, ttl_seconds=60, path=path)
+    cache.put("old", "gemini", 0.0, 2000, "a")
+    cache.put("older", "gemini", 0.0, 2000, "b")
+    clock[0] += 61
+    reopened = PromptCache(max_size=8, ttl_seconds=60, path=path)    # empty memory tier
+    assert reopened.get("old", "gemini", 0.0, 2000) is None
+    assert reopened.stats()["disk"]["rows"] == 1                   # deleted on read
+    reopened.put("new", "gemini", 0.0, 2000, "c")
+    disk = reopened.stats()["disk"]
+    assert disk["rows"] == 1 and disk["expired"] == 2              # pruned on put
+
+
+def test_prompt_cache_disk_tier_is_capped(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rag_cache.time, "time", lambda: clock[0])
+    cache = PromptCache(max_size=2, path=str(tmp_path / "prompts.sqlite3"), max_disk_rows=3)
+    for i in range(5):
+        clock[0] += 1
+        cache.put(f"prompt {i}", "gemini", 0.0, 2000, f"response {i}")
+    reopened = PromptCache(max_size=2, path=cache.path, max_disk_rows=3)
+    assert [reopened.get(f"prompt {i}", "gemini", 0.0, 2000) for i in range(5)] == \
+        [None, None, "response 2", "response 3", "response 4"]
+    assert cache.stats()["disk"]["evicted"] == 2
@@ -0,0 +1,104 @@
+"""
+Tests for rag_chroma: HTTP session tuning and reconnects through
+ChromaClientManager, with fake clients / collections.
+
+Run: python -m pytest -q test_rag_chroma.py
+"""
+
+import pytest
+
+import rag_chroma
+from rag_chroma import ChromaClientManager, ManagedCollection, tune_http_session
+from rag_shards import ShardedCollection, split_collection
+
+
+class _FlakyCollection:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    def count(self):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        return 42
+
+
+def test_untunable_remote_client_warns(capsys):
+    assert tune_http_session(object()) is False
+    assert "[CHROMA] Warning: HTTP tuning skipped" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(not rag_chroma.REQUESTS_AVAILABLE, reason="requests not installed")
+def test_requests_session_gets_pool_and_timeout(monkeypatch):
+    import requests
+
+    class _Server:
+        _session = requests.Session()
+
+    class _Client:
+        _server = _Server()
+
+    seen = {}
+    monkeypatch.setattr(_Server._session, "request", lambda method, url, **kw: seen.update(kw))
+    assert tune_http_session(_Client(), pool_size=8, timeout=(1.0, 2.0)) is True
+    _Server._session.request("GET", "https://example.invalid")
+    assert seen["timeout"] == (1.0, 2.0)
+    assert _Server._session.get_adapter("https://x").poolmanager.connection_pool_kw["maxsize"] == 8
+
+
+def test_reconnect_rebuilds_only_the_handle():
+    opened, reopened = [], []
+    first, second = _FlakyCollection(failures=1), _FlakyCollection()
+
+    def connect():
+        opened.append(1)
+        return object(), first
+
+    def reconnect(previous):
+        reopened.append(previous)
+        return object(), second
+
+    manager = ChromaClientManager(connect, reconnect_fn=reconnect, probe_interval=0)
+    col = ManagedCollection(manager)
+    assert col.count() == 42                 # failed once, reconnected, retried
+    assert opened == [1] and reopened == [first]
+    stats = manager.stats()
+    assert (stats["connects"], stats["reconnects"], stats["errors"]) == (2, 1, 1)
+    assert stats["healthy"]
+
+
+def test_failed_reconnect_backs_off():
+    attempts = []
+
+    def reconnect(_previous):
+        attempts.append(1)
+        raise ConnectionError("still down")
+
+    manager = ChromaClientManager(lambda: (object(), _FlakyCollection(failures=10)), reconnect_fn=reconnect,
+                                  probe_interval=0, backoff_base=60.0)
+    col = ManagedCollection(manager)
+    with pytest.raises(ConnectionError):
+        col.count()
+    with pytest.raises(ConnectionError):
+        col.count()                           # within the backoff: no second attempt
+    assert len(attempts) == 1
+    assert not manager.stats()["healthy"]
+
+
+def test_reopen_keeps_shards_and_router(pipeline, monkeypatch):
+    ct = pipeline
+    monkeypatch.setattr(ct, "DB_DIR", ct.pipeline_client.get_settings().persist_directory)
+    monkeypatch.setattr(ct.answer_cache, "set_collection_stamp",
+                        lambda stamp: pytest.fail("reconnect must not restamp the answer cache"))
+    split_collection(ct.pipeline_client, ct.COLLECTION, ct.get_collection())
+    sharded = ShardedCollection.open(ct.pipeline_client, ct.COLLECTION, fanout=1)
+    router = sharded.router
+
+    client, col = ct._reopen_chroma(sharded)
+    assert col is sharded and col.router is router and col.client is client
+    assert col.count() == ct.get_collection().count()
+
+    _client, plain = ct._reopen_chroma(ct.get_collection())
+    assert plain.name == ct.COLLECTION and plain.count() == col.count()
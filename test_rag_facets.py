@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from rag_facets import FacetStore, normalize_filters, parse_filter_date, parse_judgment_date
+from rag_metadata import CaseMetadataIndex
+
+CASES = {
+    "a": {"court": "Lahore High Court", "judge": "Ali Baqar Najafi", "judgment_date": "March 3, 2015",
+          "pld": "PLD 2015 Lahore 123"},
+    "b": {"court": "Sindh High Court", "judgment_date": "12/06/2018", "scmr": "SCMR 456"},
+    "c": {"court": "Supreme Court of Pakistan", "pld": "PLD 2011 SC 77"},   # year from the citation only
+    "d": {},
+}
+
+
+@pytest.fixture
+def store():
+    ids = list(CASES)
+    return FacetStore().build(ids, [CASES[i] for i in ids])
+
+
+def test_date_parsing():
+    assert parse_judgment_date("March 3, 2015") == 20150303
+    assert parse_judgment_date("12/06/18") == 20180612     # day first
+    assert parse_judgment_date("someday") == 0
+    assert parse_filter_date("2015") == 20150101
+    assert parse_filter_date("2015-06", upper=True) == 20150631
+    with pytest.raises(ValueError):
+        parse_filter_date("June 2015")
+
+
+def test_filters_are_validated():
+    assert normalize_filters({"court": "", "judge": None}) == {}
+    with pytest.raises(ValueError):
+        normalize_filters({"bench": "full"})
+    with pytest.raises(ValueError):
+        normalize_filters({"citation": "ylr"})
+
+
+def test_mask(store):
+    assert store.matching_ids({"court": "high court"}) == ["a", "b"]
+    assert store.matching_ids({"court": "lahore", "judge": "najafi"}) == ["a"]
+    assert store.matching_ids({"citation": ["scmr"]}) == ["b"]
+    assert store.matching_ids({"citation": ["pld", "scmr"]}) == ["a", "b", "c"]
+    # exact dates where known, the citation year otherwise; undated rows never match a range
+    assert store.matching_ids({"date_from": "2011", "date_to": "2015-03"}) == ["a", "c"]
+    assert store.matching_ids({"date_from": "2015-03-04"}) == ["b"]
+    assert store.mask(None).all() and store.mask(None).dtype == np.bool_
+    assert store.values("court") == ["lahore high court", "sindh high court", "supreme court of pakistan"]
+
+
+def test_facet_filters_restrict_retrieval(pipeline, monkeypatch):
+    ct = pipeline
+    col = ct.get_collection()
+    texts = {
+        "lhc-1": "IN THE LAHORE HIGH COURT\nJudgment dated May 5, 2016\nbail granted to the accused in the murder trial",
+        "shc-1": "IN THE SINDH HIGH COURT\nJudgment dated May 5, 2012\nbail refused to the accused in the murder trial",
+    }
+    col.add(ids=list(texts), documents=list(texts.values()),
+            metadatas=[{"lang": "en", "topic": "criminal_law"}] * 2,
+            embeddings=[ct.embed_query(t).tolist() for t in texts.values()])
+    monkeypatch.setattr(ct, "case_metadata_index", CaseMetadataIndex())
+    ct.resources.register("facet_store", ct._build_facet_store)
+
+    query = "bail accused murder trial"
+    emb = ct.embed_query(query)
+    assert [e["id"] for e in ct.retrieve_from_embedding(query, emb, filters={"court": "lahore"})] == ["lhc-1"]
+    assert [e["id"] for e in ct.retrieve_from_embedding(query, emb, filters={"date_to": "2013"})] == ["shc-1"]
+    assert ct.retrieve_from_embedding(query, emb, filters={"court": "peshawar"}) == []
+    assert len(ct.retrieve_from_embedding(query, emb)) == ct.RETURN_TOP   # unfiltered
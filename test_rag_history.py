@@ -0,0 +1,154 @@
+"""
+Tests for rag_history: the SQLite conversation store used by the API and
+the CLI's snapshot + JSON-lines log, including compaction and recovery
+from a compaction interrupted at each step.
+
+Run: python -m pytest -q test_rag_history.py
+"""
+
+import json
+import os
+import threading
+
+import pytest
+
+from rag_history import HistoryStore, JsonlHistoryLog
+
+
+# ---------------------------
+# HistoryStore (SQLite, API)
+# ---------------------------
+def test_history_store_keeps_conversations_apart(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"))
+    ids = [store.append("a", "user", f"a{i}") for i in range(5)]
+    store.append("b", "user", "b0")
+    assert ids == sorted(ids)
+    assert [m["content"] for m in store.recent("a")] == [f"a{i}" for i in range(5)]
+    assert [m["content"] for m in store.recent("a", limit=2)] == ["a3", "a4"]
+    assert store.recent("a", limit=2)[-1]["message_id"] == f"msg_{ids[-1]}"
+    assert store.count("b") == 1 and store.count() == 6
+    assert sorted(store.conversations()) == ["a", "b"]
+    assert store.clear("a") == 5
+    assert store.recent("a") == [] and store.count() == 1
+
+
+def test_history_store_concurrent_writers(tmp_path):
+    path = str(tmp_path / "history.db")
+    stores = [HistoryStore(path) for _ in range(2)]   # e.g. two uvicorn workers
+    threads = [threading.Thread(target=lambda s=s, t=t: [s.append(f"c{t}", "user", str(i)) for i in range(50)])
+               for t, s in enumerate(stores * 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert HistoryStore(path).count() == 200
+
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    legacy = tmp_path / "chat_history.json"
+    legacy.write_text(json.dumps([_msg(0), _msg(1)]), encoding="utf-8")
+    store = HistoryStore(str(tmp_path / "history.db"))
+    assert store.migrate_from_json(str(legacy), "default") == 2
+    assert store.migrate_from_json(str(legacy), "default") == 0
+    assert [m["content"] for m in store.recent("default")] == ["message 0", "message 1"]
+
+
+# ---------------------------
+# JsonlHistoryLog (CLI)
+# ---------------------------
+def _msg(i):
+    return {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+
+
+@pytest.fixture
+def log(tmp_path):
+    hist = JsonlHistoryLog(str(tmp_path / "history.json"), str(tmp_path / "history.jsonl"),
+                           compact_bytes=10 ** 9, fsync_every=1)
+    yield hist
+    hist.close()
+
+
+def _contents(history):
+    return [m["content"] for m in history]
+
+
+def test_append_load_and_tail(log):
+    for i in range(5):
+        log.append(_msg(i))
+    assert _contents(log.load()) == [f"message {i}" for i in range(5)]
+    assert _contents(log.load(tail=2)) == ["message 3", "message 4"]
+    assert log.load(tail=0) == []
+
+
+def test_compaction_keeps_order_and_legacy_snapshot_format(log):
+    for i in range(3):
+        log.append(_msg(i))
+    log.compact()
+    for i in range(3, 5):
+        log.append(_msg(i))
+    assert not os.path.exists(log._pending_path)
+    with open(log.snapshot_path, encoding="utf-8") as f:
+        assert _contents(json.load(f)) == ["message 0", "message 1", "message 2"]
+    assert _contents(log.load()) == [f"message {i}" for i in range(5)]
+    assert _contents(log.load(tail=4)) == [f"message {i}" for i in range(1, 5)]
+
+
+def test_appends_during_compaction_are_not_lost(tmp_path):
+    log = JsonlHistoryLog(str(tmp_path / "h.json"), str(tmp_path / "h.jsonl"), compact_bytes=2000, fsync_every=4)
+    threads = [threading.Thread(target=lambda t=t: [log.append({"role": "user", "content": f"{t}-{i}"})
+                                                   for i in range(100)])
+               for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    log.close()
+    contents = _contents(log.load())
+    assert len(contents) == 400 and len(set(contents)) == 400
+    assert os.path.exists(log.snapshot_path)      # compactions did run
+
+
+def _crash_during_compaction(log, step):
+    """Leave the files as a compaction interrupted after `step` would."""
+    log._close()
+    os.replace(log.log_path, log._pending_path)                       # 1. rotate
+    if step == "rotated":
+        return
+    history = log._read_snapshot() + log._read_lines(log._pending_path, None)
+    with open(log._next_path, "w", encoding="utf-8") as f:            # 2. new snapshot
+        json.dump(history, f)
+    if step == "written":
+        return
+    os.remove(log._pending_path)                                      # 3. commit
+    assert step == "committed"
+
+
+@pytest.mark.parametrize("step", ["rotated", "written", "committed"])
+def test_interrupted_compaction_neither_loses_nor_duplicates(log, step):
+    for i in range(3):
+        log.append(_msg(i))
+    log.compact()
+    for i in range(3, 6):
+        log.append(_msg(i))
+    _crash_during_compaction(log, step)
+
+    expected = [f"message {i}" for i in range(6)]
+    assert _contents(log.load()) == expected
+    assert _contents(log.load(tail=4)) == expected[2:]
+    # Appending and compacting again recovers the files
+    log.append(_msg(6))
+    assert _contents(log.load()) == expected + ["message 6"]
+    log.compact()
+    assert _contents(log.load()) == expected + ["message 6"]
+    assert not os.path.exists(log._pending_path)
+    assert not os.path.exists(log._next_path)
+
+
+def test_rewrite_replaces_log_and_snapshot(log):
+    for i in range(4):
+        log.append(_msg(i))
+    log.rewrite([_msg(9)])
+    log.append(_msg(10))
+    assert _contents(log.load()) == ["message 9", "message 10"]
+    log.clear()
+    assert log.load() == []
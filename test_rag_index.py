@@ -0,0 +1,259 @@
+"""
+Tests for rag_index: snapshot storage dtypes, exact and HNSW search, and
+snapshot persistence. Vectors are random; the reference is a float64
+brute-force search.
+
+Run: python -m pytest -q test_rag_index.py
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from rag_index import (HNSWLIB_AVAILABLE, CollectionSnapshot, ExactIndex, LocalSearchEngine,
+                       ReadWriteLock, VectorStore, _normalize)
+
+
+def _data(n=600, dim=24, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    return [f"doc-{i}" for i in range(n)], vectors
+
+
+def _snapshot(dtype="float32", n=600, keep_exact=False, max_tail_rows=0):
+    ids, vectors = _data(n)
+    snap = CollectionSnapshot(space="cosine", dtype=dtype, keep_exact=keep_exact, max_tail_rows=max_tail_rows)
+    snap.add(ids, vectors, [{"i": i} for i in range(n)], [f"text {i}" for i in range(n)])
+    return snap, ids, vectors
+
+
+def _brute_force(vectors, queries, k):
+    v = _normalize(vectors).astype(np.float64)
+    q = _normalize(queries).astype(np.float64)
+    return np.argsort(-(q @ v.T), axis=1, kind="stable")[:, :k]
+
+
+# ---------------------------
+# Quantized storage (float16 / int8)
+# ---------------------------
+@pytest.mark.parametrize("dtype,tol", [("float32", 1e-5), ("float16", 2e-3), ("int8", 2e-2)])
+def test_scores_on_stored_dtype_match_float32(dtype, tol):
+    _ids, vectors = _data(5000)
+    unit = _normalize(vectors)
+    store = VectorStore(unit.shape[1], dtype, score_block_rows=512)
+    store.append(unit)
+    queries = _normalize(np.random.default_rng(1).standard_normal((7, unit.shape[1])).astype(np.float32))
+    assert np.allclose(store.scores(queries), queries @ unit.T, atol=tol)
+
+
+def test_scoring_is_thread_safe():
+    _ids, vectors = _data(3000)
+    unit = _normalize(vectors)
+    store = VectorStore(unit.shape[1], "int8", score_block_rows=256)
+    store.append(unit)
+    rng = np.random.default_rng(2)
+    queries = [_normalize(rng.standard_normal((3, unit.shape[1])).astype(np.float32)) for _ in range(8)]
+    expected = [store.scores(q) for q in queries]
+    results = [None] * len(queries)
+
+    def run(i):
+        for _ in range(20):
+            results[i] = store.scores(queries[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(queries))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for got, want in zip(results, expected):
+        assert np.array_equal(got, want)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_rescored_quantized_search_matches_exact(dtype):
+    snap, _ids, vectors = _snapshot(dtype, keep_exact=True)
+    queries = np.random.default_rng(3).standard_normal((5, vectors.shape[1])).astype(np.float32)
+    labels, _dist = ExactIndex(snap, rescore_factor=8).search(_normalize(queries), 10)
+    assert np.array_equal(labels, _brute_force(vectors, queries, 10))
+
+
+def test_exact_tail_is_capped_without_a_snapshot_file():
+    snap, _ids, vectors = _snapshot("int8", n=600, keep_exact=True, max_tail_rows=100)
+    stats = snap.vectors.stats()
+    assert stats["exact_tail_rows"] == 100
+    assert stats["exact_tail_evicted"] == 500
+    # Newest rows keep their exact vectors, older ones fall back to dequantized values
+    unit = _normalize(vectors)
+    assert np.array_equal(snap.vectors.exact(np.array([599])), unit[599:600])
+    assert np.allclose(snap.vectors.exact(np.array([0])), unit[0:1], atol=2e-2)
+
+
+def test_saving_flushes_the_exact_tail(tmp_path):
+    snap, _ids, vectors = _snapshot("int8", n=300, keep_exact=True)
+    assert snap.vectors.stats()["exact_tail_rows"] == 300
+    snap.save(str(tmp_path))
+    stats = snap.vectors.stats()
+    assert stats["exact_tail_rows"] == 0 and stats["exact_source"] == "mmap"
+    assert np.allclose(snap.vectors.exact(np.arange(300)), _normalize(vectors), atol=1e-6)
+
+
+# ---------------------------
+# HNSW mirror
+# ---------------------------
+@pytest.mark.skipif(not HNSWLIB_AVAILABLE, reason="hnswlib is not installed")
+def test_hnsw_engine_recall_and_incremental_updates():
+    snap, ids, vectors = _snapshot()
+    engine = LocalSearchEngine.build_hnsw(snap, M=16, ef_construction=200, ef=100)
+    queries = np.random.default_rng(4).standard_normal((20, vectors.shape[1])).astype(np.float32)
+    res = engine.query(queries, n_results=10)
+    expected = _brute_force(vectors, queries, 10)
+    recall = np.mean([len(set(got) & {ids[j] for j in want}) / 10.0
+                      for got, want in zip(res["ids"], expected)])
+    assert recall >= 0.9
+    assert res["metadatas"][0][0]["i"] == int(res["ids"][0][0].split("-")[1])
+
+    # upsert moves a document onto the query; delete removes it again
+    engine.upsert(["doc-5"], queries[:1], [{"i": 5}], ["moved"])
+    assert engine.query(queries[:1], n_results=1)["ids"] == [["doc-5"]]
+    engine.delete(["doc-5"])
+    assert "doc-5" not in engine.query(queries[:1], n_results=50)["ids"][0]
+    assert engine.count() == len(ids) - 1
+
+
+@pytest.mark.skipif(not HNSWLIB_AVAILABLE, reason="hnswlib is not installed")
+def test_hnsw_distances_use_the_collection_space():
+    ids, vectors = _data(50)
+    snap = CollectionSnapshot(space="l2")
+    snap.add(ids, vectors)
+    engine = LocalSearchEngine.build_hnsw(snap)
+    res = engine.query(vectors[:1], n_results=1, include=["distances"])
+    assert res["ids"] == [["doc-0"]]
+    assert res["distances"][0][0] == pytest.approx(0.0, abs=1e-4)   # squared L2 of unit vectors = 2 - 2cos
+    assert res["documents"] is None
+
+
+@pytest.mark.skipif(not HNSWLIB_AVAILABLE, reason="hnswlib is not installed")
+def test_hnsw_k_above_ef_without_touching_ef():
+    snap, ids, vectors = _snapshot()
+    engine = LocalSearchEngine.build_hnsw(snap, ef=8)
+    res = engine.query(vectors[:3], n_results=50)
+    assert [len(row) for row in res["ids"]] == [50, 50, 50]
+    assert [row[0] for row in res["ids"]] == ids[:3]
+    assert engine.index._index.ef == 8
+
+
+# ---------------------------
+# Concurrency
+# ---------------------------
+def test_read_write_lock():
+    lock = ReadWriteLock()
+    both_inside = threading.Barrier(2, timeout=5)
+
+    def reader():
+        with lock.read():
+            both_inside.wait()      # raises BrokenBarrierError unless readers overlap
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not both_inside.broken
+
+    order = []
+
+    def write():
+        with lock.write():
+            order.append("write")
+
+    with lock.read():
+        writer = threading.Thread(target=write)
+        writer.start()
+        writer.join(0.2)
+        assert order == []          # the writer waits for the reader
+    writer.join(5)
+    assert order == ["write"]
+
+
+def test_engine_queries_run_concurrently():
+    snap, _ids, vectors = _snapshot()
+    engine = LocalSearchEngine.build_exact(snap)
+    inner = engine.index.search
+    both_inside = threading.Barrier(2, timeout=5)
+
+    def search(queries, k):
+        both_inside.wait()
+        return inner(queries, k)
+
+    engine.index.search = search
+    errors = []
+
+    def query():
+        try:
+            engine.query(vectors[:1], n_results=3)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=query) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == [] and engine.stats()["queries"] == 2
+
+
+# ---------------------------
+# Exact backend and on-disk snapshot
+# ---------------------------
+class _FakeCollection:
+    """Just enough of a Chroma collection for from_collection() / refresh()."""
+
+    def __init__(self, ids, vectors):
+        self.metadata = {"hnsw:space": "cosine"}
+        self.rows = {i: (v.tolist(), {"i": n}, f"text {n}") for n, (i, v) in enumerate(zip(ids, vectors))}
+
+    def get(self, ids=None, limit=None, offset=0, include=()):
+        keys = list(self.rows) if ids is None else [i for i in ids if i in self.rows]
+        if limit is not None:
+            keys = keys[offset:offset + limit]
+        return {"ids": keys,
+                "embeddings": [self.rows[k][0] for k in keys],
+                "metadatas": [self.rows[k][1] for k in keys],
+                "documents": [self.rows[k][2] for k in keys]}
+
+
+def test_exact_engine_matches_brute_force_and_honours_tombstones():
+    snap, ids, vectors = _snapshot()
+    engine = LocalSearchEngine.build_exact(snap)
+    queries = np.random.default_rng(5).standard_normal((6, vectors.shape[1])).astype(np.float32)
+    expected = _brute_force(vectors, queries, 5)
+    assert engine.query(queries, n_results=5)["ids"] == [[ids[j] for j in row] for row in expected]
+    top = engine.query(queries[:1], n_results=1)["ids"][0][0]
+    engine.delete([top])
+    assert top not in engine.query(queries[:1], n_results=20)["ids"][0]
+    # ids= restricts the search to a candidate set
+    res = engine.query(queries[:1], n_results=3, ids=["doc-1", "doc-2", "doc-3", "missing"])
+    assert sorted(res["ids"][0]) == ["doc-1", "doc-2", "doc-3"]
+
+
+def test_snapshot_save_load_and_refresh(tmp_path):
+    ids, vectors = _data(400)
+    col = _FakeCollection(ids, vectors)
+    snap = CollectionSnapshot.from_collection(col, page_size=64)
+    assert len(snap) == 400 and snap.space == "cosine"
+    snap.delete(["doc-0"])
+    snap.save(str(tmp_path))
+    assert CollectionSnapshot.exists(str(tmp_path))
+
+    loaded = CollectionSnapshot.load(str(tmp_path), dtype="int8")
+    assert len(loaded) == 399 and "doc-0" not in loaded.row_of
+    assert loaded.metadatas[loaded.row_of["doc-7"]] == {"i": 7}
+    assert np.allclose(loaded.vectors.exact(np.array([loaded.row_of["doc-7"]])),
+                       _normalize(vectors[7:8]), atol=1e-6)
+
+    # refresh() pulls ids added to / removed from the remote collection
+    engine = LocalSearchEngine.build_exact(loaded, rescore_factor=4)
+    del col.rows["doc-9"]
+    col.rows["new"] = (vectors[3].tolist(), {"i": -1}, "new text")
+    assert engine.refresh(col, page_size=64) == {"added": 2, "removed": 1}   # doc-0 comes back too
+    assert "doc-9" not in engine.snapshot.row_of and "new" in engine.snapshot.row_of
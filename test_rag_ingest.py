@@ -0,0 +1,73 @@
+import chromadb
+
+from conftest import HashEncoder
+from rag_ingest import chunk_documents, chunk_id, chunk_text, upload_chunks
+
+JUDGMENT = (
+    "FACTS\n\n"
+    + "The petitioner filed a suit for recovery of the cheque amount. " * 12
+    + "\n\nSection 489-F\n\n"
+    + "The accused issued a cheque which was dishonoured on presentation. " * 12
+    + "\n\nHELD\n\n"
+    + "The appeal is dismissed and the conviction is maintained by this court. " * 12
+)
+
+
+def test_chunks_start_at_headings_and_overlap():
+    chunks = chunk_text(JUDGMENT, chunk_chars=900, overlap=100)
+    sections = [c["section"] for c in chunks]
+    assert sections[0] == "FACTS"
+    assert "Section 489-F" in sections and sections[-1] == "HELD"
+    for c in chunks:
+        assert len(JUDGMENT[c["char_start"]:c["char_end"]]) <= 900
+    for prev, cur in zip(chunks, chunks[1:]):
+        tail = cur["text"].split("\n", 1)[0]
+        assert tail and tail in JUDGMENT[prev["char_end"] - 100:prev["char_end"]]   # previous chunk's tail
+
+
+def test_over_long_paragraph_is_cut_at_sentence_ends():
+    text = "A sentence about bail and sureties. " * 100
+    chunks = chunk_text(text, chunk_chars=500, overlap=0)
+    assert len(chunks) > 1
+    assert all(c["char_end"] - c["char_start"] <= 500 for c in chunks)
+    assert all(c["text"].endswith(".") for c in chunks)
+    assert chunks[-1]["char_end"] == len(text)
+
+
+def test_chunk_documents_metadata():
+    chunks = chunk_documents([{"id": "pld-2020-1", "text": JUDGMENT, "metadata": {"court": "SC"}}],
+                             chunk_chars=900)
+    assert [c["id"] for c in chunks] == [chunk_id("pld-2020-1", i) for i in range(len(chunks))]
+    for i, c in enumerate(chunks):
+        meta = c["metadata"]
+        assert meta["court"] == "SC" and meta["parent_id"] == "pld-2020-1"
+        assert meta["chunk_index"] == i and meta["chunk_count"] == len(chunks)
+
+
+def test_upload_replaces_earlier_chunks_of_the_parent(tmp_path):
+    col = chromadb.PersistentClient(path=str(tmp_path)).create_collection("ingest")
+    encode = HashEncoder().encode
+    col.add(ids=["pld-2020-1"], documents=["legacy unchunked copy"], embeddings=encode(["legacy"]).tolist())
+
+    first = chunk_documents([{"id": "pld-2020-1", "text": JUDGMENT}], chunk_chars=400)
+    upload_chunks(col, first, encode, batch_size=3)
+    assert col.count() == len(first)
+
+    shorter = chunk_documents([{"id": "pld-2020-1", "text": JUDGMENT}], chunk_chars=2000)
+    written = upload_chunks(col, shorter, encode, feature_fn=lambda t: {"rk_len": len(t)})
+    assert written == col.count() == len(shorter) < len(first)
+    got = col.get(include=["metadatas", "documents"])
+    assert all(m["rk_len"] == len(d) for m, d in zip(got["metadatas"], got["documents"]))
+
+
+def test_parent_aggregation(pipeline):
+    ct = pipeline
+
+    def hit(id_, parent, index, dist):
+        return {"id": id_, "parent_id": parent, "dist": dist, "meta": {"chunk_index": index}}
+
+    ranked = [hit("a::c2", "a", 2, 0.1), hit("b::c0", "b", 0, 0.2), hit("a::c0", "a", 0, 0.3),
+              hit("a::c1", "a", 1, 0.4), hit("plain", "", 0, 0.5)]
+    out = ct.aggregate_by_parent(ranked, return_top=4, max_per_parent=2)
+    # a ranks by its best chunk, keeps two chunks in reading order; a's third chunk is skipped
+    assert [c["id"] for c in out] == ["a::c0", "a::c2", "b::c0", "plain"]
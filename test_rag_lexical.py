@@ -0,0 +1,77 @@
+"""
+Tests for rag_lexical: tokenization of legal references, BM25 scoring
+against a plain-Python reference implementation, and reciprocal rank
+fusion.
+
+Run: python -m pytest -q test_rag_lexical.py
+"""
+
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from rag_lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCS = [
+    "Section 489-F PPC: dishonestly issuing a cheque",
+    "The appellant was granted bail under section 497 CrPC",
+    "Khula is granted by the family court under the Muslim Family Laws Ordinance",
+    "Cheque dishonour and recovery suit under Order XXXVII CPC",
+    "The court held that bail is a rule and refusal an exception",
+]
+
+
+def test_tokenize_keeps_references_and_their_parts():
+    assert tokenize("Section 489-F of the PPC") == ["section", "489-f", "489", "f", "ppc"]
+    assert tokenize("Order XXXVII, 2015 SCMR 1/2") == ["order", "xxxvii", "2015", "scmr", "1/2", "1", "2"]
+
+
+def _reference_bm25(docs, query, k1=1.2, b=0.75):
+    tokenized = [Counter(tokenize(d)) for d in docs]
+    lengths = [sum(c.values()) for c in tokenized]
+    avg = sum(lengths) / len(lengths)
+    scores = [0.0] * len(docs)
+    for term in dict.fromkeys(tokenize(query)):
+        df = sum(1 for c in tokenized if term in c)
+        if not df:
+            continue
+        idf = math.log(1.0 + (len(docs) - df + 0.5) / (df + 0.5))
+        for row, counts in enumerate(tokenized):
+            tf = counts.get(term, 0)
+            if tf:
+                scores[row] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[row] / max(avg, 1.0)))
+    return scores
+
+
+def test_bm25_scores_match_reference_implementation():
+    rng = random.Random(0)
+    words = "bail cheque section 489-f court khula order appeal granted".split()
+    docs = DOCS + [" ".join(rng.choice(words) for _ in range(rng.randint(3, 30))) for _ in range(50)]
+    index = BM25Index().build([f"d{i}" for i in range(len(docs))], docs)
+    for query in ("bail granted", "489-F cheque", "khula court appeal", "nothing matches"):
+        expected = _reference_bm25(docs, query)
+        hits = index.search(query, k=len(docs))
+        assert len(hits) == sum(1 for s in expected if s > 0)
+        for row, score in hits:
+            assert score == pytest.approx(expected[row], rel=1e-5)
+        assert [s for _r, s in hits] == sorted((s for _r, s in hits), reverse=True)
+
+
+def test_bm25_top_k_and_unknown_terms():
+    index = BM25Index().build([f"d{i}" for i in range(len(DOCS))], DOCS)
+    hits = index.search("bail", k=1)
+    assert len(hits) == 1 and index.ids[hits[0][0]] in ("d1", "d4")
+    assert index.search("zzz unknown") == []
+    assert index.ids[index.search("489-F")[0][0]] == "d0"
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    scores = dict(fused)
+    assert [i for i, _ in fused] == ["a", "c", "b"]
+    assert scores["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert scores["b"] == pytest.approx(1 / 62)
+    weighted = reciprocal_rank_fusion([["a", "b"], ["b"]], k=60, weights=[1.0, 2.0])
+    assert weighted[0][0] == "b"
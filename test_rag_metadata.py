@@ -0,0 +1,66 @@
+import json
+
+import rag_metadata
+from rag_metadata import (CaseMetadataIndex, build_case_metadata, extract_case_metadata,
+                          group_by_parent)
+
+JUDGMENT = """IN THE LAHORE HIGH COURT
+Muhammad Aslam v. The State
+Before Mr. Justice Ali Baqar Najafi
+Judgment dated March 3, 2019
+Cited as PLD 2019 Lahore 123.
+The appellant was convicted under Section 302 and Section 34 of the Pakistan Penal Code.
+"""
+
+
+def test_extract_case_metadata_fields():
+    md = extract_case_metadata(JUDGMENT)
+    assert md["court"] == "LAHORE HIGH COURT"
+    assert md["pld"] == "PLD 2019 Lahore 123"
+    assert md["judgment_date"] == "March 3, 2019"
+    assert "Muhammad Aslam v. Th" in md["parties"]
+    assert md["clauses"] == "Section 302; Section 34"
+    assert extract_case_metadata("") == {}
+
+
+def test_process_pool_matches_inline():
+    texts = [JUDGMENT.replace("2019", str(2000 + i)) for i in range(40)]
+    assert build_case_metadata(texts, workers=2, chunksize=4) == [extract_case_metadata(t) for t in texts]
+
+
+def test_chunks_are_indexed_under_their_parent_in_order():
+    ids = ["p::c0001", "plain", "p::c0000"]
+    docs = ["second half", "standalone", "first half"]
+    metas = [{"parent_id": "p", "chunk_index": 1}, {}, {"parent_id": "p", "chunk_index": 0}]
+    assert dict(group_by_parent(ids, docs, metas)) == {"p": "first half\nsecond half", "plain": "standalone"}
+
+
+def test_index_round_trip_and_version_check(tmp_path, monkeypatch):
+    path = str(tmp_path / "case_metadata.json")
+    index = CaseMetadataIndex(path)
+    index.update({"a": {"court": "High Court"}, "b": {}})
+    assert index.retain(["a"]) == 1
+    index.save()
+
+    loaded = CaseMetadataIndex(path)
+    assert loaded.get("a") == {"court": "High Court"} and loaded.get("b") is None
+    assert (loaded.hits, loaded.misses) == (1, 1)
+
+    monkeypatch.setattr(rag_metadata, "EXTRACTOR_VERSION", "changed")
+    assert len(CaseMetadataIndex(path)) == 0      # built by other heuristics: ignored
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["documents"] == {"a": {"court": "High Court"}}
+
+
+def test_build_index_from_the_collection(pipeline, tmp_path, monkeypatch):
+    ct = pipeline
+    index = CaseMetadataIndex(str(tmp_path / "case_metadata.json"))
+    monkeypatch.setattr(ct, "case_metadata_index", index)
+    first = ct.build_case_metadata_index(workers=1)
+    assert first["cases"] == first["extracted"] == ct.get_collection().count()
+    again = ct.build_case_metadata_index(workers=1)
+    assert again["extracted"] == 0                # already indexed cases are skipped
+
+    evidence = {"id": "unknown", "text": JUDGMENT}
+    assert ct.case_metadata_for(evidence)["court"] == "LAHORE HIGH COURT"
+    assert "unknown" in index                     # extracted on the fly, kept in memory
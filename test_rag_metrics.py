@@ -0,0 +1,45 @@
+import pytest
+
+from rag_metrics import RetrievalStats
+
+
+def test_batch_is_one_sample_with_its_size():
+    stats = RetrievalStats()
+    stats.record_latency(0.010)
+    stats.record_latency(0.020)
+    stats.record_latency(0.400, batch_size=8)
+    out = stats.stats()
+    assert out["latency_ms"]["max"] == pytest.approx(20.0)   # the batch does not leak in
+    assert out["batch_latency_ms"]["calls"] == 1
+    assert out["batch_latency_ms"]["avg_batch_size"] == 8
+    assert out["batch_latency_ms"]["max"] == pytest.approx(400.0)
+
+
+def test_k_and_rounds_are_per_query():
+    stats = RetrievalStats()
+    stats.record(8, 1)
+    stats.record(16, 2)
+    out = stats.stats()
+    assert out["queries"] == 2
+    assert out["widened"] == 1
+    assert out["avg_rounds"] == 1.5
+    assert out["k_histogram"] == {"8": 1, "16": 1}
+    assert out["latency_ms"] is None and out["batch_latency_ms"] is None
+
+
+def test_pipeline_records_one_sample_per_call(pipeline, monkeypatch):
+    ct = pipeline
+    stats = RetrievalStats()
+    monkeypatch.setattr(ct, "retrieval_stats", stats)
+    monkeypatch.setattr(ct, "ADAPTIVE_K", True)
+    queries = ["bail accused murder trial", "khula divorce dower", "cheque payment recovery"]
+    results = ct.retrieve_batch_from_embeddings(queries, ct.embed_queries(queries), top_k=20, return_top=3)
+    ct.retrieve_from_embedding(queries[0], ct.embed_query(queries[0]), top_k=20, return_top=3)
+
+    assert all(results)
+    out = stats.stats()
+    assert out["queries"] == 4                       # k / rounds stay per query
+    assert out["batch_latency_ms"]["calls"] == 1
+    assert out["batch_latency_ms"]["avg_batch_size"] == 3
+    assert out["latency_ms"] is not None             # the single call
+    assert set(out["k_histogram"]) <= {"8", "16", "20"}
@@ -0,0 +1,98 @@
+"""
+Tests for rag_parallel: multi-process exact search against the in-process
+ExactIndex, growth of the shared blocks, and recovery from worker failures.
+Workers are spawned processes, so each test pays a short start-up.
+
+Run: python -m pytest -q test_rag_parallel.py
+"""
+
+import os
+import signal
+
+import numpy as np
+import pytest
+
+from rag_index import CollectionSnapshot, ExactIndex
+from rag_parallel import ParallelExactIndex
+
+
+def _snapshot(n=900, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    snap = CollectionSnapshot(space="cosine", dtype="float32")
+    snap.add([f"doc-{i}" for i in range(n)], vectors, [{}] * n, [""] * n)
+    return snap
+
+
+def _unit(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def index():
+    idx = ParallelExactIndex(_snapshot(), workers=2, min_rows=0)
+    yield idx
+    idx.close()
+
+
+def test_matches_in_process_search(index):
+    queries = _unit(np.random.default_rng(1).standard_normal((5, 16)))
+    want_labels, want_dists = ExactIndex(index.snapshot).search(queries, 10)
+    labels, dists = index.search(queries, 10)
+    np.testing.assert_array_equal(labels, want_labels)
+    np.testing.assert_allclose(dists, want_dists, atol=1e-5)
+    assert index.stats()["parallel_queries"] == 5
+
+
+def test_growth_and_deletes_reach_the_workers(index):
+    rng = np.random.default_rng(2)
+    start = len(index.snapshot.vectors)
+    extra = _unit(rng.standard_normal((index.capacity, 16)))
+    ids = [f"new-{i}" for i in range(len(extra))]
+    rows = index.snapshot.add(ids, extra, [{}] * len(ids), [""] * len(ids))
+    index.add(extra, np.asarray(rows))
+    assert index.grown == 1
+
+    labels, dists = index.search(extra[:3], 1)
+    np.testing.assert_array_equal(labels[:, 0], np.arange(start, start + 3))
+    np.testing.assert_allclose(dists[:, 0], 0.0, atol=1e-5)
+
+    index.snapshot.delete(["new-0"])
+    index.delete([start])
+    assert index.search(extra[:1], 1)[0][0, 0] != start
+
+
+def test_failed_query_leaves_no_stale_replies(index):
+    with pytest.raises(RuntimeError, match="Search worker failed"):
+        index.search(np.ones((2, 7), dtype=np.float32), 5)     # wrong dimension: every worker errors
+    queries = _unit(np.random.default_rng(3).standard_normal((3, 16)))
+    labels, _ = index.search(queries, 5)
+    np.testing.assert_array_equal(labels, ExactIndex(index.snapshot).search(queries, 5)[0])
+
+
+def test_dead_worker_is_respawned(index):
+    index._processes[0].kill()
+    index._processes[0].join()
+    queries = _unit(np.random.default_rng(4).standard_normal((3, 16)))
+    want = ExactIndex(index.snapshot).search(queries, 5)[0]
+    with pytest.raises(RuntimeError):
+        index.search(queries, 5)                   # worker 0's slice is lost for this query
+    assert index.stats()["respawned"] == 1
+    labels, _ = index.search(queries, 5)
+    np.testing.assert_array_equal(labels, want)
+    assert index.stats()["workers_alive"] == 2
+
+
+def test_hung_worker_times_out_and_is_replaced(index):
+    index.reply_timeout = 0.5
+    os.kill(index._processes[1].pid, signal.SIGSTOP)
+    queries = _unit(np.random.default_rng(5).standard_normal((3, 16)))
+    want = ExactIndex(index.snapshot).search(queries, 5)[0]
+    with pytest.raises(RuntimeError, match="no reply within"):
+        index.search(queries, 5)
+    stats = index.stats()
+    assert stats["timeouts"] == 1 and stats["respawned"] == 1
+    index.reply_timeout = 30            # the replacement still has to start up
+    labels, _ = index.search(queries, 5)
+    np.testing.assert_array_equal(labels, want)
@@ -0,0 +1,70 @@
+"""Retrieval pipeline behaviour over the shared `pipeline` fixture (conftest.py)."""
+
+from rag_cache import SemanticAnswerCache
+from rag_metrics import RetrievalStats
+
+
+def _ids(results):
+    return [[e.get("id") for e in hits] for hits in results]
+
+
+# ---------------------------
+# Two-phase retrieval (user-016)
+# ---------------------------
+def test_two_phase_matches_single_phase_and_fetches_fewer_bodies(pipeline, monkeypatch):
+    ct = pipeline
+    queries = ["bail accused murder trial", "khula divorce dower custody"]
+    embs = ct.embed_queries(queries)
+    baseline = ct.retrieve_batch_from_embeddings(queries, embs, top_k=20, return_top=3)
+
+    stats = RetrievalStats()
+    monkeypatch.setattr(ct, "retrieval_stats", stats)
+    monkeypatch.setattr(ct, "TWO_PHASE", True)
+    monkeypatch.setattr(ct, "TWO_PHASE_OVERFETCH", 2)
+    two_phase = ct.retrieve_batch_from_embeddings(queries, embs, top_k=20, return_top=3)
+
+    assert _ids(two_phase) == _ids(baseline)
+    assert all(e["text"] for hits in two_phase for e in hits)
+    out = stats.stats()
+    assert out["fetch_rounds"] == 1                     # one col.get for both queries
+    assert 0 < out["bodies_fetched"] <= 2 * 3 * 2        # return_top * overfetch per query, not top_k
+
+
+def test_two_phase_fetches_another_round_when_bodies_fail_the_length_filter(pipeline, monkeypatch):
+    ct = pipeline
+    col = ct.get_collection()
+    query = "bail accused murder trial"
+    emb = ct.embed_query(query)
+    first = col.query(query_embeddings=[emb.tolist()], n_results=6, include=["distances"])["ids"][0]
+    # The nearest bodies become too short to keep (their metadata gives no hint)
+    col.update(ids=first[:4], documents=["bail"] * 4, embeddings=[emb.tolist()] * 4)
+
+    stats = RetrievalStats()
+    monkeypatch.setattr(ct, "retrieval_stats", stats)
+    monkeypatch.setattr(ct, "TWO_PHASE", True)
+    monkeypatch.setattr(ct, "TWO_PHASE_OVERFETCH", 1)
+    hits = ct.retrieve_from_embedding(query, emb, top_k=20, return_top=3)
+
+    assert len(hits) == 3
+    assert not set(first[:4]) & {e["id"] for e in hits}
+    assert stats.stats()["fetch_rounds"] >= 2
+
+
+# ---------------------------
+# Semantic answer cache (user-005)
+# ---------------------------
+def test_answer_cache_misses_when_evidence_bodies_change(pipeline, monkeypatch):
+    ct = pipeline
+    monkeypatch.setattr(ct, "answer_cache", SemanticAnswerCache(threshold=0.9))
+    query = "bail accused murder trial"
+    evidences = ct.retrieve_from_embedding(query, ct.embed_query(query), top_k=10, return_top=3)
+    ct.store_cached_answer(query, evidences, "cached answer")
+    assert ct.lookup_cached_answer(query, evidences) == "cached answer"
+
+    # Same ids, re-ingested with a different body
+    edited = [dict(evidences[0], text=evidences[0]["text"] + " (amended)")] + evidences[1:]
+    assert ct.lookup_cached_answer(query, edited) is None
+
+    # refresh_local_index() is the "collection changed" hook
+    ct.refresh_local_index()
+    assert ct.lookup_cached_answer(query, evidences) is None
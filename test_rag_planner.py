@@ -0,0 +1,62 @@
+import chromadb
+
+from conftest import HashEncoder
+from rag_ingest import chunk_documents, upload_chunks
+from rag_planner import FilterStats
+
+
+def _english(lang):
+    return str(lang).lower().startswith("en") or lang in ("unknown", "")
+
+
+def test_plan_pushes_selective_predicates_only_when_every_document_has_the_field():
+    stats = FilterStats(50, _english).add(
+        [{"lang": "en", "rk_len": 500}] * 80 + [{"lang": "ur", "rk_len": 500}] * 10 + [{"lang": "en", "rk_len": 10}] * 10)
+    plan = stats.plan(min_drop=0.02)
+    assert plan["pushed"] == ["lang", "length"] and plan["post"] == []
+    assert plan["where"] == {"$and": [{"lang": {"$nin": ["ur"]}}, {"rk_len": {"$gte": 50}}]}
+    assert stats.fetch_k(20, plan) == 20
+
+    stats.add([{"lang": "en"}])                  # one document without rk_len
+    plan = stats.plan(min_drop=0.02)
+    assert plan["pushed"] == ["lang"] and plan["post"] == ["length"]
+    assert stats.fetch_k(20, plan) == 23         # 20 / (1 - 10/101), rounded up
+
+    assert FilterStats(50, _english).add([{"lang": "ur"}] + [{"lang": "en"}] * 99).plan(min_drop=0.02)["pushed"] == []
+
+
+def test_ingest_always_writes_the_pushed_fields(tmp_path):
+    col = chromadb.PersistentClient(path=str(tmp_path)).create_collection("ingest")
+    chunks = chunk_documents([{"id": "d1", "text": "A judgment on bail. " * 10}, {"id": "d2", "text": "x" * 30,
+                                                                                  "metadata": {"lang": "ur"}}])
+    upload_chunks(col, chunks, HashEncoder().encode)
+    got = col.get(include=["metadatas", "documents"])
+    by_id = dict(zip(got["ids"], got["metadatas"]))
+    assert by_id["d1::c0000"]["lang"] == "unknown" and by_id["d2::c0000"]["lang"] == "ur"
+    assert all(m["rk_len"] == len(d) for m, d in zip(got["metadatas"], got["documents"]))
+
+
+def test_plan_is_recollected_when_the_collection_grows(pipeline, monkeypatch):
+    ct = pipeline
+    col = ct.get_collection()
+    urdu = ["urdu-%d" % i for i in range(10)]
+    col.add(ids=urdu, documents=["bail accused murder trial " * 5] * 10, metadatas=[{"lang": "ur"}] * 10,
+            embeddings=[ct.embed_query("bail accused murder trial").tolist()] * 10)
+    ct.resources.register("filter_stats", ct._build_filter_stats)
+    ct.resources.get("filter_stats")
+    monkeypatch.setattr(ct, "FILTER_STATS_RECHECK", 0)
+
+    _stats, plan = ct.filter_plan()
+    assert plan["pushed"] == ["lang"]
+
+    # Written without lang (not through rag_ingest): a pushed lang filter would hide it
+    text = "bail accused murder trial bail accused murder trial in the sessions court"
+    col.add(ids=["legacy"], documents=[text], embeddings=[ct.embed_query(text).tolist()])
+    assert ct.filter_plan() == (None, None)      # stale: everything post-filtered meanwhile
+    hits = ct.retrieve_from_embedding(text, ct.embed_query(text), return_top=3)
+    assert hits[0]["id"] == "legacy"
+
+    stats = ct.resources.get("filter_stats")
+    assert len(stats) == col.count() and stats.missing_lang == 1
+    _stats, plan = ct.filter_plan()
+    assert plan["pushed"] == [] and plan["post"] == ["lang"]
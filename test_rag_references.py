@@ -0,0 +1,71 @@
+from rag_references import ReferenceIndex, extract_references, query_references
+
+
+def test_citation_forms_normalize_to_one_key():
+    text = ("Relied on PLD 2015 Lah. 123 and PLD 2015 Lahore 123; see 2004 SCMR 1234, "
+            "Section 489-F, Sec. 489F, Article 199 and O. 21 R. 37 (Order XXI Rule 37).")
+    refs = extract_references(text)
+    assert refs["pld 2015 lahore 123"] == 2
+    assert refs["scmr 2004 1234"] == 1 and refs["scmr 1234"] == 1
+    assert refs["section 489f"] == 2
+    assert refs["article 199"] == 1
+    assert refs["order 21 rule 37"] == 2
+
+
+def test_query_keys_and_residual_words():
+    keys, residual = query_references("bail under Section 497 per PLD 2019 SC 10")
+    assert keys == ["section 497", "pld 2019 sc 10"]
+    assert residual == ["bail", "under", "per"]
+    assert query_references("what is khula?")[0] == []
+
+
+def test_lookup_ranks_by_distinct_keys_then_occurrences():
+    index = ReferenceIndex().build(
+        ["a", "b", "c"],
+        ["Section 302 and Section 302 again",
+         "Section 302 read with Article 10-A",
+         "no references here"],
+    )
+    assert [i for i, _ in index.lookup(["section 302", "article 10a"])] == ["b", "a"]
+    assert [i for i, _ in index.lookup(["section 302"])] == ["a", "b"]
+    assert index.lookup(["article 199"]) == []
+    assert index.stats()["lookups"] == 3 and index.stats()["hits"] == 2
+
+
+def test_citation_only_query_skips_dense_search(pipeline, monkeypatch):
+    ct = pipeline
+    col = ct.get_collection()
+    text = "The High Court followed PLD 2015 Lahore 123 when granting bail to the accused in this case."
+    col.add(ids=["cited"], documents=[text], metadatas=[{"lang": "en", "topic": "criminal_law"}],
+            embeddings=[ct.embed_query(text).tolist()])
+    ct.resources.register("reference_index", ct._build_reference_index)
+    ct.resources.start(["reference_index"])
+    ct.resources.get("reference_index")
+
+    query = "PLD 2015 Lah. 123"
+    assert ct.is_reference_query(query)
+    monkeypatch.setattr(ct, "query_collection_batch",
+                        lambda *a, **k: (_ for _ in ()).throw(AssertionError("dense search ran")))
+    hits = ct.retrieve_batch_from_embeddings([query], [None], return_top=3)[0]
+    assert [e["id"] for e in hits] == ["cited"]
+
+
+def test_references_are_looked_up_once_per_query(pipeline, monkeypatch):
+    ct = pipeline
+    col = ct.get_collection()
+    text = "The High Court followed PLD 2015 Lahore 123 when granting bail to the accused in this case."
+    col.add(ids=["cited"], documents=[text], metadatas=[{"lang": "en", "topic": "criminal_law"}],
+            embeddings=[ct.embed_query(text).tolist()])
+    ct.resources.register("reference_index", ct._build_reference_index)
+    ct.resources.get("reference_index")
+
+    lookups = []
+    lookup = ct.lookup_references
+    monkeypatch.setattr(ct, "lookup_references", lambda q: lookups.append(q) or lookup(q))
+    queries = ["PLD 2015 Lah. 123", "bail accused murder trial"]
+    q_embs, references = ct.embed_for_retrieval(queries)
+    assert q_embs[0] is None and q_embs[1] is not None
+    assert references[0]["shortcut"] and references[1] is None
+    hits = ct.retrieve_batch_from_embeddings(queries, q_embs, return_top=3, references=references)
+    assert lookups == queries
+    assert [e["id"] for e in hits[0]] == ["cited"] and hits[1]
@@ -0,0 +1,106 @@
+"""
+Tests for rag_rerank: term counting (automaton vs str.count), candidate
+ranking, and the rerank features stored at ingest time.
+
+Run: python -m pytest -q test_rag_rerank.py
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from rag_rerank import (AHOCORASICK_AVAILABLE, TermMatcher, document_features, feature_version,
+                        rank_candidates, stored_features)
+
+KEYWORDS = ["notice", "demand", "breach", "contract", "claim", "payment", "overdue", "aa"]
+PHRASES = ["notice of demand", "legal notice", "demand notice", "notice", "aba", "breach of contract"]
+WORDS = ["notice", "of", "demand", "legal", "breach", "contract", "claimant", "aaa", "ababa",
+         "payment", "NOTICE", "the", "court", "overdue"]
+
+
+def _texts(n=200, seed=7):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 60))) for _ in range(n)]
+
+
+def test_str_count_backend_matches_str_count():
+    matcher = TermMatcher(KEYWORDS, PHRASES, use_automaton=False)
+    assert matcher.backend == "str.count"
+    for text in _texts():
+        lower = text.lower()
+        assert matcher.term_counts(lower) == [lower.count(t) for t in matcher.terms]
+
+
+@pytest.mark.skipif(not AHOCORASICK_AVAILABLE, reason="pyahocorasick is not installed")
+def test_automaton_counts_match_str_count():
+    automaton = TermMatcher(KEYWORDS, PHRASES)
+    fallback = TermMatcher(KEYWORDS, PHRASES, use_automaton=False)
+    assert automaton.backend == "ahocorasick"
+    texts = _texts() + ["aaaa", "abababa", "noticenotice", ""]
+    for text in texts:
+        lower = text.lower()
+        # Overlapping occurrences of one term ("aa" in "aaaa") count like str.count
+        assert automaton.term_counts(lower) == fallback.term_counts(lower), text
+        assert automaton.score(text) == fallback.score(text)
+    kw_a, ph_a = automaton.score_many(texts)
+    kw_f, ph_f = fallback.score_many(texts)
+    assert np.array_equal(kw_a, kw_f) and np.array_equal(ph_a, ph_f)
+
+
+def test_score_is_keyword_total_and_distinct_phrases():
+    matcher = TermMatcher(["notice", "demand"], ["legal notice", "notice of demand", "specimen"])
+    kw, phrases = matcher.score("Legal Notice: this NOTICE of demand is a legal notice")
+    assert kw == 3 + 1
+    assert phrases == 2
+
+
+def test_rank_candidates_orders_by_phrase_keyword_distance_with_length_penalty():
+    dists = np.array([0.5, 0.2, 0.3, 0.1])
+    kw = np.array([1, 1, 4, 0])
+    ph = np.array([0, 0, 0, 1])
+    lengths = np.array([100, 100, 100, 20000])
+    order, adjusted = rank_candidates(dists, kw, ph, lengths)
+    assert order.tolist() == [3, 2, 1, 0]
+    assert adjusted[3] == 0.1                       # has a phrase: no length penalty
+    lengths[1] = 12000
+    order, adjusted = rank_candidates(dists, kw, ph, lengths)
+    assert adjusted[1] == pytest.approx(0.2 + 1.0 + 4000 / 20000.0)
+    assert order.tolist() == [3, 2, 0, 1]
+
+
+def test_stored_features_round_trip_and_version_check():
+    text = "legal notice of demand " * 3
+    meta = document_features(text, KEYWORDS, PHRASES, excerpt_chars=20)
+    version = feature_version(KEYWORDS, PHRASES, 20)
+    assert meta["rk_version"] == version
+    assert len(meta["rk_excerpt"]) <= 20
+    kw, ph, lengths, present = stored_features([meta, {"rk_len": 5}, None], version)
+    assert (kw[0], ph[0]) == TermMatcher(KEYWORDS, PHRASES).score(text)
+    assert lengths.tolist() == [len(text), 5, -1]
+    assert present.tolist() == [True, False, False]
+    # A changed term list invalidates the stored scores but not the length
+    other = feature_version(KEYWORDS + ["claim"], PHRASES, 20)
+    kw, _ph, lengths, present = stored_features([meta], other)
+    assert not present[0] and kw[0] == 0 and lengths[0] == len(text)
+
+
+def test_ingest_features_do_not_need_chroma_test():
+    """The uploader ships in the API image, where chroma_test.py is excluded (.dockerignore)."""
+    import ast
+
+    with open("upload_documents_to_chroma.py", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    imported = {node.module for node in ast.walk(tree) if isinstance(node, ast.ImportFrom)}
+    imported |= {alias.name for node in ast.walk(tree) if isinstance(node, ast.Import) for alias in node.names}
+    assert "chroma_test" not in imported
+
+
+def test_rerank_features_match_the_query_time_version():
+    import chroma_test
+    from rag_rerank import has_features, rerank_features
+
+    meta = rerank_features("Legal notice of demand for the overdue payment under the contract.")
+    assert has_features(meta, chroma_test.RERANK_FEATURE_VERSION)
+    assert meta["rk_phrase"] == 2 and meta["rk_kw"] == 5
+    assert chroma_test.rerank_features is rerank_features
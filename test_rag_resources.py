@@ -0,0 +1,143 @@
+"""
+Tests for rag_resources.ResourceManager: background loading, retry of
+failed loaders after their backoff, and async waiting.
+
+Run: python -m pytest -q test_rag_resources.py
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from rag_resources import FAILED, READY, ResourceManager, ResourceUnavailable
+
+
+def _flaky(failures):
+    calls = {"n": 0}
+
+    def loader():
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise RuntimeError(f"boom {calls['n']}")
+        return "value"
+    return loader, calls
+
+
+def test_get_loads_inline_once():
+    loader, calls = _flaky(0)
+    rm = ResourceManager()
+    rm.register("r", loader)
+    assert rm.get("r") == "value"
+    assert rm.get("r") == "value"
+    assert calls["n"] == 1
+    assert rm.is_ready()
+
+
+def test_failed_loader_is_retried_after_backoff():
+    loader, calls = _flaky(1)
+    rm = ResourceManager(retry_base=0.05, retry_max=1.0)
+    rm.register("r", loader)
+    with pytest.raises(ResourceUnavailable):
+        rm.get("r")
+    # Within the backoff the failure is served without calling the loader
+    with pytest.raises(ResourceUnavailable):
+        rm.get("r")
+    assert calls["n"] == 1
+    assert rm.status()["r"]["state"] == FAILED
+    assert rm.status()["r"]["failures"] == 1
+    time.sleep(0.06)
+    assert rm.get("r") == "value"
+    assert calls["n"] == 2
+    assert rm.status()["r"]["state"] == READY
+    assert rm.status()["r"]["failures"] == 0
+
+
+def test_backoff_doubles_and_is_capped():
+    loader, _calls = _flaky(10)
+    rm = ResourceManager(retry_base=0.05, retry_max=0.1)
+    rm.register("r", loader)
+    delays = []
+    for _ in range(3):
+        with pytest.raises(ResourceUnavailable):
+            rm.get("r")
+        res = rm._resources["r"]
+        delays.append(res.retry_at - time.monotonic())
+        time.sleep(max(0.0, res.retry_at - time.monotonic()) + 0.01)
+    assert delays[0] < 0.06
+    assert 0.06 < delays[1] <= 0.1
+    assert delays[2] <= 0.1
+
+
+def test_wait_does_not_use_executor_threads():
+    release = threading.Event()
+    rm = ResourceManager()
+    rm.register("slow", lambda: release.wait(5) and "slow-value")
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        used = []
+        original = loop.run_in_executor
+
+        def spy(*args, **kwargs):
+            used.append(args)
+            return original(*args, **kwargs)
+        loop.run_in_executor = spy
+        waiters = [asyncio.create_task(rm.wait("slow", timeout=5)) for _ in range(20)]
+        await asyncio.sleep(0.05)
+        assert not any(t.done() for t in waiters)
+        release.set()
+        values = await asyncio.gather(*waiters)
+        return values, used
+
+    values, used = asyncio.run(main())
+    assert values == ["slow-value"] * 20
+    assert used == []
+    assert rm._resources["slow"].async_waiters == []
+
+
+def test_wait_timeout_and_retry():
+    loader, calls = _flaky(1)
+    rm = ResourceManager(retry_base=0.05)
+    rm.register("r", loader)
+    rm.register("never", lambda: threading.Event().wait(1))
+
+    async def main():
+        with pytest.raises(ResourceUnavailable):
+            await rm.wait("never", timeout=0.05)
+        with pytest.raises(ResourceUnavailable):
+            await rm.wait("r", timeout=1)
+        await asyncio.sleep(0.06)
+        return await rm.wait("r", timeout=1)
+
+    assert asyncio.run(main()) == "value"
+    assert calls["n"] == 2
+
+
+def test_reset_while_loading_reloads_after_the_current_load():
+    release = threading.Event()
+    calls = {"n": 0}
+
+    def loader():
+        calls["n"] += 1
+        n = calls["n"]
+        if n == 1:
+            release.wait(5)       # the first build is still running when reset() arrives
+        return f"build {n}"
+
+    rm = ResourceManager()
+    rm.register("r", loader)
+    rm.start(["r"])
+    while calls["n"] == 0:
+        time.sleep(0.001)
+    assert rm.reset("r") is False
+    rm.start(["r"])               # no-op while loading, as in refresh_local_index()
+    release.set()
+
+    deadline = time.monotonic() + 5
+    while rm.peek("r") != "build 2" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert rm.get("r") == "build 2"
+    assert calls["n"] == 2
+    assert rm.reset("r") is True
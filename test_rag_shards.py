@@ -0,0 +1,105 @@
+import threading
+
+import chromadb
+import numpy as np
+import pytest
+
+from conftest import HashEncoder, make_corpus
+from rag_shards import ShardedCollection, ShardRouter, shard_name, split_collection
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    """(client, plain collection, ShardedCollection split from it)."""
+    client = chromadb.PersistentClient(path=str(tmp_path))
+    encoder = HashEncoder()
+    ids, docs, metas = make_corpus(per_topic=15)
+    col = client.create_collection("law")
+    col.add(ids=ids, documents=docs, metadatas=metas, embeddings=encoder.encode(docs).tolist())
+    copied = split_collection(client, "law", col)
+    assert copied == {"criminal_law": 15, "family_law": 15, "contract_law": 15}
+    return client, col, ShardedCollection.open(client, "law", fanout=0)
+
+
+def test_scatter_gather_matches_the_single_collection(sharded):
+    _client, col, shards = sharded
+    queries = HashEncoder().encode(["bail murder trial", "khula dower", "cheque breach damages"]).tolist()
+    want = col.query(query_embeddings=queries, n_results=10, include=["distances"])
+    got = shards.query(query_embeddings=queries, n_results=10, include=["distances"])
+    # same hits by distance (near-ties may swap places)
+    np.testing.assert_allclose(got["distances"], want["distances"], rtol=1e-5, atol=1e-6)
+    assert [set(row) for row in got["ids"]] == [set(row) for row in want["ids"]]
+    assert shards.count() == col.count()
+    assert shards.stats()["avg_shards_per_query"] == 3
+
+
+def test_router_sends_queries_to_the_closest_shards(sharded):
+    client, _col, _shards = sharded
+    routed = ShardedCollection.open(client, "law", fanout=1)
+    q = HashEncoder().encode(["khula divorce dower custody nikah"]).tolist()
+    assert routed.router.route(q) == [["family_law"]]
+    hits = routed.query(query_embeddings=q, n_results=5, include=["metadatas"])
+    assert {m["topic"] for m in hits["metadatas"][0]} == {"family_law"}
+
+
+def test_refresh_picks_up_shards_written_by_another_process(sharded):
+    client, _col, _shards = sharded
+    reader = ShardedCollection.open(client, "law", fanout=1)
+    writer = ShardedCollection.open(client, "law", fanout=1)
+    text = "tax income assessment appeal commissioner revenue"
+    writer.add(ids=["tax-1"], documents=[text], metadatas=[{"topic": "tax_law"}],
+               embeddings=HashEncoder().encode([text]).tolist())
+    assert shard_name("law", "tax_law") in [c.name for c in client.list_collections()]
+
+    q = HashEncoder().encode([text]).tolist()
+    assert "tax-1" not in reader.query(query_embeddings=q, n_results=3, include=[])["ids"][0]
+    assert reader.refresh() == {"shards": 4, "new_shards": 1}
+    assert reader.query(query_embeddings=q, n_results=3, include=[])["ids"][0][0] == "tax-1"
+
+
+def test_api_refresh_reopens_shards(pipeline, monkeypatch):
+    ct = pipeline
+    split_collection(ct.pipeline_client, ct.COLLECTION, ct.get_collection())
+    serving = ShardedCollection.open(ct.pipeline_client, ct.COLLECTION, fanout=1)
+    ct.resources.register("collection", lambda: serving)
+    monkeypatch.setattr(ct, "SHARDS", True)
+
+    # Another process ingests a new topic
+    writer = ShardedCollection.open(ct.pipeline_client, ct.COLLECTION, fanout=1)
+    text = "income tax assessment appeal before the commissioner of inland revenue was allowed"
+    writer.add(ids=["tax-1"], documents=[text], metadatas=[{"topic": "tax_law", "lang": "en"}],
+               embeddings=[ct.embed_query(text).tolist()])
+
+    assert "tax-1" not in [e["id"] for e in ct.retrieve_from_embedding(text, ct.embed_query(text))]
+    changes = ct.refresh_local_index()
+    assert changes["new_shards"] == 1
+    assert ct.retrieve_from_embedding(text, ct.embed_query(text))[0]["id"] == "tax-1"
+
+
+def test_router_tolerates_writes_during_routing():
+    router = ShardRouter(fanout=2)
+    rng = np.random.default_rng(0)
+    router.add("seed_a", rng.standard_normal((4, 8)))
+    router.add("seed_b", rng.standard_normal((4, 8)))
+    queries = rng.standard_normal((16, 8))
+    errors, done = [], threading.Event()
+
+    def route():
+        while not done.is_set():
+            try:
+                assert all(len(row) == 2 for row in router.route(queries))
+            except Exception as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=route) for _ in range(3)]
+    for t in readers:
+        t.start()
+    for i in range(2000):      # new topics appear while queries are routed
+        router.add(f"topic_{i % 400}", rng.standard_normal((2, 8)))
+    done.set()
+    for t in readers:
+        t.join()
+    assert errors == []
+    assert len(router.topics()) == 402
+    assert sum(router.routed_counts().values()) > 0
@@ -6,6 +6,17 @@ import os
 import chromadb
 from sentence_transformers import SentenceTransformer
 
+from rag_cache import SemanticAnswerCache
+from rag_ingest import chunk_documents, upload_chunks
+from rag_rerank import rerank_features
+from rag_shards import ShardedCollection
+
+# Must match chroma_test.MODEL_NAME, otherwise query and document vectors live in different spaces
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Same switch as chroma_test.SHARDS; read here directly since chroma_test is not in the image
+SHARDS = os.environ.get("RAG_SHARDS", "0").strip().lower() in ("1", "true", "yes")
+
 print("=" * 70)
 print("UPLOADING DOCUMENTS TO CHROMA CLOUD")
 print("=" * 70)
@@ -33,12 +44,17 @@ try:
     print("   ✓ Connected")
     
     print("\n2. Creating/getting collection...")
-    col = client.get_or_create_collection(name="pakistan_law")
-    print("   ✓ Collection 'pakistan_law' ready")
+    if SHARDS:
+        # Sharded layout: each document is written to its topic's collection only
+        col = ShardedCollection.open(client, "pakistan_law") or ShardedCollection(client, "pakistan_law", {})
+        print(f"   ✓ Topic shards of 'pakistan_law' ready ({len(col.shards)} existing)")
+    else:
+        col = client.get_or_create_collection(name="pakistan_law")
+        print("   ✓ Collection 'pakistan_law' ready")
     
     print("\n3. Loading embedding model...")
-    model = SentenceTransformer("all-mpnet-base-v2")
-    print("   ✓ Model loaded")
+    model = SentenceTransformer(MODEL_NAME)
+    print(f"   ✓ Model loaded: {MODEL_NAME}")
     
     # Sample Pakistani legal documents
     documents = [
@@ -322,28 +338,22 @@ try:
     
     print(f"\n4. Uploading {len(documents)} documents...")
     
-    # Generate embeddings and add documents
-    ids = []
-    texts = []
-    metadatas = []
-    
-    for doc in documents:
-        ids.append(doc["id"])
-        texts.append(doc["text"])
-        metadatas.append(doc["metadata"])
-    
-    # Generate embeddings
-    embeddings = model.encode(texts, convert_to_numpy=True).tolist()
-    
-    # Add to collection
-    col.add(
-        ids=ids,
-        documents=texts,
-        metadatas=metadatas,
-        embeddings=embeddings
+    # Split into section-aware chunks (metadata carries parent_id and rerank features) and upload
+    chunks = chunk_documents(documents)
+    written = upload_chunks(
+        col, chunks,
+        lambda texts: model.encode(texts, convert_to_numpy=True),
+        feature_fn=rerank_features
     )
     
-    print(f"   ✓ Uploaded {len(documents)} documents")
+    print(f"   ✓ Uploaded {len(documents)} documents as {written} chunks")
+    
+    # Cached answers may cite documents that just changed; bumping the file's
+    # generation makes running API processes drop their copies too
+    answer_cache_path = os.environ.get("ANSWER_CACHE_PATH", "answer_cache.json")
+    if answer_cache_path:
+        SemanticAnswerCache(path=answer_cache_path).invalidate()
+        print("   ✓ Semantic answer cache cleared")
     
     # Verify
     count = col.count()
@@ -1,9 +1,13 @@
 """
 Upload local ChromaDB data to Chroma Cloud
 """
+import os
+
 import chromadb
 from tqdm import tqdm
 
+from rag_cache import SemanticAnswerCache
+
 print("=" * 60)
 print("ChromaDB to Chroma Cloud Migration")
 print("=" * 60)
@@ -108,6 +112,12 @@ except Exception as e:
     print(f"   Uploaded {uploaded}/{total} documents before error")
     exit(1)
 
+# Cached answers may quote the documents just re-uploaded
+answer_cache_path = os.environ.get("ANSWER_CACHE_PATH", "answer_cache.json")
+if answer_cache_path:
+    SemanticAnswerCache(path=answer_cache_path).invalidate()
+    print("   ✓ Semantic answer cache cleared")
+
 print("\n" + "=" * 60)
 print("Migration Complete!")
 print("=" * 60)